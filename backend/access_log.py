@@ -0,0 +1,394 @@
+# Append-only download log stored in rotating JSONL segments
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from executors import run_io
+from storage import FileLock, write_json_atomic, JOURNAL_FSYNC
+
+logger = logging.getLogger(__name__)
+
+# Start a new segment once the current one reaches this size
+LOG_SEGMENT_MAX_BYTES = int(os.environ.get('LOG_SEGMENT_MAX_BYTES', str(4 * 1024 * 1024)))
+# Queued log entries are written at most this long after the first one arrives...
+LOG_FLUSH_INTERVAL_MS = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', '250'))
+# ...or as soon as this many are waiting
+LOG_FLUSH_BATCH = int(os.environ.get('LOG_FLUSH_BATCH', '100'))
+# Raw entries older than this many days are folded into daily rollups (0 keeps everything)
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', '90'))
+
+
+# Access counters kept per entry field: counter name -> log entry field
+COUNTER_FIELDS = {"by_parcelle": "parcelle_id", "by_client": "client_name", "by_code": "code"}
+
+
+def new_counters() -> dict:
+    """Empty access counters (per segment and per rolled-up day)"""
+    return {"count": 0, **{name: {} for name in COUNTER_FIELDS}}
+
+
+def count_entry(counters: dict, entry: dict):
+    """Add one log entry to access counters"""
+    counters["count"] += 1
+    for name, field in COUNTER_FIELDS.items():
+        # Rollups made before a counter existed lack it
+        counter = counters.setdefault(name, {})
+        key = entry.get(field, "Unknown")
+        counter[key] = counter.get(key, 0) + 1
+
+
+def merge_counters(target: dict, counters: dict):
+    """Add access counters into `target`"""
+    target["count"] += counters["count"]
+    for name in COUNTER_FIELDS:
+        for key, count in counters.get(name, {}).items():
+            target[name][key] = target[name].get(key, 0) + count
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    """Parse an ISO log timestamp, None if missing or malformed"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+class AccessLog:
+    """Download/access log kept outside the main data document.
+
+    Entries are appended to `download-<day>-<n>.jsonl` segments in `directory`;
+    a new segment starts every day and whenever the current one exceeds
+    `max_segment_bytes`. `index.json` is the time index: for each segment its
+    first/last timestamp and access counters (the active, last segment is
+    tailed instead). Recent-first reads walk segments from the newest and stop
+    as soon as they have enough entries, so they never touch old segments.
+
+    `expire` folds whole segments older than the retention window into
+    per-day rollup counters kept in the index and deletes them; `stats` adds
+    up rollups and segment counters without reading any entry.
+
+    Worker processes append under a flock on `.lock`, like the journal of
+    JsonJournalStorage; readers only tail what changed since they last looked.
+    """
+
+    def __init__(self, directory: Path, max_segment_bytes: int = LOG_SEGMENT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.index_path = self.directory / "index.json"
+        self.max_segment_bytes = max_segment_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file_lock = FileLock(self.directory / ".lock")
+        self._segments = []
+        self._rollups = {}
+        self._index_stat = None
+        self._active_offset = 0
+
+    # ---------- index ----------
+
+    def _stat_index(self):
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, truncate_torn: bool = False):
+        """Pick up segments and entries written by other processes"""
+        with self._file_lock.lock:
+            stat = self._stat_index()
+            if stat != self._index_stat:
+                self._index_stat = stat
+                try:
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        index = json.load(f)
+                except FileNotFoundError:
+                    index = {"segments": []}
+                self._segments = index["segments"]
+                self._rollups = index.get("rollups", {})
+                self._active_offset = 0
+                for segment in self._segments[:-1]:
+                    if any(name not in segment for name in COUNTER_FIELDS):
+                        # Indexed before segments carried (all their) counters
+                        segment.update(new_counters())
+                        for entry in self._read_segment(segment):
+                            count_entry(segment, entry)
+                if self._segments:
+                    self._segments[-1].update(first=None, last=None, **new_counters())
+            if self._segments:
+                self._tail_active(truncate_torn)
+
+    def _tail_active(self, truncate_torn: bool):
+        active = self._segments[-1]
+        path = self.directory / active["name"]
+        torn = False
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self._active_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write from a crash, or another worker mid-append
+                        torn = True
+                        break
+                    self._active_offset += len(line)
+                    self._note(active, json.loads(line))
+        except FileNotFoundError:
+            return
+        if torn and truncate_torn:
+            logger.warning(f"Discarding incomplete log entry in {path.name}")
+            with open(path, 'r+b') as f:
+                f.truncate(self._active_offset)
+
+    @staticmethod
+    def _note(segment: dict, entry: dict):
+        timestamp = entry.get("timestamp")
+        count_entry(segment, entry)
+        if segment["first"] is None:
+            segment["first"] = timestamp
+        segment["last"] = timestamp
+
+    def _write_index(self):
+        write_json_atomic(self.index_path, {"segments": self._segments, "rollups": self._rollups})
+        self._index_stat = self._stat_index()
+
+    def _rotate(self, day: str):
+        """Close the active segment and start a new one for `day`"""
+        number = sum(1 for s in self._segments if s["day"] == day) + 1
+        self._segments.append({
+            "name": f"download-{day.replace('-', '')}-{number:04d}.jsonl",
+            "day": day,
+            "first": None,
+            "last": None,
+            **new_counters()
+        })
+        self._active_offset = 0
+        self._write_index()
+        logger.info(f"Access log rotated to {self._segments[-1]['name']}")
+
+    # ---------- writing ----------
+
+    def append(self, entries: List[dict]):
+        """Append entries (oldest first) in one write"""
+        if not entries:
+            return
+        with self._file_lock:
+            self._refresh(truncate_torn=True)
+            day = (entries[0].get("timestamp") or "")[:10]
+            active = self._segments[-1] if self._segments else None
+            if (active is None or active["day"] != day
+                    or self._active_offset >= self.max_segment_bytes):
+                self._rotate(day)
+                active = self._segments[-1]
+            payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode('utf-8')
+            with open(self.directory / active["name"], 'ab') as f:
+                f.write(payload)
+                f.flush()
+                if JOURNAL_FSYNC:
+                    os.fsync(f.fileno())
+            self._active_offset += len(payload)
+            for entry in entries:
+                self._note(active, entry)
+
+    # ---------- reading ----------
+
+    def _read_segment(self, segment: dict) -> List[dict]:
+        entries = []
+        try:
+            with open(self.directory / segment["name"], 'rb') as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        entries.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def recent(self, limit: Optional[int] = None, since: Optional[datetime] = None,
+               offset: int = 0, code: Optional[str] = None) -> List[dict]:
+        """Entries newest first, optionally only the `limit` latest / those after `since`.
+
+        `offset` skips that many of the newest entries (paging); with `code`,
+        only that code's entries, and segments whose counters show none of
+        them are not read.
+        """
+        self._refresh()
+        with self._file_lock.lock:
+            segments = [dict(s, by_code=dict(s["by_code"])) for s in self._segments]
+        wanted = limit + offset if limit is not None else None
+        result = []
+        for segment in reversed(segments):
+            if wanted is not None and len(result) >= wanted:
+                break
+            if since is not None:
+                last = parse_timestamp(segment["last"])
+                if last is not None and last <= since:
+                    break
+            if code is not None and not segment["by_code"].get(code):
+                continue
+            for entry in reversed(self._read_segment(segment)):
+                if since is not None:
+                    ts = parse_timestamp(entry.get("timestamp"))
+                    if ts is not None and ts <= since:
+                        continue
+                if code is not None and entry.get("code") != code:
+                    continue
+                result.append(entry)
+        return result[offset:wanted]
+
+    def __iter__(self) -> Iterator[dict]:
+        """All entries, oldest first, one segment in memory at a time"""
+        self._refresh()
+        for segment in list(self._segments):
+            yield from self._read_segment(segment)
+
+    def count(self) -> int:
+        """Total number of entries, rolled-up ones included"""
+        self._refresh()
+        return (sum(segment["count"] for segment in self._segments)
+                + sum(day["count"] for day in self._rollups.values()))
+
+    def stats(self) -> dict:
+        """Access counters over the whole history: total, per parcelle, per client, per day"""
+        self._refresh()
+        with self._file_lock.lock:
+            segments = [dict(s, **{name: dict(s[name]) for name in COUNTER_FIELDS}) for s in self._segments]
+            rollups = dict(self._rollups)
+        totals = new_counters()
+        by_day = {}
+        for day, counters in rollups.items():
+            merge_counters(totals, counters)
+            by_day[day] = by_day.get(day, 0) + counters["count"]
+        for segment in segments:
+            merge_counters(totals, segment)
+            by_day[segment["day"]] = by_day.get(segment["day"], 0) + segment["count"]
+        return {**totals, "by_day": dict(sorted(by_day.items()))}
+
+    # ---------- retention ----------
+
+    def expire(self, before: datetime) -> int:
+        """Fold closed segments whose entries all predate `before` into daily rollups"""
+        with self._file_lock:
+            self._refresh(truncate_torn=True)
+            expired = []
+            for segment in self._segments[:-1]:
+                last = parse_timestamp(segment["last"])
+                if last is None or last >= before:
+                    break
+                expired.append(segment)
+            if not expired:
+                return 0
+            
+            folded = 0
+            for segment in expired:
+                for entry in self._read_segment(segment):
+                    day = (entry.get("timestamp") or segment["day"])[:10]
+                    count_entry(self._rollups.setdefault(day, new_counters()), entry)
+                    folded += 1
+            self._segments = self._segments[len(expired):]
+            # Index first: a crash before the unlinks leaves stray files, never double counts
+            try:
+                self._write_index()
+            except Exception:
+                # Reload the on-disk index on next access
+                self._index_stat = None
+                raise
+            for segment in expired:
+                (self.directory / segment["name"]).unlink(missing_ok=True)
+            logger.info(f"Access log: folded {folded} entries from {len(expired)} segment(s) into daily rollups")
+            return folded
+
+
+class LogBatcher:
+    """In-process queue in front of an AccessLog.
+
+    Request handlers `submit` entries without waiting on disk; a background
+    task appends them in one write per batch, LOG_FLUSH_INTERVAL_MS after the
+    first queued entry or once LOG_FLUSH_BATCH entries are waiting. A failed
+    write keeps its entries queued for the next flush. `stop` flushes what is
+    left, so a clean shutdown loses nothing.
+    """
+
+    def __init__(self, access_log: AccessLog, interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+                 batch_size: int = LOG_FLUSH_BATCH):
+        self.access_log = access_log
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self._pending = []
+        self._task = None
+        self._queued = None
+        self._full = None
+        self._flush_lock = None
+
+    def start(self):
+        """Start the flush task (on the running event loop)"""
+        self._queued = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self._pending:
+            self._queued.set()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, entry: dict):
+        """Queue an entry; never blocks"""
+        self._pending.append(entry)
+        if self._queued is not None:
+            self._queued.set()
+            if len(self._pending) >= self.batch_size:
+                self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._queued.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Write every queued entry now"""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._queued.clear()
+            self._full.clear()
+            if not batch:
+                return
+            try:
+                await run_io(self.access_log.append, batch)
+            except Exception as e:
+                logger.error(f"Could not write {len(batch)} access log entries, will retry: {e}")
+                self._pending = batch + self._pending
+                self._queued.set()
+                # Back off instead of spinning on a failing disk
+                await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        """Stop the flush task and write what is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"{len(self._pending)} access log entries lost at shutdown")
+
+
+def import_document_logs(store, access_log: AccessLog) -> int:
+    """Move download logs still kept in the data document into the access log"""
+    moved = []
+
+    def take(current):
+        # Runs under the store's inter-process write lock, so only one worker imports
+        if current:
+            access_log.append(sorted(current, key=lambda e: e.get("timestamp") or ""))
+            moved.extend(current)
+        return []
+
+    if store.get().get("download_logs"):
+        store.set("download_logs", take)
+        logger.info(f"Moved {len(moved)} download log(s) from the data document to {access_log.directory}")
+    return len(moved)
@@ -0,0 +1,86 @@
+"""
+Document response memory benchmark
+Peak RSS added by serving one watermarked document, each case measured in
+a fresh interpreter:
+- buffered: the former handler (original read whole, watermarked in the
+  server process into a BytesIO, sent from that buffer)
+- render worker: the process pool job writing the output to a file
+- server, streamed: the server sending that file in chunks
+
+Usage: python benchmarks/memory_benchmark.py [--pages 100]
+"""
+import argparse
+import io
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+CHUNK = 64 * 1024
+
+
+def make_document(path: Path, pages: int):
+    """Text-heavy A4 document, one vector drawing per page"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for page in range(pages):
+        c.setFont("Helvetica", 9)
+        for line in range(70):
+            c.drawString(40, 800 - line * 11, f"Titre foncier - page {page + 1} - article {line + 1} : " + "clause " * 12)
+        for step in range(40):
+            c.line(40 + step * 12, 40, 60 + step * 12, 200)
+        c.showPage()
+    c.save()
+
+
+def peak_kib() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(case: str, original: str, output: str) -> int:
+    """Peak RSS added by one case (run in this process), in KiB"""
+    import watermark
+    baseline = peak_kib()
+    if case == "buffered":
+        with open(original, 'rb') as f:
+            content = f.read()
+        pdf = watermark.add_watermark_to_pdf(content, "Awa Koné", "ABCD2345")
+        for _ in io.BytesIO(pdf):
+            pass
+    elif case == "worker":
+        watermark.add_watermark_to_file(original, "Awa Koné", "ABCD2345", output)
+    elif case == "streamed":
+        with open(output, 'rb') as f:
+            while f.read(CHUNK):
+                pass
+    return peak_kib() - baseline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--files", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(run_case(args.case, *args.files))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original, output = Path(tmp) / "original.pdf", Path(tmp) / "watermarked.pdf"
+        make_document(original, args.pages)
+        print(f"{args.pages} pages, original {original.stat().st_size // 1024} KiB")
+        cases = [("buffered (before)", "buffered"), ("render worker (after)", "worker"),
+                 ("server, streamed (after)", "streamed")]
+        for label, case in cases:
+            result = subprocess.run(
+                [sys.executable, __file__, "--case", case, "--files", str(original), str(output)],
+                capture_output=True, text=True, check=True)
+            print(f"{label:<26}{int(result.stdout.split()[-1]) / 1024:>8.1f} MiB peak RSS added")
+        print(f"watermarked output {output.stat().st_size // 1024} KiB")
@@ -0,0 +1,80 @@
+"""
+Placeholder document benchmark
+Milliseconds per placeholder ACD and plan:
+- full render: the whole page drawn with reportlab on every call (before)
+- template miss: first request for a parcelle, body rendered and parsed once
+- template hit: later requests, client overlay stamped on the cached body
+
+Usage: python benchmarks/placeholder_benchmark.py [--runs 500]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from reportlab.lib.colors import Color  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+import watermark  # noqa: E402
+
+PARCELLE = {"acd": ("Lot 12", "CI-2024-012"), "plan": ("Lot 12", "CI-2024-012", 1.5)}
+
+
+def full_render(kind: str, *details) -> bytes:
+    """The former placeholder: body, diagonal watermark and footer drawn on one canvas"""
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    width, height = A4
+    watermark.PLACEHOLDER_BODIES[kind](c, *details)
+    c.setFillColor(Color(0.4, 0.4, 0.4, alpha=0.08))
+    c.saveState()
+    c.translate(width / 2, height / 2)
+    c.rotate(45)
+    c.setFont("Helvetica-Bold", 28)
+    c.drawCentredString(0, 30, "Préparé pour Awa Koné")
+    c.setFont("Helvetica", 16)
+    c.drawCentredString(0, -5, "Document sécurisé par onegreendev")
+    c.setFont("Helvetica", 11)
+    c.drawCentredString(0, -30, "Code: ABCD2345")
+    c.restoreState()
+    c.setFillColor(Color(0.5, 0.5, 0.5))
+    c.setFont("Helvetica", 8)
+    c.drawCentredString(width / 2, 30, "Document généré le 01/01/2026 10:00 - Code d'accès: ABCD2345")
+    c.drawCentredString(width / 2, 18, "Document sécurisé par onegreendev - Reproduction interdite")
+    c.save()
+    return packet.getvalue()
+
+
+def stamped(kind: str, *details) -> bytes:
+    if kind == "acd":
+        return watermark.create_placeholder_acd_pdf(*details, "Awa Koné", "ABCD2345")
+    return watermark.create_placeholder_plan_pdf(*details, "Awa Koné", "ABCD2345")
+
+
+def per_call_ms(func, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'':<8}{'full render':>14}{'template miss':>16}{'template hit':>15}")
+    for kind, details in PARCELLE.items():
+        full = per_call_ms(lambda: full_render(kind, *details), args.runs)
+
+        def miss():
+            watermark.placeholder_templates.clear()
+            stamped(kind, *details)
+        cold = per_call_ms(miss, args.runs)
+
+        warm = per_call_ms(lambda: stamped(kind, *details), args.runs)
+        print(f"{kind:<8}{full:>11.2f} ms{cold:>13.2f} ms{warm:>12.2f} ms  ({full / warm:.0f}x)")
@@ -0,0 +1,113 @@
+"""
+Snapshot load/save benchmark
+Compares the pretty-printed parcelles.json snapshot (stdlib baseline, then
+orjson) with the binary snapshot with each codec available (stdlib JSON,
+orjson, msgpack), for growing numbers of records.
+
+Usage: python benchmarks/snapshot_benchmark.py [--sizes 1000 10000 50000] [--repeat 3]
+"""
+import argparse
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import storage  # noqa: E402
+from storage import JsonJournalStorage  # noqa: E402
+
+
+def make_document(records: int) -> dict:
+    """Synthetic document: 1 parcelle per 10 records, the rest access codes and code requests"""
+    now = datetime.now(timezone.utc)
+    parcelles = [{
+        "id": f"parcelle-{i}",
+        "nom": f"Lot {i} - Songon M'Braté",
+        "statut": ["disponible", "option", "vendu"][i % 3],
+        "superficie": round(0.5 + i % 7 * 0.25, 2),
+        "valeur_globale": 25_000_000 + i * 1000,
+        "type_projet": "Résidentiel",
+        "coordinates": [[-4.287 + j * 0.0001, 5.345 + j * 0.0001] for j in range(12)],
+        "photos": [f"/uploads/parcelle-{i}_photo_{j}.jpg" for j in range(3)],
+        "official_documents": {}
+    } for i in range(max(1, records // 10))]
+    codes = [{
+        "id": str(uuid.uuid4()),
+        "code": f"C{i:07d}",
+        "client_name": f"Client {i}",
+        "client_email": f"client{i}@example.com",
+        "parcelle_ids": [parcelles[i % len(parcelles)]["id"]],
+        "expires_at": (now + timedelta(hours=72)).isoformat(),
+        "created_at": now.isoformat(),
+        "created_by": "admin",
+        "active": True,
+        "usage_count": 0,
+        "profile_type": "PROSPECT",
+        "parcelle_configs": {}
+    } for i in range(records // 2)]
+    requests = [{
+        "id": str(uuid.uuid4()),
+        "first_name": "Awa",
+        "last_name": f"Koné {i}",
+        "whatsapp": f"+22507{i:08d}",
+        "parcelle_id": parcelles[i % len(parcelles)]["id"],
+        "status": "pending",
+        "created_at": now.isoformat()
+    } for i in range(records - len(parcelles) - len(codes))]
+    return {
+        "parcelles": parcelles,
+        "config": {"map_center": [-4.287, 5.345], "map_zoom": 15},
+        "admin": {},
+        "access_codes": codes,
+        "download_logs": [],
+        "code_requests": requests
+    }
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench(records: int, repeat: int) -> list:
+    document = make_document(records)
+    installed = {"orjson": storage.orjson, "msgpack": storage.msgpack}
+    # (label, snapshot format, codec modules left enabled)
+    formats = [("json (stdlib, indent=2)", "json", {}), ("binary (stdlib json)", "binary", {})]
+    if installed["orjson"] is not None:
+        formats.append(("json (orjson, indent=2)", "json", {"orjson": installed["orjson"]}))
+        formats.append(("binary (orjson)", "binary", {"orjson": installed["orjson"]}))
+    if installed["msgpack"] is not None:
+        formats.append(("binary (msgpack)", "binary", {"msgpack": installed["msgpack"]}))
+    rows = []
+    for label, snapshot_format, codecs in formats:
+        storage.orjson = codecs.get("orjson")
+        storage.msgpack = codecs.get("msgpack")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "parcelles.json"
+            backend = JsonJournalStorage(path, snapshot_format=snapshot_format)
+            save = best_of(repeat, lambda: backend.save(dict(document)))
+            size = sum(p.stat().st_size for p in Path(tmp).glob("parcelles.*"))
+            load = best_of(repeat, lambda: JsonJournalStorage(path, snapshot_format=snapshot_format).load())
+        rows.append((records, label, save * 1000, load * 1000, size / 1024))
+    storage.orjson, storage.msgpack = installed["orjson"], installed["msgpack"]
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'records':>8}  {'format':<24}{'save ms':>10}{'load ms':>10}{'size KiB':>11}")
+    for size in args.sizes:
+        for records, label, save_ms, load_ms, kib in bench(size, args.repeat):
+            print(f"{records:>8}  {label:<24}{save_ms:>10.1f}{load_ms:>10.1f}{kib:>11.0f}")
@@ -0,0 +1,482 @@
+# In-memory data store on top of a pluggable storage backend
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hash indexes kept in step with every mutation: collection -> indexed fields
+INDEXES = {
+    "parcelles": ["id"],
+    "access_codes": ["id", "code"],
+}
+
+# Collections whose records lapse: collection -> ISO timestamp field
+EXPIRY_FIELDS = {
+    "access_codes": "expires_at",
+}
+
+# Backend poll result: the document must be reloaded whole (see StorageBackend.reload)
+RELOAD = "reload"
+
+
+def default_data() -> dict:
+    """Empty document used when no data file exists yet"""
+    return {
+        "parcelles": [],
+        "config": {"map_center": [-4.287, 5.345], "map_zoom": 15},
+        "admin": {},
+        "access_codes": [],
+        "download_logs": [],
+        "code_requests": []
+    }
+
+
+def normalize_data(data: dict) -> dict:
+    """Ensure required collections exist"""
+    for key in ("access_codes", "download_logs", "code_requests"):
+        if key not in data:
+            data[key] = []
+    return data
+
+
+def apply_op(data: dict, op: dict):
+    """Apply a mutation record to a document, return the updated record/entry.
+
+    Collections are updated copy-on-write (records and lists are replaced,
+    never edited in place) so concurrent readers see a consistent value.
+    A "batch" record applies its sub-records together.
+    """
+    kind = op["op"]
+    if kind == "batch":
+        return [apply_op(data, sub) for sub in op["ops"]]
+    key = op["c"]
+    if kind == "append":
+        data[key] = data.get(key, []) + [op["v"]]
+    elif kind == "extend":
+        data[key] = data.get(key, []) + op["v"]
+    elif kind == "update":
+        records = data.get(key, [])
+        for i, record in enumerate(records):
+            if record.get("id") == op["id"]:
+                updated = {**record, **op["v"]}
+                data[key] = records[:i] + [updated] + records[i + 1:]
+                return updated
+    elif kind == "remove":
+        data[key] = [r for r in data.get(key, []) if r.get("id") != op["id"]]
+    elif kind == "set":
+        data[key] = op["v"]
+        return data[key]
+    else:
+        raise ValueError(f"Unknown mutation op: {kind}")
+    return None
+
+
+def index_key(field: str, value):
+    """Normalize an index key (access codes match case-insensitively)"""
+    if field == "code" and isinstance(value, str):
+        return value.upper()
+    return value
+
+
+class Index:
+    """Unique hash index mapping one field of a collection to its record"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.entries = {}
+
+    def key(self, record: dict):
+        return index_key(self.field, record.get(self.field))
+
+    def add(self, record: dict):
+        self.entries[self.key(record)] = record
+
+    def discard(self, record: dict):
+        key = self.key(record)
+        current = self.entries.get(key)
+        # Another record may have taken over a duplicate key
+        if current is not None and current.get("id") == record.get("id"):
+            del self.entries[key]
+
+    def replace(self, old: dict, new: dict):
+        # Insert before dropping so concurrent readers never miss the record
+        if self.key(old) == self.key(new):
+            self.add(new)
+        else:
+            self.add(new)
+            self.discard(old)
+
+    def get(self, key) -> Optional[dict]:
+        return self.entries.get(key)
+
+
+def parse_expiry(value) -> Optional[float]:
+    """POSIX timestamp of an ISO expiry date (naive dates are UTC), None if invalid"""
+    try:
+        expires_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at.timestamp()
+
+
+class ExpiryIndex:
+    """Parsed expiry time of each record, plus a min-heap of the active ones.
+
+    The heap is never searched: entries left behind by updates and removals
+    no longer match `scheduled` and are dropped when they reach the top.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.entries = {}
+        self.scheduled = {}
+        self.heap = []
+
+    def add(self, record: dict):
+        record_id = record.get("id")
+        self.scheduled.pop(record_id, None)
+        expires = parse_expiry(record.get(self.field))
+        if expires is None:
+            self.entries.pop(record_id, None)
+            return
+        self.entries[record_id] = expires
+        if record.get("active", True):
+            self.scheduled[record_id] = expires
+            heapq.heappush(self.heap, (expires, record_id))
+
+    def discard(self, record: dict):
+        self.entries.pop(record.get("id"), None)
+        self.scheduled.pop(record.get("id"), None)
+
+    def replace(self, old: dict, new: dict):
+        # Most updates (usage counters...) leave the expiry alone
+        if (old.get(self.field) == new.get(self.field)
+                and old.get("active", True) == new.get("active", True)):
+            return
+        self.add(new)
+        if old.get("id") != new.get("id"):
+            self.discard(old)
+
+    def get(self, record_id) -> Optional[float]:
+        return self.entries.get(record_id)
+
+    def _prune(self):
+        while self.heap and self.scheduled.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_due(self) -> Optional[float]:
+        self._prune()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> List[str]:
+        """Pop the ids of the active records that lapsed at `now`"""
+        due = []
+        self._prune()
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[1])
+            self._prune()
+        return due
+
+
+class DataStore:
+    """Process-resident copy of the data document.
+
+    The document is loaded once from the storage backend and served from
+    memory. Mutations are handed to the backend first (write-ahead) and then
+    applied in memory. When several worker processes share the storage, each
+    read picks up their changes (cheaply, see StorageBackend.poll_changes) and
+    each mutation runs under the backend's inter-process write lock after
+    catching up, so no worker overwrites another's change.
+
+    When another process replaced the whole document, a read given an
+    `executor` hands the reload to it and keeps serving the current document
+    meanwhile; without one, the read reloads before returning.
+    """
+
+    def __init__(self, backend, executor=None):
+        self.backend = backend
+        self.executor = executor
+        self._data = None
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._reloading = False
+
+    # ---------- loading ----------
+
+    def load(self) -> dict:
+        """(Re)load the document from the backend"""
+        with self._lock:
+            self._data = normalize_data(self.backend.load())
+            self._build_indexes()
+            logger.info(f"Data store loaded from {self.backend.name} backend")
+            return self._data
+
+    def get(self) -> dict:
+        """Return the live document, refreshed with other processes' changes"""
+        if self._data is None:
+            return self.load()
+        # A writer of this process (or a reload) already holds the lock and syncs itself
+        if self._lock.acquire(blocking=False):
+            try:
+                self._sync(reload=self.executor is None)
+            finally:
+                self._lock.release()
+        return self._data
+
+    def _sync(self, reload: bool = True):
+        """Apply changes made by other processes (caller holds the lock).
+
+        A whole-document reload is done here if `reload`, else scheduled on
+        the executor.
+        """
+        changes = self.backend.poll_changes()
+        if changes == RELOAD:
+            if reload:
+                self._data = normalize_data(self.backend.reload())
+                self._build_indexes()
+            elif not self._reloading:
+                self._reloading = True
+                self.executor.submit(self._background_reload)
+        elif changes:
+            for op in changes:
+                self._apply(op)
+
+    def _background_reload(self):
+        with self._lock:
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error(f"Data store reload failed: {e}")
+            finally:
+                self._reloading = False
+
+    def _apply(self, op: dict):
+        """Apply a mutation in memory and update the indexes of its collection"""
+        kind = op["op"]
+        if kind == "batch":
+            return [self._apply(sub) for sub in op["ops"]]
+        collection = op["c"]
+        indexes = self._indexes.get(collection)
+        if not indexes:
+            return apply_op(self._data, op)
+        
+        old = self._find_by_id(collection, op["id"]) if kind in ("update", "remove") else None
+        result = apply_op(self._data, op)
+        
+        if kind == "append":
+            for index in indexes.values():
+                index.add(op["v"])
+        elif kind == "extend":
+            for record in op["v"]:
+                for index in indexes.values():
+                    index.add(record)
+        elif kind == "update" and result is not None:
+            for index in indexes.values():
+                index.replace(old, result)
+        elif kind == "remove" and old is not None:
+            for index in indexes.values():
+                index.discard(old)
+        elif kind == "set":
+            self._build_indexes(collection)
+        return result
+
+    # ---------- indexes ----------
+
+    def _build_indexes(self, only: Optional[str] = None):
+        """(Re)build the indexes of one collection, or of all of them"""
+        for collection, fields in INDEXES.items():
+            if only is not None and collection != only:
+                continue
+            indexes = {field: Index(field) for field in fields}
+            if collection in EXPIRY_FIELDS:
+                indexes["expiry"] = ExpiryIndex(EXPIRY_FIELDS[collection])
+            for record in self._data.get(collection, []):
+                for index in indexes.values():
+                    index.add(record)
+            self._indexes[collection] = indexes
+
+    def _find_by_id(self, collection: str, record_id: str) -> Optional[dict]:
+        index = self._indexes.get(collection, {}).get("id")
+        if index is not None:
+            return index.get(record_id)
+        for record in self._data.get(collection, []):
+            if record.get("id") == record_id:
+                return record
+        return None
+
+    # ---------- mutations ----------
+
+    def _mutate(self, make_op):
+        """Build a mutation from the up-to-date document, persist it, apply it"""
+        with self._lock, self.backend.write_lock():
+            if self._data is None:
+                self.load()
+            else:
+                self._sync()
+            op = make_op(self._data)
+            if op is None:
+                return None
+            self.backend.commit(op)
+            result = self._apply(op)
+            self.backend.checkpoint(self._data)
+            return result
+
+    def append(self, collection: str, record: dict):
+        """Append a record to a collection"""
+        self._mutate(lambda data: {"op": "append", "c": collection, "v": record})
+
+    def extend(self, collection: str, records) -> List[dict]:
+        """Append several records to a collection in one write, return them.
+
+        `records` may also be a function of the current document returning
+        the records (evaluated under the locks, see `update`).
+        """
+        created = []
+
+        def make_op(data):
+            created.extend(records(data) if callable(records) else records)
+            if not created:
+                return None
+            return {"op": "extend", "c": collection, "v": list(created)}
+        self._mutate(make_op)
+        return created
+
+    def update(self, collection: str, record_id: str, fields) -> Optional[dict]:
+        """Merge fields into the record with this id, return the new record.
+
+        `fields` may also be a function of the current record returning the
+        fields to merge; it runs under the store (and inter-process) lock, so
+        read-modify-write updates from concurrent requests cannot overwrite
+        each other.
+        """
+        def make_op(data):
+            value = fields
+            if callable(fields):
+                record = self.find(collection, record_id)
+                if record is None:
+                    return None
+                value = fields(record)
+            return {"op": "update", "c": collection, "id": record_id, "v": value}
+        return self._mutate(make_op)
+
+    def remove(self, collection: str, record_id: str):
+        """Remove the record with this id from a collection"""
+        self._mutate(lambda data: {"op": "remove", "c": collection, "id": record_id})
+
+    def set(self, key: str, value):
+        """Replace a top-level entry of the document.
+
+        `value` may be a function of the current entry (see `update`).
+        """
+        def make_op(data):
+            new_value = value(data.get(key)) if callable(value) else value
+            return {"op": "set", "c": key, "v": new_value}
+        return self._mutate(make_op)
+
+    def set_many(self, values):
+        """Replace several top-level entries in one atomic mutation.
+
+        `values` is a dict {key: value}, or a function of the current document
+        returning one (evaluated under the locks, see `update`).
+        """
+        def make_op(data):
+            new_values = values(data) if callable(values) else values
+            if not new_values:
+                return None
+            return {"op": "batch", "c": None,
+                    "ops": [{"op": "set", "c": key, "v": value} for key, value in new_values.items()]}
+        return self._mutate(make_op)
+
+    def update_many(self, collection: str, fields_by_id):
+        """Merge fields into several records of a collection in one atomic mutation.
+
+        `fields_by_id` is a dict {record_id: fields}, or a function of the
+        current document returning one (evaluated under the locks, see `update`).
+        """
+        def make_op(data):
+            updates = fields_by_id(data) if callable(fields_by_id) else fields_by_id
+            if not updates:
+                return None
+            return {"op": "batch", "c": None,
+                    "ops": [{"op": "update", "c": collection, "id": record_id, "v": fields}
+                            for record_id, fields in updates.items()]}
+        return self._mutate(make_op)
+
+    def save(self, data: dict):
+        """Replace the whole document and persist it.
+
+        Catches up first, under the locks: the snapshot then records the
+        last journal record it covers, and the live document (if that is
+        what is given) includes the records the other workers journaled.
+        """
+        with self._lock, self.backend.write_lock():
+            if self._data is not None:
+                self._sync()
+            self.backend.save(data)
+            self._data = normalize_data(data)
+            self._build_indexes()
+
+    # ---------- queries ----------
+
+    def find(self, collection: str, record_id: str) -> Optional[dict]:
+        """Return the record with this id, or None"""
+        self.get()
+        return self._find_by_id(collection, record_id)
+
+    def lookup(self, collection: str, field: str, value):
+        """Return the record whose indexed `field` has this value, or None"""
+        self.get()
+        return self._indexes[collection][field].get(index_key(field, value))
+
+    def expiry(self, collection: str, record_id: str) -> Optional[float]:
+        """Parsed expiry (POSIX timestamp) of a record, None if it has none"""
+        self.get()
+        return self._indexes[collection]["expiry"].get(record_id)
+
+    def next_expiry(self, collection: str) -> Optional[float]:
+        """Earliest expiry among the active records of a collection"""
+        self.get()
+        # Pruning the heap mutates it: same lock as the writers
+        with self._lock:
+            return self._indexes[collection]["expiry"].next_due()
+
+    def expire_due(self, collection: str, now: float, fields: dict) -> List[str]:
+        """Merge `fields` into every active record that lapsed at `now`.
+
+        Runs as one mutation under the locks, after catching up with the
+        other workers, so a record is only ever deactivated once.
+        """
+        expired = []
+
+        def due(data):
+            expired.extend(self._indexes[collection]["expiry"].pop_due(now))
+            return {record_id: fields for record_id in expired}
+        self.update_many(collection, due)
+        return expired
+
+    def query(
+        self,
+        collection: str,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+        **filters
+    ) -> List[dict]:
+        """Filter (equality), sort and limit a collection.
+
+        Backends that can answer from an index (SQLite) do so; otherwise the
+        in-memory collection is scanned.
+        """
+        rows = self.backend.query(collection, order_by, descending, limit, filters)
+        if rows is not None:
+            return rows
+        rows = [r for r in self.get().get(collection, [])
+                if all(r.get(k) == v for k, v in filters.items())]
+        if order_by:
+            rows = sorted(rows, key=lambda r: r.get(order_by) or "", reverse=descending)
+        return rows[:limit] if limit is not None else rows
@@ -0,0 +1,98 @@
+# Executors for work that must not run on the asyncio event loop
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Bounded thread pool for blocking file and data store I/O
+IO_WORKERS = int(os.environ.get('IO_WORKERS', '8'))
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="songon-io")
+
+# Process pool for CPU-bound PDF rendering (watermarks, placeholder documents)
+CPU_WORKERS = int(os.environ.get('CPU_WORKERS', str(os.cpu_count() or 2)))
+# Jobs queued or running in the process pool at once; more are refused until some finish
+CPU_QUEUE_LIMIT = int(os.environ.get('CPU_QUEUE_LIMIT', str(CPU_WORKERS * 4)))
+# Seconds a refused client is asked to wait
+CPU_BUSY_RETRY_AFTER_SECONDS = int(os.environ.get('CPU_BUSY_RETRY_AFTER_SECONDS', '2'))
+
+
+def new_cpu_executor() -> ProcessPoolExecutor:
+    # Workers are spawned, not forked: the server process runs threads and an event loop.
+    # Spawned workers import the main module, so scripts using the server need a __main__ guard.
+    return ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+cpu_executor = new_cpu_executor()
+cpu_jobs = 0
+_cpu_jobs_lock = threading.Lock()
+
+
+class PoolBusy(Exception):
+    """The process pool already holds CPU_QUEUE_LIMIT jobs"""
+
+    def __init__(self, retry_after: int = CPU_BUSY_RETRY_AFTER_SECONDS):
+        super().__init__(f"{CPU_QUEUE_LIMIT} rendering jobs already queued")
+        self.retry_after = retry_after
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking I/O call in the I/O thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+
+def _release_cpu_job(_future):
+    global cpu_jobs
+    with _cpu_jobs_lock:
+        cpu_jobs -= 1
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Run a CPU-bound call in the process pool, PoolBusy if its queue is full.
+
+    `func` and its arguments are pickled: module-level functions and plain
+    data only. A job counts against the queue until the worker finishes it,
+    even if the request waiting for it is cancelled.
+    """
+    global cpu_jobs
+    with _cpu_jobs_lock:
+        if cpu_jobs >= CPU_QUEUE_LIMIT:
+            raise PoolBusy()
+        cpu_jobs += 1
+    job = functools.partial(func, *args, **kwargs)
+    try:
+        executor = cpu_executor
+        try:
+            future = executor.submit(job)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory): start a new pool for this and later jobs
+            replace_cpu_executor(executor)
+            future = cpu_executor.submit(job)
+    except BaseException:
+        _release_cpu_job(None)
+        raise
+    future.add_done_callback(_release_cpu_job)
+    return await asyncio.wrap_future(future)
+
+
+def replace_cpu_executor(broken: ProcessPoolExecutor):
+    global cpu_executor
+    with _cpu_jobs_lock:
+        if cpu_executor is not broken:
+            return  # already replaced
+        cpu_executor = new_cpu_executor()
+    logger.error("Rendering process pool broken, starting a new one")
+    broken.shutdown(wait=False)
+
+
+def shutdown_executors():
+    """Wait for queued I/O to finish and stop the pools"""
+    io_executor.shutdown(wait=True)
+    cpu_executor.shutdown(wait=True, cancel_futures=True)
+    logger.info("Executors shut down")
@@ -0,0 +1,44 @@
+# Access code expiry: lapsed codes are deactivated by a sweeper that sleeps until the next one is due
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest pause between sweeps (other workers may add codes that lapse sooner)
+EXPIRY_SWEEP_MAX_SECONDS = float(os.environ.get('EXPIRY_SWEEP_MAX_SECONDS', '60'))
+
+
+def code_is_live(store, access_code: dict, now: Optional[float] = None) -> bool:
+    """Active and not lapsed, using the parsed expiry kept by the store.
+
+    Lapsed codes the sweeper has not reached yet are refused too.
+    """
+    if not access_code.get("active"):
+        return False
+    expires = store.expiry("access_codes", access_code["id"])
+    return expires is not None and expires > (time.time() if now is None else now)
+
+
+def sweep_expired_codes(store, now: Optional[float] = None) -> List[str]:
+    """Deactivate the access codes that lapsed, return their ids"""
+    now = time.time() if now is None else now
+    expired = store.expire_due("access_codes", now, {
+        "active": False,
+        "deactivated_reason": "expired",
+        "deactivated_at": datetime.fromtimestamp(now, timezone.utc).isoformat()
+    })
+    if expired:
+        logger.info(f"Deactivated {len(expired)} expired access code(s)")
+    return expired
+
+
+def seconds_until_next_sweep(store, now: Optional[float] = None) -> float:
+    """Time until the next active code lapses, capped at EXPIRY_SWEEP_MAX_SECONDS"""
+    next_due = store.next_expiry("access_codes")
+    if next_due is None:
+        return EXPIRY_SWEEP_MAX_SECONDS
+    now = time.time() if now is None else now
+    return min(max(next_due - now, 0.0), EXPIRY_SWEEP_MAX_SECONDS)
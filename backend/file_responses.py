@@ -0,0 +1,143 @@
+# File responses with strong ETags, conditional GET and byte ranges (single range)
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from executors import run_io
+
+# Files are hashed and sent in chunks of this size
+FILE_CHUNK_BYTES = 64 * 1024
+# Hashes of files without a stored one, remembered per path, mtime and size
+FILE_HASH_CACHE_SIZE = 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_file_hashes = OrderedDict()
+_file_hashes_lock = threading.Lock()
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, computed once per version of the file (blocking)"""
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _file_hashes_lock:
+        digest = _file_hashes.get(key)
+        if digest is not None:
+            _file_hashes.move_to_end(key)
+            return digest
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_BYTES), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[key] = digest
+        while len(_file_hashes) > FILE_HASH_CACHE_SIZE:
+            _file_hashes.popitem(last=False)
+    return digest
+
+
+def strong_etag(document_id: str, sha256: str) -> str:
+    return f'"{document_id}-{sha256[:32]}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for it)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single `bytes=` range, None to send the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None  # absent, malformed or several ranges: the whole file is sent
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix: the last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        raise ValueError(header)
+    return first, last
+
+
+async def file_range_chunks(path: Path, first: int, last: int):
+    """Bytes `first` to `last` of a file, read off the event loop"""
+    f = await run_io(open, path, 'rb')
+    try:
+        await run_io(f.seek, first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = await run_io(f.read, min(FILE_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def conditional_file_response(
+    request: Request,
+    path: Path,
+    etag: str,
+    media_type: str,
+    headers: dict
+) -> Response:
+    """The file at `path`, answering If-None-Match with 304 and Range with 206.
+
+    Whole files go through FileResponse, which hands the path to the server
+    (http.response.pathsend) when it supports it.
+    """
+    stat = await run_io(path.stat)
+    headers = {**headers, "ETag": etag, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # A range of another version of the file is not valid: send it whole
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    first, last = byte_range
+    return StreamingResponse(
+        file_range_chunks(path, first, last),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            **headers,
+            "Content-Range": f"bytes {first}-{last}/{stat.st_size}",
+            "Content-Length": str(last - first + 1)
+        }
+    )
+
+
+def is_range_continuation(request: Request) -> bool:
+    """A Range request not starting at the first byte: a viewer fetching more of a document already opened"""
+    match = RANGE_PATTERN.match(request.headers.get("range", "").strip())
+    return match is not None and match.group(1) != "0"
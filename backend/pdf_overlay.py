@@ -0,0 +1,152 @@
+# Text overlays written as raw PDF operators, stamped on pre-rendered pages as incremental updates
+import io
+import math
+import re
+
+from PyPDF2 import PdfReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# Standard fonts available to overlays (no embedding, WinAnsi encoding)
+FONTS = {"Helvetica": b"/F1", "Helvetica-Bold": b"/F2"}
+
+STARTXREF_PATTERN = re.compile(rb"startxref\s+(\d+)")
+
+
+def pdf_number(value: float) -> bytes:
+    return (b"%.4f" % value).rstrip(b"0").rstrip(b".") or b"0"
+
+
+def pdf_text(text: str) -> bytes:
+    """A PDF literal string in WinAnsi encoding (characters outside it become '?')"""
+    encoded = text.encode("cp1252", errors="replace")
+    for char, escaped in ((b"\\", b"\\\\"), (b"(", b"\\("), (b")", b"\\)"), (b"\r", b"\\r"), (b"\n", b"\\n")):
+        encoded = encoded.replace(char, escaped)
+    return b"(" + encoded + b")"
+
+
+def serialize(obj) -> bytes:
+    """A PyPDF2 object written as PDF syntax (indirect objects stay references)"""
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+
+class TextOverlay:
+    """Content stream and resources of a text overlay, with reportlab canvas-like calls.
+
+    Widths come from reportlab's font metrics, so centred and right-aligned
+    text lands where the canvas would put it.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self.alphas = {}  # fill alpha -> ExtGState name
+
+    def save(self):
+        self.ops.append(b"q")
+
+    def restore(self):
+        self.ops.append(b"Q")
+
+    def translate_rotate(self, x: float, y: float, degrees: float = 0):
+        self.ops.append(b"1 0 0 1 %s %s cm" % (pdf_number(x), pdf_number(y)))
+        if degrees:
+            cos, sin = math.cos(math.radians(degrees)), math.sin(math.radians(degrees))
+            self.ops.append(b"%s %s %s %s 0 0 cm" % (pdf_number(cos), pdf_number(sin), pdf_number(-sin), pdf_number(cos)))
+
+    def fill(self, red: float, green: float, blue: float, alpha: float = 1.0):
+        """Fill colour of the following text (the alpha is always set: the overlay inherits the page's state)"""
+        name = self.alphas.setdefault(alpha, b"/A%d" % (len(self.alphas) + 1))
+        self.ops.append(b"%s %s %s rg %s gs" % (pdf_number(red), pdf_number(green), pdf_number(blue), name))
+
+    def text(self, x: float, y: float, text: str, font: str = "Helvetica", size: float = 12, align: str = "left"):
+        """Draw a string; align is "left", "centre" or "right" around x"""
+        if align != "left":
+            width = stringWidth(text, font, size)
+            x -= width / 2 if align == "centre" else width
+        self.ops.append(b"BT %s %s Tf %s %s Td %s Tj ET" % (
+            FONTS[font], pdf_number(size), pdf_number(x), pdf_number(y), pdf_text(text)))
+
+    def content(self) -> bytes:
+        return b"\n".join(self.ops)
+
+    def resources(self) -> bytes:
+        fonts = b" ".join(b"%s << /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                          % (name, font.encode()) for font, name in FONTS.items())
+        states = b" ".join(b"%s << /Type /ExtGState /ca %s >>" % (name, pdf_number(alpha))
+                           for alpha, name in self.alphas.items())
+        return b"<< /Font << %s >> /ExtGState << %s >> >>" % (fonts, states)
+
+
+class PageTemplate:
+    """A one-page PDF rendered once, stamped with an overlay by appending an incremental update.
+
+    The update adds the overlay as a Form XObject and rewrites the page so its
+    content is wrapped in q/Q and followed by the overlay. The original bytes
+    are reused as they are: stamping is string assembly, nothing is parsed.
+    """
+
+    def __init__(self, pdf: bytes):
+        reader = PdfReader(io.BytesIO(pdf))
+        page = reader.pages[0]
+        trailer = reader.trailer
+        self.base = pdf if pdf.endswith(b"\n") else pdf + b"\n"
+        self.prev_xref = int(STARTXREF_PATTERN.findall(pdf)[-1])
+        self.page_size = (float(page.mediabox.width), float(page.mediabox.height))
+
+        size = int(trailer["/Size"])
+        self.open_num, self.close_num, self.overlay_num = size, size + 1, size + 2
+        self.page_ref = (page.indirect_reference.idnum, page.indirect_reference.generation)
+
+        # The page, with its content wrapped and the overlay added to its resources
+        contents = dict.get(page, "/Contents")
+        contents = [serialize(c) for c in contents] if isinstance(contents, list) else [serialize(contents)]
+        resources = page["/Resources"].get_object()
+        xobjects = dict(resources.get("/XObject", {}))
+        entries = [key.encode() + b" " + serialize(value)
+                   for key, value in dict.items(page) if key not in ("/Contents", "/Resources")]
+        resource_entries = [key.encode() + b" " + serialize(value)
+                            for key, value in dict.items(resources) if key != "/XObject"]
+        xobject_entries = [key.encode() + b" " + serialize(value) for key, value in xobjects.items()]
+        xobject_entries.append(b"/Overlay %d 0 R" % self.overlay_num)
+        resource_entries.append(b"/XObject << %s >>" % b" ".join(xobject_entries))
+        entries.append(b"/Resources << %s >>" % b" ".join(resource_entries))
+        entries.append(b"/Contents [ %d 0 R %s %d 0 R ]" % (self.open_num, b" ".join(contents), self.close_num))
+        self.page_object = b"%d %d obj\n<< %s >>\nendobj\n" % (*self.page_ref, b" ".join(entries))
+        self.open_object = b"%d 0 obj\n<< /Length 1 >>\nstream\nq\nendstream\nendobj\n" % self.open_num
+        close = b"Q /Overlay Do"
+        self.close_object = b"%d 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (
+            self.close_num, len(close), close)
+
+        extras = [b"/Root " + serialize(trailer.raw_get("/Root"))]
+        for key in ("/Info", "/ID"):
+            if key in trailer:
+                extras.append(key.encode() + b" " + serialize(trailer.raw_get(key)))
+        self.trailer_entries = b" ".join(extras)
+
+    def stamp(self, overlay: TextOverlay) -> bytes:
+        """The template with `overlay` drawn over its page"""
+        content = overlay.content()
+        output = bytearray(self.base)
+        offsets = {}
+        offsets[self.open_num] = len(output)
+        output += self.open_object
+        offsets[self.close_num] = len(output)
+        output += self.close_object
+        offsets[self.overlay_num] = len(output)
+        output += b"%d 0 obj\n<< /Type /XObject /Subtype /Form /BBox [ 0 0 %s %s ] /Resources %s /Length %d >>\nstream\n" % (
+            self.overlay_num, pdf_number(self.page_size[0]), pdf_number(self.page_size[1]),
+            overlay.resources(), len(content))
+        output += content + b"\nendstream\nendobj\n"
+        offsets[self.page_ref[0]] = len(output)
+        output += self.page_object
+
+        xref_at = len(output)
+        # The free list head comes first, as readers expect a table to start at object 0
+        output += b"xref\n0 1\n0000000000 65535 f \n%d 1\n%010d %05d n \n%d 3\n" % (
+            self.page_ref[0], offsets[self.page_ref[0]], self.page_ref[1], self.open_num)
+        for num in (self.open_num, self.close_num, self.overlay_num):
+            output += b"%010d 00000 n \n" % offsets[num]
+        output += b"trailer\n<< /Size %d %s /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (
+            self.overlay_num + 1, self.trailer_entries, self.prev_xref, xref_at)
+        return bytes(output)
@@ -0,0 +1,143 @@
+# In-memory throttling of access code guesses (per worker process)
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Code verification attempts allowed per client IP, per minute (burst: attempts in a row)
+CODE_ATTEMPTS_PER_MINUTE = float(os.environ.get('CODE_ATTEMPTS_PER_MINUTE', '30'))
+CODE_ATTEMPTS_BURST = int(os.environ.get('CODE_ATTEMPTS_BURST', '20'))
+# Same, per code prefix: slows down guessing spread over many addresses
+CODE_PREFIX_LENGTH = int(os.environ.get('CODE_PREFIX_LENGTH', '3'))
+CODE_PREFIX_ATTEMPTS_PER_MINUTE = float(os.environ.get('CODE_PREFIX_ATTEMPTS_PER_MINUTE', '60'))
+CODE_PREFIX_ATTEMPTS_BURST = int(os.environ.get('CODE_PREFIX_ATTEMPTS_BURST', '30'))
+# How long a refused code is answered from memory
+REFUSED_CODE_TTL_SECONDS = float(os.environ.get('REFUSED_CODE_TTL_SECONDS', '30'))
+# Reverse proxies (addresses or networks, comma separated) whose X-Forwarded-For is believed.
+# Behind an ingress, set it to the ingress addresses or every visitor shares the proxy's buckets.
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '')
+
+# Bound on tracked keys, so a flood of distinct keys cannot exhaust memory
+MAX_TRACKED_KEYS = 10000
+
+
+def parse_networks(value: str) -> list:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+TRUSTED_PROXY_NETWORKS = parse_networks(TRUSTED_PROXIES)
+
+
+def is_trusted_proxy(address: str, networks: list) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def forwarded_client(peer: str, forwarded_for: Optional[str], networks: list = TRUSTED_PROXY_NETWORKS) -> str:
+    """Client address behind trusted proxies: the nearest X-Forwarded-For hop that is not one of them.
+
+    The header is ignored unless the connection itself comes from a trusted
+    proxy, since any client can send it.
+    """
+    if not forwarded_for or not is_trusted_proxy(peer, networks):
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop, networks):
+            return hop
+    return hops[0] if hops else peer
+
+
+class RateLimiter:
+    """Token buckets keyed by client: `per_minute` tokens a minute, at most `burst` saved up"""
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = MAX_TRACKED_KEYS):
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self.buckets = {}  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Take a token for `key`, False when its bucket is empty"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self.buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until `key` gets a token back"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or self.rate <= 0:
+                return 0.0
+            tokens = bucket[0] + (now - bucket[1]) * self.rate
+            return max(0.0, (1 - tokens) / self.rate)
+
+    def _prune(self, now: float):
+        # Refilled buckets behave like new ones: drop them, then the oldest if still full
+        refill = self.burst / self.rate if self.rate > 0 else float("inf")
+        self.buckets = {k: b for k, b in self.buckets.items() if now - b[1] < refill}
+        if len(self.buckets) >= self.max_keys:
+            oldest = sorted(self.buckets, key=lambda k: self.buckets[k][1])
+            for key in oldest[:len(oldest) // 2]:
+                del self.buckets[key]
+
+
+class NegativeCache:
+    """Recently refused keys, forgotten after `ttl` seconds"""
+
+    def __init__(self, ttl: float, max_entries: int = MAX_TRACKED_KEYS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> expiry, oldest first
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        return self.contains(key)
+
+    def contains(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires <= now:
+                del self.entries[key]
+                return False
+            return True
+
+    def add(self, key: str, now: Optional[float] = None):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.entries[key] = now + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+def code_prefix(code: str) -> str:
+    """Bucket key shared by all codes starting alike"""
+    return code[:CODE_PREFIX_LENGTH].upper()
@@ -0,0 +1,139 @@
+# Watermarked documents kept on disk per access code, dropped when the code lapses or is revoked
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Total size of the cached documents (least recently served dropped first)
+RENDER_CACHE_MB = float(os.environ.get('RENDER_CACHE_MB', '512'))
+
+
+class RenderCache:
+    """Watermarked output PDFs under `directory/<code id>/<document id>-<version>.pdf`.
+
+    The version is taken from the original file, so a replaced original is
+    rendered again. Serving a cached file touches its mtime, which orders
+    eviction once the cache outgrows RENDER_CACHE_MB. All calls block.
+    """
+
+    def __init__(self, directory: Path, max_mb: float = RENDER_CACHE_MB):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.size = None  # total bytes on disk, counted on first write
+        self._lock = threading.Lock()
+
+    def path(self, code_id: str, document_id: str, version: str) -> Path:
+        return self.directory / code_id / f"{document_id}-{version}.pdf"
+
+    def get(self, code_id: str, document_id: str, version: str) -> Optional[bytes]:
+        """Cached output, None if this document was not rendered for the code yet"""
+        handle = self.open(code_id, document_id, version)
+        if handle is None:
+            return None
+        with handle:
+            return handle.read()
+
+    def open(self, code_id: str, document_id: str, version: str) -> Optional[BinaryIO]:
+        """Cached output opened for reading (the caller closes it), None if not rendered yet.
+
+        An open file stays readable even if the output is evicted or dropped meanwhile.
+        """
+        path = self.path(code_id, document_id, version)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return handle
+
+    def temp_path(self, code_id: str, document_id: str, version: str) -> Path:
+        """Where to write an output before `commit` (possibly from another process)"""
+        path = self.path(code_id, document_id, version)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside then renamed, so readers never see a partial file
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    def commit(self, tmp: Path, code_id: str, document_id: str, version: str) -> BinaryIO:
+        """Move a written output into place, return it opened for reading"""
+        path = self.path(code_id, document_id, version)
+        os.replace(tmp, path)
+        handle = open(path, 'rb')
+        size = os.fstat(handle.fileno()).st_size
+
+        with self._lock:
+            if self.size is None:
+                self.size = self._disk_usage()
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self._evict()
+        return handle
+
+    def put(self, code_id: str, document_id: str, version: str, content: bytes):
+        """Store an output, then evict the least recently served if over size"""
+        tmp = self.temp_path(code_id, document_id, version)
+        tmp.write_bytes(content)
+        self.commit(tmp, code_id, document_id, version).close()
+
+    def drop_code(self, code_id: str):
+        """Remove everything rendered for a code (revoked, edited or lapsed)"""
+        shutil.rmtree(self.directory / code_id, ignore_errors=True)
+        with self._lock:
+            self.size = None
+
+    def retain(self, code_ids: Iterable[str]) -> int:
+        """Remove the outputs of every code not in `code_ids`, return how many codes were dropped"""
+        keep = set(code_ids)
+        if not self.directory.exists():
+            return 0
+        dropped = [entry.name for entry in os.scandir(self.directory)
+                   if entry.is_dir() and entry.name not in keep]
+        for code_id in dropped:
+            self.drop_code(code_id)
+        if dropped:
+            logger.info(f"Dropped cached documents of {len(dropped)} inactive access code(s)")
+        return len(dropped)
+
+    def _files(self) -> list:
+        """(mtime, size, path) of every cached output"""
+        files = []
+        if not self.directory.exists():
+            return files
+        for code_dir in os.scandir(self.directory):
+            if not code_dir.is_dir():
+                continue
+            try:
+                entries = list(os.scandir(code_dir.path))
+            except FileNotFoundError:
+                continue  # dropped meanwhile
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue  # being written
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+        return files
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        # Other workers share the directory: evict from what is on disk, not from memory
+        files = sorted(self._files())
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
+        logger.info(f"Render cache trimmed to {self.size // 1024} KiB")
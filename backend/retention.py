@@ -0,0 +1,77 @@
+# Retention policy: old raw events are collapsed into per-day rollup counters
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from access_log import LOG_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Handled code requests older than this many days are rolled up (0 keeps everything)
+CODE_REQUEST_RETENTION_DAYS = int(os.environ.get('CODE_REQUEST_RETENTION_DAYS', '180'))
+# How often the server applies the retention policy
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', '3600'))
+
+# Document entry holding the code request rollups: {day: counters}
+CODE_REQUEST_ROLLUPS = "code_request_rollups"
+
+
+def rollup_code_requests(store, before: datetime) -> int:
+    """Collapse handled code requests created before `before` into daily counters.
+
+    Pending requests are never dropped. The requests and their rollups are
+    replaced in one atomic mutation.
+    """
+    removed = []
+
+    def collapse(data):
+        kept = []
+        rollups = {day: {**counters, "by_status": dict(counters["by_status"]),
+                         "by_parcelle": dict(counters["by_parcelle"])}
+                   for day, counters in (data.get(CODE_REQUEST_ROLLUPS) or {}).items()}
+        for req in data.get("code_requests", []):
+            created_at = req.get("created_at", "")
+            try:
+                expired = datetime.fromisoformat(created_at) < before
+            except (TypeError, ValueError):
+                expired = False
+            if not expired or req.get("status") == "pending":
+                kept.append(req)
+                continue
+            day = rollups.setdefault(created_at[:10], {"count": 0, "by_status": {}, "by_parcelle": {}})
+            day["count"] += 1
+            status = req.get("status", "unknown")
+            parcelle = req.get("parcelle_id", "Unknown")
+            day["by_status"][status] = day["by_status"].get(status, 0) + 1
+            day["by_parcelle"][parcelle] = day["by_parcelle"].get(parcelle, 0) + 1
+            removed.append(req)
+        if not removed:
+            return None
+        return {"code_requests": kept, CODE_REQUEST_ROLLUPS: rollups}
+
+    store.set_many(collapse)
+    if removed:
+        logger.info(f"Rolled up {len(removed)} code request(s) created before {before.date()}")
+    return len(removed)
+
+
+def code_request_totals(data: dict) -> dict:
+    """Rolled-up code request counts: {"total": n, "by_status": {...}}"""
+    totals = {"total": 0, "by_status": {}}
+    for counters in (data.get(CODE_REQUEST_ROLLUPS) or {}).values():
+        totals["total"] += counters["count"]
+        for status, count in counters["by_status"].items():
+            totals["by_status"][status] = totals["by_status"].get(status, 0) + count
+    return totals
+
+
+def apply_retention(store, access_log, now: Optional[datetime] = None) -> dict:
+    """Apply the configured retention to download logs and code requests"""
+    now = now or datetime.now(timezone.utc)
+    result = {"download_logs": 0, "code_requests": 0}
+    if LOG_RETENTION_DAYS > 0:
+        result["download_logs"] = access_log.expire(now - timedelta(days=LOG_RETENTION_DAYS))
+    if CODE_REQUEST_RETENTION_DAYS > 0:
+        result["code_requests"] = rollup_code_requests(store, now - timedelta(days=CODE_REQUEST_RETENTION_DAYS))
+    return result
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Response, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Response, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse
@@ -6,11 +6,16 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, EmailStr
 import os
-import json
+import asyncio
+import csv
+import hashlib
 import logging
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, List, Optional
+import math
 import uuid
+import time
 import secrets
 import string
 from datetime import datetime, timezone, timedelta
@@ -19,26 +24,76 @@ import bcrypt
 import shutil
 import zipfile
 import xml.etree.ElementTree as ET
-from io import BytesIO
-from watermark import create_placeholder_acd_pdf, create_placeholder_plan_pdf, add_watermark_to_pdf
+from io import BytesIO, StringIO
+import aiofiles
+from watermark import create_placeholder_acd_pdf, create_placeholder_plan_pdf, add_watermark_to_file, count_pages
 from email_service import send_document_email
+from data_store import DataStore
+from access_log import AccessLog, LogBatcher, import_document_logs
+from retention import apply_retention, code_request_totals, RETENTION_INTERVAL_SECONDS
+from usage import UsageCounters
+from render_cache import RenderCache
+from file_responses import FILE_CHUNK_BYTES, conditional_file_response, file_sha256, is_range_continuation, strong_etag
+from expiry import code_is_live, sweep_expired_codes, seconds_until_next_sweep
+from rate_limit import (
+    RateLimiter, NegativeCache, code_prefix, forwarded_client, REFUSED_CODE_TTL_SECONDS,
+    CODE_ATTEMPTS_PER_MINUTE, CODE_ATTEMPTS_BURST, CODE_PREFIX_ATTEMPTS_PER_MINUTE, CODE_PREFIX_ATTEMPTS_BURST
+)
+from storage import create_storage
+from executors import io_executor, run_io, run_cpu, PoolBusy, shutdown_executors
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Data file paths
 DATA_FILE = ROOT_DIR / 'data' / 'parcelles.json'
+LOGS_DIR = Path(os.environ.get('LOGS_DIR', str(ROOT_DIR / 'data' / 'logs')))
+RENDER_CACHE_DIR = Path(os.environ.get('RENDER_CACHE_DIR', str(ROOT_DIR / 'data' / 'render_cache')))
 UPLOADS_DIR = ROOT_DIR / 'uploads'
 DOCUMENTS_DIR = ROOT_DIR / 'documents'
 UPLOADS_DIR.mkdir(exist_ok=True)
 DOCUMENTS_DIR.mkdir(exist_ok=True)
 
+# Process-resident data store; persistence backend chosen by STORAGE_BACKEND
+# Reloads after another worker's snapshot run in the I/O pool, not on the event loop
+store = DataStore(create_storage(DATA_FILE), executor=io_executor)
+
+# Download/access logs live in their own rotating segments, not in the document
+access_log = AccessLog(LOGS_DIR)
+# Request handlers queue log entries; a background task writes them in batches
+log_batcher = LogBatcher(access_log)
+# Access code usage is counted in memory and added to the code records periodically
+usage_counters = UsageCounters(store)
+# Watermarked documents are rendered once per code and served from disk afterwards
+render_cache = RenderCache(RENDER_CACHE_DIR)
+
+# Code guesses are throttled and recently refused codes answered from memory
+code_attempts_by_client = RateLimiter(CODE_ATTEMPTS_PER_MINUTE, CODE_ATTEMPTS_BURST)
+code_attempts_by_prefix = RateLimiter(CODE_PREFIX_ATTEMPTS_PER_MINUTE, CODE_PREFIX_ATTEMPTS_BURST)
+refused_codes = NegativeCache(REFUSED_CODE_TTL_SECONDS)
+
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET')
 if not JWT_SECRET:
     raise ValueError("JWT_SECRET environment variable must be set")
 JWT_ALGORITHM = 'HS256'
+# Most codes a single bulk generation may create
+BULK_ACCESS_CODES_MAX = int(os.environ.get('BULK_ACCESS_CODES_MAX', '1000'))
 JWT_EXPIRATION_HOURS = 24
+# Documents are sent to clients in chunks of this size
+PDF_CHUNK_BYTES = 64 * 1024
+# Watermarked previews hold the first pages only (0: the whole document); full=true asks for every page
+PREVIEW_PAGES = int(os.environ.get('PREVIEW_PAGES', '2'))
+# Page counts of originals remembered per path and version, for the preview headers
+PAGE_COUNT_CACHE_SIZE = 1024
+# Download logs listed per admin request by default, and at most
+DOWNLOAD_LOGS_PAGE_SIZE = int(os.environ.get('DOWNLOAD_LOGS_PAGE_SIZE', '100'))
+DOWNLOAD_LOGS_MAX_PAGE_SIZE = 1000
+# Viewer sessions issued after a code verification (never outlive the code)
+VIEWER_SESSION_MINUTES = int(os.environ.get('VIEWER_SESSION_MINUTES', '60'))
+# Document entry listing revoked viewer sessions: {code_id: revocation stamp}.
+# Sessions carry the stamp current when they were issued; a new stamp refuses them.
+REVOKED_SESSIONS = "revoked_viewer_sessions"
 
 # Create the main app
 app = FastAPI(title="Songon Extension API", version="1.1.0")
@@ -147,6 +202,18 @@ class AccessCodeCreate(BaseModel):
     camera_enabled: bool = False  # Global camera access (legacy)
     parcelle_configs: Optional[List[ParcelleConfig]] = None  # Per-parcelle config for PROPRIETAIRE
 
+class BulkClient(BaseModel):
+    client_name: str
+    client_email: str
+    parcelle_ids: Optional[List[str]] = None  # None = the batch's parcelle_ids
+
+class AccessCodeBulkCreate(BaseModel):
+    """Codes for a list of clients sharing the same settings (sales campaigns)"""
+    clients: List[BulkClient]
+    parcelle_ids: List[str] = []  # Empty = all parcelles
+    expires_hours: int = 72
+    profile_type: str = "PROSPECT"
+
 class AccessCodeVerify(BaseModel):
     code: str
     parcelle_id: str
@@ -167,52 +234,36 @@ class CodeAccessRequest(BaseModel):
 # ==================== HELPERS ====================
 
 def load_data():
-    """Load data from JSON file"""
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # Ensure required fields exist
-            if "access_codes" not in data:
-                data["access_codes"] = []
-            if "download_logs" not in data:
-                data["download_logs"] = []
-            if "code_requests" not in data:
-                data["code_requests"] = []
-            return data
-    except FileNotFoundError:
-        return {
-            "parcelles": [], 
-            "config": {"map_center": [-4.287, 5.345], "map_zoom": 15}, 
-            "admin": {},
-            "access_codes": [],
-            "download_logs": [],
-            "code_requests": []
-        }
+    """Return the in-memory data document"""
+    return store.get()
 
-def save_data(data):
-    """Save data to JSON file"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def create_token(username: str) -> str:
-    """Create JWT token"""
+def create_token(subject: str, expires_at: Optional[datetime] = None, **claims) -> str:
+    """Create JWT token (admin session unless extra claims say otherwise)"""
+    now = datetime.now(timezone.utc)
     payload = {
-        "sub": username,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS),
-        "iat": datetime.now(timezone.utc)
+        "sub": subject,
+        "exp": expires_at or now + timedelta(hours=JWT_EXPIRATION_HOURS),
+        "iat": now,
+        **claims
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    """Verify JWT token"""
+def decode_token(token: str) -> dict:
+    """Check a JWT signature and expiry, return its claims"""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload["sub"]
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expiré")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token invalide")
 
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Verify JWT token (admin sessions only)"""
+    payload = decode_token(credentials.credentials)
+    if payload.get("typ") == "viewer":
+        raise HTTPException(status_code=401, detail="Token invalide")
+    return payload["sub"]
+
 def generate_access_code(length: int = 8) -> str:
     """Generate a unique access code"""
     chars = string.ascii_uppercase + string.digits
@@ -220,29 +271,232 @@ def generate_access_code(length: int = 8) -> str:
     chars = chars.replace('O', '').replace('0', '').replace('I', '').replace('1', '').replace('L', '')
     return ''.join(secrets.choice(chars) for _ in range(length))
 
-def verify_access_code(code: str, parcelle_id: str) -> dict:
-    """Verify an access code and return code info if valid"""
-    data = load_data()
-    access_codes = data.get("access_codes", [])
-    
-    for ac in access_codes:
-        if ac["code"] == code.upper() and ac["active"]:
-            # Check expiration
-            expires_at = datetime.fromisoformat(ac["expires_at"])
-            if expires_at < datetime.now(timezone.utc):
-                return None
-            
-            # Check parcelle access
-            if ac["parcelle_ids"] and parcelle_id not in ac["parcelle_ids"]:
-                return None
-            
-            return ac
+def client_ip(request: Request) -> str:
+    """Address of the caller, taken from X-Forwarded-For when it comes through TRUSTED_PROXIES"""
+    peer = request.client.host if request.client else "unknown"
+    return forwarded_client(peer, request.headers.get("x-forwarded-for"))
+
+def throttle_code_attempt(client: str, code: str):
+    """Refuse a code attempt once the client or the code prefix ran out of tokens"""
+    for limiter, key in ((code_attempts_by_client, client), (code_attempts_by_prefix, code_prefix(code))):
+        if not limiter.allow(key):
+            logger.warning(f"Code attempts throttled for {key}")
+            raise HTTPException(
+                status_code=429,
+                detail="Trop de tentatives, veuillez réessayer plus tard",
+                headers={"Retry-After": str(math.ceil(limiter.retry_after(key)))}
+            )
+
+def verify_access_code(code: str, parcelle_id: Optional[str] = None, client: Optional[str] = None) -> dict:
+    """Verify an access code and return code info if valid (for this parcelle, if given).
+
+    Attempts from a `client` are rate limited; refused codes are remembered
+    for a short while so repeated guesses never reach the store.
+    """
+    code = code.upper()
+    if client is not None:
+        throttle_code_attempt(client, code)
+    if code in refused_codes:
+        return None
+    
+    ac = store.lookup("access_codes", "code", code)
+    # Inactive or lapsed (expiry parsed once, kept by the store)
+    if not ac or not code_is_live(store, ac):
+        refused_codes.add(code)
+        return None
+    
+    # Check parcelle access
+    if parcelle_id is not None and ac["parcelle_ids"] and parcelle_id not in ac["parcelle_ids"]:
+        return None
+    
+    return ac
+
+def create_viewer_session(access_code: dict) -> dict:
+    """Signed session carrying a verified code's entitlements"""
+    expires_at = min(
+        datetime.now(timezone.utc) + timedelta(minutes=VIEWER_SESSION_MINUTES),
+        datetime.fromtimestamp(store.expiry("access_codes", access_code["id"]), timezone.utc)
+    )
+    is_owner = access_code.get("profile_type", "PROSPECT") == "PROPRIETAIRE"
+    camera_default = is_owner and access_code.get("camera_enabled", False)
+    camera = {pid: parcelle_camera_enabled(access_code, pid)
+              for pid in access_code.get("parcelle_configs", {})} if is_owner else {}
+    token = create_token(
+        access_code["id"], expires_at,
+        typ="viewer",
+        code=access_code["code"],
+        name=access_code["client_name"],
+        profile=access_code.get("profile_type", "PROSPECT"),
+        parcelles=access_code.get("parcelle_ids", []),
+        camera=camera,
+        camera_default=camera_default,
+        code_exp=access_code["expires_at"],
+        rev=load_data().get(REVOKED_SESSIONS, {}).get(access_code["id"])
+    )
+    return {"session_token": token, "session_expires_at": expires_at.isoformat()}
+
+def verify_viewer_session(token: str, parcelle_id: Optional[str] = None) -> Optional[dict]:
+    """Code info carried by a viewer session, None if it does not cover the parcelle"""
+    payload = decode_token(token)
+    if payload.get("typ") != "viewer":
+        raise HTTPException(status_code=401, detail="Token invalide")
     
-    return None
+    # Sessions issued before their code was last revoked or edited are refused
+    # (compared by stamp, not by time: iat only has a one-second resolution)
+    stamp = load_data().get(REVOKED_SESSIONS, {}).get(payload["sub"])
+    if stamp is not None and payload.get("rev") != stamp:
+        raise HTTPException(status_code=401, detail="Session révoquée")
+    
+    if parcelle_id is not None and payload["parcelles"] and parcelle_id not in payload["parcelles"]:
+        return None
+    
+    return {
+        "id": payload["sub"],
+        "code": payload["code"],
+        "client_name": payload["name"],
+        "profile_type": payload["profile"],
+        "parcelle_ids": payload["parcelles"],
+        "parcelle_configs": {pid: {"camera_enabled": enabled} for pid, enabled in payload["camera"].items()},
+        "camera_enabled": payload["camera_default"],
+        "expires_at": payload["code_exp"],
+        "session_token": token
+    }
+
+def authorize_viewer(
+    parcelle_id: Optional[str],
+    code: Optional[str] = None,
+    session: Optional[str] = None,
+    client: Optional[str] = None
+) -> Optional[dict]:
+    """Code info from a viewer session, or from the access code when no valid session is given"""
+    if session:
+        try:
+            return verify_viewer_session(session, parcelle_id)
+        except HTTPException:
+            if not code:
+                raise
+    if not code:
+        return None
+    return verify_access_code(code, parcelle_id, client)
+
+def parcelle_camera_enabled(access_info: dict, parcelle_id: str) -> bool:
+    """Camera access for one parcelle: its own config, else the code-wide (legacy) flag"""
+    config = access_info.get("parcelle_configs", {}).get(parcelle_id, {})
+    return config.get("camera_enabled", access_info.get("camera_enabled", False))
+
+def accessible_parcelles(access_info: dict) -> List[dict]:
+    """Parcelles opened by a code (an empty parcelle list opens all of them)"""
+    parcelle_ids = access_info.get("parcelle_ids", [])
+    if not parcelle_ids:
+        return load_data().get("parcelles", [])
+    return [p for p in (store.find("parcelles", pid) for pid in parcelle_ids) if p]
+
+def revoke_viewer_sessions(code_id: str):
+    """Refuse the sessions issued so far for a code (entries outlive sessions only briefly).
+
+    The stamp is the revocation time, kept unique per code so that two
+    revocations within the same clock tick still differ.
+    """
+    now = time.time()
+    horizon = now - VIEWER_SESSION_MINUTES * 60
+    store.set(REVOKED_SESSIONS, lambda current: {
+        **{cid: at for cid, at in (current or {}).items() if at > horizon},
+        code_id: max(now, (current or {}).get(code_id, 0) + 1e-6)
+    })
+
+async def render_pdf(func, *args, **kwargs) -> bytes:
+    """Render a PDF in the process pool, 503 while the pool is saturated"""
+    try:
+        return await run_cpu(func, *args, **kwargs)
+    except PoolBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Serveur occupé, veuillez réessayer dans quelques instants",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def watermarked_document(
+    access_info: dict,
+    doc_info: dict,
+    doc_path: Path,
+    max_pages: Optional[int] = None
+) -> BinaryIO:
+    """Watermarked copy of an original for a code, opened from the render cache (rendered there on first use).
+
+    With `max_pages`, a copy of the first pages only (cached apart from the full one).
+    """
+    stat = await run_io(doc_path.stat)
+    version = f"{stat.st_mtime_ns}-{stat.st_size}" + (f"-first{max_pages}" if max_pages else "")
+    cache_key = (access_info["id"], doc_info.get("id") or doc_path.stem, version)
+    handle = await run_io(render_cache.open, *cache_key)
+    if handle is None:
+        # The render worker writes the output straight into the cache, it never passes through this process
+        tmp = await run_io(render_cache.temp_path, *cache_key)
+        try:
+            await render_pdf(add_watermark_to_file, str(doc_path), access_info["client_name"], access_info["code"], str(tmp), max_pages)
+            handle = await run_io(render_cache.commit, tmp, *cache_key)
+        finally:
+            await run_io(tmp.unlink, missing_ok=True)
+    return handle
+
+page_counts = OrderedDict()
+
+async def document_page_count(doc_path: Path) -> int:
+    """Number of pages of an original, counted in the process pool once per version of the file"""
+    stat = await run_io(doc_path.stat)
+    key = (str(doc_path), stat.st_mtime_ns, stat.st_size)
+    count = page_counts.get(key)
+    if count is None:
+        count = await render_pdf(count_pages, str(doc_path))
+        page_counts[key] = count
+        while len(page_counts) > PAGE_COUNT_CACHE_SIZE:
+            page_counts.popitem(last=False)
+    return count
+
+async def read_and_close(handle: BinaryIO) -> bytes:
+    try:
+        return await run_io(handle.read)
+    finally:
+        handle.close()
+
+async def file_chunks(handle: BinaryIO):
+    """Chunks of an open file, read off the event loop; the file is closed at the end"""
+    try:
+        while True:
+            chunk = await run_io(handle.read, PDF_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
+
+def pdf_response(
+    pdf_content,
+    filename: str,
+    disposition: str,
+    client_name: str,
+    headers: Optional[dict] = None
+) -> StreamingResponse:
+    """PDF sent in PDF_CHUNK_BYTES chunks, from bytes or from an open file"""
+    if isinstance(pdf_content, (bytes, bytearray)):
+        size = len(pdf_content)
+        chunks = (bytes(pdf_content[i:i + PDF_CHUNK_BYTES]) for i in range(0, size, PDF_CHUNK_BYTES))
+    else:
+        size = os.fstat(pdf_content.fileno()).st_size
+        chunks = file_chunks(pdf_content)
+    return StreamingResponse(
+        chunks,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'{disposition}; filename="{filename}"',
+            "Content-Length": str(size),
+            "X-Watermark": f"Document pour {client_name}",
+            **(headers or {})
+        }
+    )
 
 def log_download(code: str, client_name: str, parcelle_id: str, document_type: str, document_name: str):
-    """Log a document download"""
-    data = load_data()
+    """Log a document download (queued, written in the background)"""
     log_entry = {
         "id": str(uuid.uuid4()),
         "code": code,
@@ -253,10 +507,19 @@ def log_download(code: str, client_name: str, parcelle_id: str, document_type: s
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "ip_address": "N/A"  # Would be populated from request in production
     }
-    data.setdefault("download_logs", []).append(log_entry)
-    save_data(data)
+    log_batcher.submit(log_entry)
+    access_code = store.lookup("access_codes", "code", code)
+    if access_code:
+        usage_counters.record(access_code["id"], document_type)
     logger.info(f"Document download logged: {client_name} - {document_name}")
 
+def remove_file(filepath: Path):
+    """Delete a file, logging (not raising) failures"""
+    try:
+        filepath.unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning(f"Could not delete file {filepath}: {e}")
+
 def parse_kml_file(kml_content: str) -> List[dict]:
     """Parse KML content and extract polygons"""
     parcelles = []
@@ -372,11 +635,11 @@ async def get_parcelles():
 @api_router.get("/parcelles/{parcelle_id}")
 async def get_parcelle(parcelle_id: str):
     """Get a specific parcelle by ID"""
-    data = load_data()
-    for p in data.get("parcelles", []):
-        if p["id"] == parcelle_id:
-            return p
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    parcelle = store.find("parcelles", parcelle_id)
+    if not parcelle:
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    
+    return parcelle
 
 @api_router.get("/config")
 async def get_config():
@@ -418,57 +681,60 @@ DOCUMENT_TYPE_LABELS = {
     "autre": "Document"
 }
 
+def official_documents_summary(parcelle: dict) -> List[dict]:
+    """Available official documents of a parcelle, one entry per document type"""
+    available = []
+    for doc_type, doc_data in parcelle.get("official_documents", {}).items():
+        # Handle both single doc (dict) and multiple docs (list)
+        if isinstance(doc_data, list):
+            doc_list = doc_data
+        else:
+            doc_list = [doc_data]
+        
+        # Get latest upload date
+        latest_upload = max((d.get("uploaded_at", "") for d in doc_list), default="")
+        
+        available.append({
+            "type": doc_type,
+            "label": DOCUMENT_TYPE_LABELS.get(doc_type, doc_type.replace('_', ' ').title()),
+            "has_file": True,
+            "file_count": len(doc_list),
+            "uploaded_at": latest_upload,
+            "files": [{"id": d.get("id"), "name": d.get("original_name", d.get("filename"))} for d in doc_list]
+        })
+    return available
+
 @api_router.get("/parcelles/{parcelle_id}/documents")
 async def get_available_documents(parcelle_id: str):
     """Get list of available documents for a parcelle (public - shows what's available)"""
-    data = load_data()
-    for p in data.get("parcelles", []):
-        if p["id"] == parcelle_id:
-            official_docs = p.get("official_documents", {})
-            
-            # Build list of available documents - support both single and multiple files
-            available = []
-            for doc_type, doc_data in official_docs.items():
-                # Handle both single doc (dict) and multiple docs (list)
-                if isinstance(doc_data, list):
-                    doc_list = doc_data
-                else:
-                    doc_list = [doc_data]
-                
-                # Get latest upload date
-                latest_upload = max((d.get("uploaded_at", "") for d in doc_list), default="")
-                
-                available.append({
-                    "type": doc_type,
-                    "label": DOCUMENT_TYPE_LABELS.get(doc_type, doc_type.replace('_', ' ').title()),
-                    "has_file": True,
-                    "file_count": len(doc_list),
-                    "uploaded_at": latest_upload,
-                    "files": [{"id": d.get("id"), "name": d.get("original_name", d.get("filename"))} for d in doc_list]
-                })
-            
-            return {
-                "parcelle_id": parcelle_id,
-                "parcelle_nom": p.get("nom", ""),
-                "available_documents": available,
-                "total_count": len(available)
-            }
+    parcelle = store.find("parcelles", parcelle_id)
+    if not parcelle:
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    available = official_documents_summary(parcelle)
+    
+    return {
+        "parcelle_id": parcelle_id,
+        "parcelle_nom": parcelle.get("nom", ""),
+        "available_documents": available,
+        "total_count": len(available)
+    }
 
 @api_router.post("/documents/verify-code")
-async def verify_document_code(request: AccessCodeVerify):
+async def verify_document_code(request: AccessCodeVerify, http_request: Request):
     """Verify access code for documents"""
-    access_info = verify_access_code(request.code, request.parcelle_id)
+    access_info = verify_access_code(request.code, request.parcelle_id, client_ip(http_request))
     
     if not access_info:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
+    usage_counters.record(access_info["id"])
     
     return {
         "valid": True,
         "client_name": access_info["client_name"],
         "expires_at": access_info["expires_at"],
-        "parcelle_access": access_info["parcelle_ids"] or "all"
+        "parcelle_access": access_info["parcelle_ids"] or "all",
+        **create_viewer_session(access_info)
     }
 
 @api_router.post("/documents/request-access")
@@ -478,8 +744,6 @@ async def request_document_access(
     client_email: str = Form(...)
 ):
     """Request document access (public - creates a pending request)"""
-    data = load_data()
-    
     # Create access request (admin will approve and generate code)
     request_entry = {
         "id": str(uuid.uuid4()),
@@ -490,8 +754,7 @@ async def request_document_access(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    data.setdefault("access_requests", []).append(request_entry)
-    save_data(data)
+    await run_io(store.append, "access_requests", request_entry)
     
     return {
         "message": "Demande d'accès envoyée. Vous recevrez un code par email.",
@@ -502,23 +765,26 @@ async def request_document_access(
 async def get_document_with_watermark(
     parcelle_id: str,
     document_type: str,
-    code: str,
-    action: str = Query("preview", description="preview, download, or info")
+    http_request: Request,
+    code: Optional[str] = None,
+    session: Optional[str] = None,
+    action: Optional[str] = Query(None, description="preview, download, or info (none: the whole document, inline)"),
+    full: bool = Query(False, description="preview: every page, not only the first PREVIEW_PAGES")
 ):
-    """Get document with or without watermark based on profile type"""
-    access_info = verify_access_code(code, parcelle_id)
+    """Get document with or without watermark based on profile type.
+
+    Watermarked previews (action=preview, asked explicitly) hold the first
+    PREVIEW_PAGES pages; X-Page-Count gives the length of the document and
+    X-Preview-Pages what was sent.
+    """
+    access_info = authorize_viewer(parcelle_id, code, session, client_ip(http_request))
     
     if not access_info:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
+    code = access_info["code"]
     
     # Get parcelle info
-    data = load_data()
-    parcelle = None
-    for p in data.get("parcelles", []):
-        if p["id"] == parcelle_id:
-            parcelle = p
-            break
-    
+    parcelle = store.find("parcelles", parcelle_id)
     if not parcelle:
         raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
@@ -526,17 +792,24 @@ async def get_document_with_watermark(
     profile_type = access_info.get("profile_type", "PROSPECT")
     apply_watermark = profile_type == "PROSPECT"  # PROPRIETAIRE gets original documents
     
-    # Log the access
-    log_download(
-        code=code,
-        client_name=client_name,
-        parcelle_id=parcelle_id,
-        document_type=f"{document_type}{'_original' if not apply_watermark else ''}",
-        document_name=f"{document_type}_{parcelle_id}"
-    )
+    def log_access():
+        log_download(
+            code=code,
+            client_name=client_name,
+            parcelle_id=parcelle_id,
+            document_type=f"{document_type}{'_original' if not apply_watermark else ''}",
+            document_name=f"{document_type}_{parcelle_id}"
+        )
+    
+    # Log the access once per opening: a PDF viewer fetching further ranges of an original
+    # is not logged again when it gets a 206. Watermarked documents are always logged.
+    deferred_log = not apply_watermark and action != "info" and is_range_continuation(http_request)
+    if not deferred_log:
+        log_access()
     
     # If just requesting info
     if action == "info":
+        credential = f"session={session}" if session else f"code={code}"
         # Check if real document exists
         official_docs = parcelle.get("official_documents", {})
         has_real_doc = document_type in official_docs
@@ -551,12 +824,15 @@ async def get_document_with_watermark(
             "profile_type": profile_type,
             "has_watermark": apply_watermark,
             "timestamp": datetime.now(timezone.utc).isoformat(),
-            "download_url": f"/api/documents/{parcelle_id}/{document_type}?code={code}&action=download",
-            "preview_url": f"/api/documents/{parcelle_id}/{document_type}?code={code}&action=preview"
+            "download_url": f"/api/documents/{parcelle_id}/{document_type}?{credential}&action=download",
+            "preview_url": f"/api/documents/{parcelle_id}/{document_type}?{credential}&action=preview",
+            "full_preview_url": f"/api/documents/{parcelle_id}/{document_type}?{credential}&action=preview&full=true",
+            "preview_pages": PREVIEW_PAGES if apply_watermark else 0
         }
     
     # Check if real document exists
     official_docs = parcelle.get("official_documents", {})
+    page_headers = None  # page counts of a watermarked preview
     
     if document_type in official_docs:
         # Handle both single doc (dict) and multiple docs (list)
@@ -571,27 +847,37 @@ async def get_document_with_watermark(
             doc_path = Path(doc_info.get("path", ""))
             
             if doc_path.exists():
-                # Read original PDF
-                with open(doc_path, 'rb') as f:
-                    original_pdf = f.read()
-                
                 if apply_watermark:
                     # PROSPECT: Add watermark
                     try:
-                        pdf_content = add_watermark_to_pdf(original_pdf, client_name, code)
+                        max_pages = None
+                        if action == "preview" and not full and PREVIEW_PAGES > 0:
+                            page_count = await document_page_count(doc_path)
+                            if page_count > PREVIEW_PAGES:
+                                max_pages = PREVIEW_PAGES
+                            page_headers = {
+                                "X-Page-Count": str(page_count),
+                                "X-Preview-Pages": str(max_pages or page_count)
+                            }
+                        pdf_content = await watermarked_document(access_info, doc_info, doc_path, max_pages)
                         filename = f"{document_type.upper()}_{parcelle.get('nom', parcelle_id).replace(' ', '_')}_watermarked.pdf"
+                    except HTTPException:
+                        raise  # Rendering pool saturated: the client retries
                     except Exception as e:
                         logger.error(f"Error adding watermark: {e}")
                         # Fallback to placeholder if watermark fails
+                        page_headers = None
                         if document_type == "acd":
-                            pdf_content = create_placeholder_acd_pdf(
+                            pdf_content = await render_pdf(
+                                create_placeholder_acd_pdf,
                                 parcelle_nom=parcelle.get("nom", "Parcelle"),
                                 parcelle_ref=parcelle.get("reference_tf", "N/A"),
                                 client_name=client_name,
                                 access_code=code
                             )
                         else:
-                            pdf_content = create_placeholder_plan_pdf(
+                            pdf_content = await render_pdf(
+                                create_placeholder_plan_pdf,
                                 parcelle_nom=parcelle.get("nom", "Parcelle"),
                                 parcelle_ref=parcelle.get("reference_tf", "N/A"),
                                 superficie=parcelle.get("superficie", 0),
@@ -600,9 +886,22 @@ async def get_document_with_watermark(
                             )
                         filename = f"{document_type.upper()}_{parcelle.get('nom', parcelle_id).replace(' ', '_')}.pdf"
                 else:
-                    # PROPRIETAIRE: Return original document without watermark
-                    pdf_content = original_pdf
+                    # PROPRIETAIRE: Return original document without watermark, straight from the file
                     filename = f"{document_type.upper()}_{parcelle.get('nom', parcelle_id).replace(' ', '_')}_ORIGINAL.pdf"
+                    sha256 = doc_info.get("sha256") or await run_io(file_sha256, doc_path)
+                    response = await conditional_file_response(
+                        http_request,
+                        doc_path,
+                        etag=strong_etag(doc_info.get("id") or doc_path.stem, sha256),
+                        media_type="application/pdf",
+                        headers={
+                            "Content-Disposition": f'{"attachment" if action == "download" else "inline"}; filename="{filename}"',
+                            "X-Watermark": f"Document pour {client_name}"
+                        }
+                    )
+                    if deferred_log and response.status_code != 206:
+                        log_access()
+                    return response
             else:
                 raise HTTPException(status_code=404, detail="Fichier document non trouvé")
         else:
@@ -610,7 +909,8 @@ async def get_document_with_watermark(
     else:
         # Generate placeholder PDF with watermark
         if document_type == "acd":
-            pdf_content = create_placeholder_acd_pdf(
+            pdf_content = await render_pdf(
+                create_placeholder_acd_pdf,
                 parcelle_nom=parcelle.get("nom", "Parcelle"),
                 parcelle_ref=parcelle.get("reference_tf", "N/A"),
                 client_name=client_name,
@@ -618,7 +918,8 @@ async def get_document_with_watermark(
             )
             filename = f"ACD_{parcelle.get('nom', parcelle_id).replace(' ', '_')}_SPECIMEN.pdf"
         elif document_type == "plan":
-            pdf_content = create_placeholder_plan_pdf(
+            pdf_content = await render_pdf(
+                create_placeholder_plan_pdf,
                 parcelle_nom=parcelle.get("nom", "Parcelle"),
                 parcelle_ref=parcelle.get("reference_tf", "N/A"),
                 superficie=parcelle.get("superficie", 0),
@@ -629,29 +930,19 @@ async def get_document_with_watermark(
         else:
             raise HTTPException(status_code=400, detail="Type de document non supporté")
     
+    if deferred_log:
+        log_access()
+    
     # Return as streaming response
     if action == "download":
-        return StreamingResponse(
-            BytesIO(pdf_content),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "X-Watermark": f"Document pour {client_name}"
-            }
-        )
-    else:  # preview
-        return StreamingResponse(
-            BytesIO(pdf_content),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f'inline; filename="{filename}"',
-                "X-Watermark": f"Document pour {client_name}"
-            }
-        )
+        return pdf_response(pdf_content, filename, "attachment", client_name)
+    else:  # preview, or no action given
+        return pdf_response(pdf_content, filename, "inline", client_name, page_headers)
 
 
 @api_router.post("/documents/send")
 async def send_document(
+    http_request: Request,
     parcelle_id: str = Form(...),
     document_type: str = Form(...),
     code: str = Form(...),
@@ -659,7 +950,7 @@ async def send_document(
     recipient: str = Form(...)  # email address or phone number
 ):
     """Send document via email with PDF attachment"""
-    access_info = verify_access_code(code, parcelle_id)
+    access_info = verify_access_code(code, parcelle_id, client_ip(http_request))
     
     if not access_info:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
@@ -667,13 +958,7 @@ async def send_document(
     client_name = access_info["client_name"]
     
     # Get parcelle info
-    data = load_data()
-    parcelle = None
-    for p in data.get("parcelles", []):
-        if p["id"] == parcelle_id:
-            parcelle = p
-            break
-    
+    parcelle = store.find("parcelles", parcelle_id)
     if not parcelle:
         raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
@@ -693,14 +978,15 @@ async def send_document(
                 doc_path = Path(doc_info.get("path", ""))
                 
                 if doc_path.exists():
-                    with open(doc_path, 'rb') as f:
-                        original_pdf = f.read()
                     try:
-                        pdf_content = add_watermark_to_pdf(original_pdf, client_name, code)
+                        pdf_content = await read_and_close(await watermarked_document(access_info, doc_info, doc_path))
+                    except HTTPException:
+                        raise  # Rendering pool saturated: the client retries
                     except Exception as e:
                         logger.error(f"Error adding watermark: {e}")
                         # Fallback to placeholder
-                        pdf_content = create_placeholder_acd_pdf(
+                        pdf_content = await render_pdf(
+                            create_placeholder_acd_pdf,
                             parcelle_nom=parcelle.get("nom", "Parcelle"),
                             parcelle_ref=parcelle.get("reference_tf", "N/A"),
                             client_name=client_name,
@@ -713,14 +999,16 @@ async def send_document(
         else:
             # Generate placeholder PDF with watermark
             if document_type == "acd":
-                pdf_content = create_placeholder_acd_pdf(
+                pdf_content = await render_pdf(
+                    create_placeholder_acd_pdf,
                     parcelle_nom=parcelle.get("nom", "Parcelle"),
                     parcelle_ref=parcelle.get("reference_tf", "N/A"),
                     client_name=client_name,
                     access_code=code
                 )
             elif document_type == "plan":
-                pdf_content = create_placeholder_plan_pdf(
+                pdf_content = await render_pdf(
+                    create_placeholder_plan_pdf,
                     parcelle_nom=parcelle.get("nom", "Parcelle"),
                     parcelle_ref=parcelle.get("reference_tf", "N/A"),
                     superficie=parcelle.get("superficie", 0),
@@ -728,14 +1016,16 @@ async def send_document(
                     access_code=code
                 )
             elif document_type == "titre_foncier":
-                pdf_content = create_placeholder_acd_pdf(
+                pdf_content = await render_pdf(
+                    create_placeholder_acd_pdf,
                     parcelle_nom=parcelle.get("nom", "Parcelle"),
                     parcelle_ref=parcelle.get("reference_tf", "N/A"),
                     client_name=client_name,
                     access_code=code
                 )
             else:
-                pdf_content = create_placeholder_acd_pdf(
+                pdf_content = await render_pdf(
+                    create_placeholder_acd_pdf,
                     parcelle_nom=parcelle.get("nom", "Parcelle"),
                     parcelle_ref=parcelle.get("reference_tf", "N/A"),
                     client_name=client_name,
@@ -800,11 +1090,13 @@ async def send_document(
 
 @api_router.post("/surveillance/access")
 async def get_surveillance_access(
-    code: str = Form(...),
-    parcelle_id: str = Form(...)
+    http_request: Request,
+    parcelle_id: str = Form(...),
+    code: Optional[str] = Form(None),
+    session: Optional[str] = Form(None)
 ):
     """Get surveillance video access (PROPRIETAIRE only, per-parcelle config)"""
-    access_info = verify_access_code(code, parcelle_id)
+    access_info = authorize_viewer(parcelle_id, code, session, client_ip(http_request))
     
     if not access_info:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
@@ -814,23 +1106,20 @@ async def get_surveillance_access(
     if profile_type != "PROPRIETAIRE":
         raise HTTPException(status_code=403, detail="Accès réservé aux propriétaires")
     
-    # Get per-parcelle config, fallback to global config
-    parcelle_configs = access_info.get("parcelle_configs", {})
-    parcelle_config = parcelle_configs.get(parcelle_id, {})
-    
-    camera_enabled = parcelle_config.get("camera_enabled", access_info.get("camera_enabled", False))
-    video_url = parcelle_config.get("video_url") or access_info.get("video_url")
-    
     # Check if camera access is enabled for this parcelle
-    if not camera_enabled:
+    if not parcelle_camera_enabled(access_info, parcelle_id):
         raise HTTPException(status_code=403, detail="Accès caméra non activé pour cette parcelle")
     
+    # Camera URLs are not carried by viewer sessions
+    record = store.find("access_codes", access_info["id"]) or {}
+    video_url = record.get("parcelle_configs", {}).get(parcelle_id, {}).get("video_url") or record.get("video_url")
+    
     if not video_url:
         raise HTTPException(status_code=404, detail="Aucune URL de caméra configurée pour cette parcelle")
     
     # Log the surveillance access
     log_download(
-        code=code,
+        code=access_info["code"],
         client_name=access_info["client_name"],
         parcelle_id=parcelle_id,
         document_type="surveillance_video",
@@ -847,14 +1136,17 @@ async def get_surveillance_access(
 
 @api_router.post("/documents/verify-profile")
 async def verify_code_profile(
-    code: str = Form(...),
-    parcelle_id: str = Form(...)
+    http_request: Request,
+    parcelle_id: str = Form(...),
+    code: Optional[str] = Form(None),
+    session: Optional[str] = Form(None)
 ):
     """Verify code and return profile info (for frontend display logic)"""
-    access_info = verify_access_code(code, parcelle_id)
+    access_info = authorize_viewer(parcelle_id, code, session, client_ip(http_request))
     
     if not access_info:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
+    usage_counters.record(access_info["id"])
     
     profile_type = access_info.get("profile_type", "PROSPECT")
     
@@ -862,20 +1154,20 @@ async def verify_code_profile(
     is_expired = False
     days_remaining = None
     
-    expires_at = datetime.fromisoformat(access_info["expires_at"])
-    now = datetime.now(timezone.utc)
+    expires_at = store.expiry("access_codes", access_info["id"])
+    now = time.time()
     
     if profile_type == "PROSPECT":
         is_expired = expires_at < now
         if not is_expired:
-            days_remaining = (expires_at - now).days
-    
-    # Get per-parcelle config if PROPRIETAIRE
-    parcelle_configs = access_info.get("parcelle_configs", {})
-    parcelle_config = parcelle_configs.get(parcelle_id, {})
+            days_remaining = int((expires_at - now) // 86400)
     
     # Determine camera access for this specific parcelle
-    camera_enabled = parcelle_config.get("camera_enabled", access_info.get("camera_enabled", False))
+    camera_enabled = parcelle_camera_enabled(access_info, parcelle_id)
+    
+    # A verified code opens a new session, a valid session is kept
+    session_fields = ({"session_token": access_info["session_token"]} if "session_token" in access_info
+                      else create_viewer_session(access_info))
     
     return {
         "valid": True,
@@ -886,57 +1178,98 @@ async def verify_code_profile(
         "camera_enabled": camera_enabled if profile_type == "PROPRIETAIRE" else False,
         "show_watermark": profile_type == "PROSPECT",
         "can_access_surveillance": profile_type == "PROPRIETAIRE" and camera_enabled,
-        "parcelle_id": parcelle_id
+        "parcelle_id": parcelle_id,
+        **session_fields
     }
 
 @api_router.post("/documents/get-owner-parcelles")
 async def get_owner_parcelles(
+    http_request: Request,
     code: str = Form(...)
 ):
     """Get all parcelles accessible by a PROPRIETAIRE code with their configurations"""
-    data = load_data()
-    codes = data.get("access_codes", [])
-    parcelles = data.get("parcelles", [])
-    
-    # Find the access code
-    access_code = None
-    for ac in codes:
-        if ac["code"] == code.upper() and ac["active"]:
-            expires_at = datetime.fromisoformat(ac["expires_at"])
-            if expires_at > datetime.now(timezone.utc):
-                access_code = ac
-                break
+    access_code = verify_access_code(code, client=client_ip(http_request))
     
     if not access_code:
         raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
     
     profile_type = access_code.get("profile_type", "PROSPECT")
-    parcelle_ids = access_code.get("parcelle_ids", [])
     parcelle_configs = access_code.get("parcelle_configs", {})
     
     # Build list of accessible parcelles with their configs
-    accessible_parcelles = []
-    
-    for p in parcelles:
-        # Check if parcelle is accessible (empty list = all parcelles)
-        if not parcelle_ids or p["id"] in parcelle_ids:
-            config = parcelle_configs.get(p["id"], {})
-            accessible_parcelles.append({
-                "id": p["id"],
-                "nom": p.get("nom", p["id"]),
-                "type_projet": p.get("type_projet", ""),
-                "superficie": p.get("superficie", 0),
-                "statut": p.get("statut", "disponible"),
-                "camera_enabled": config.get("camera_enabled", access_code.get("camera_enabled", False)),
-                "has_video": bool(config.get("video_url") or access_code.get("video_url"))
-            })
+    parcelles = [{
+        "id": p["id"],
+        "nom": p.get("nom", p["id"]),
+        "type_projet": p.get("type_projet", ""),
+        "superficie": p.get("superficie", 0),
+        "statut": p.get("statut", "disponible"),
+        "camera_enabled": parcelle_camera_enabled(access_code, p["id"]),
+        "has_video": bool(parcelle_configs.get(p["id"], {}).get("video_url") or access_code.get("video_url"))
+    } for p in accessible_parcelles(access_code)]
     
     return {
         "client_name": access_code["client_name"],
         "profile_type": profile_type,
-        "parcelle_count": len(accessible_parcelles),
-        "parcelles": accessible_parcelles,
-        "is_multi_parcelle": len(accessible_parcelles) > 1
+        "parcelle_count": len(parcelles),
+        "parcelles": parcelles,
+        "is_multi_parcelle": len(parcelles) > 1
+    }
+
+@api_router.post("/documents/entitlements")
+async def get_code_entitlements(
+    http_request: Request,
+    code: Optional[str] = Form(None),
+    session: Optional[str] = Form(None)
+):
+    """Everything a code opens, per parcelle, in one call (profile, documents, surveillance)"""
+    access_info = authorize_viewer(None, code, session, client_ip(http_request))
+    
+    if not access_info:
+        raise HTTPException(status_code=403, detail="Code d'accès invalide ou expiré")
+    
+    profile_type = access_info.get("profile_type", "PROSPECT")
+    is_owner = profile_type == "PROPRIETAIRE"
+    # Camera URLs are not carried by viewer sessions
+    record = store.find("access_codes", access_info["id"]) or {}
+    
+    days_remaining = None
+    if profile_type == "PROSPECT":
+        days_remaining = int((store.expiry("access_codes", access_info["id"]) - time.time()) // 86400)
+    
+    parcelles = []
+    for p in accessible_parcelles(access_info):
+        camera_enabled = is_owner and parcelle_camera_enabled(access_info, p["id"])
+        documents = official_documents_summary(p)
+        parcelles.append({
+            "id": p["id"],
+            "nom": p.get("nom", p["id"]),
+            "type_projet": p.get("type_projet", ""),
+            "superficie": p.get("superficie", 0),
+            "statut": p.get("statut", "disponible"),
+            "show_watermark": not is_owner,
+            "camera_enabled": camera_enabled,
+            "has_video": is_owner and bool(record.get("parcelle_configs", {}).get(p["id"], {}).get("video_url")
+                                           or record.get("video_url")),
+            "can_access_surveillance": camera_enabled,
+            "documents": documents,
+            "document_count": sum(d["file_count"] for d in documents)
+        })
+    
+    # A verified code opens a new session, a valid session is kept
+    session_fields = ({"session_token": access_info["session_token"]} if "session_token" in access_info
+                      else create_viewer_session(access_info))
+    
+    return {
+        "valid": True,
+        "client_name": access_info["client_name"],
+        "profile_type": profile_type,
+        "expires_at": access_info["expires_at"],
+        "is_expired": False,
+        "days_remaining": days_remaining,
+        "parcelle_count": len(parcelles),
+        "is_multi_parcelle": len(parcelles) > 1,
+        "parcelles": parcelles,
+        **session_fields
     }
 
 # ==================== AUTH ROUTES ====================
@@ -970,18 +1303,11 @@ async def verify_auth(username: str = Depends(verify_token)):
 @api_router.put("/admin/parcelles/{parcelle_id}")
 async def update_parcelle(parcelle_id: str, update: ParcelleUpdate, username: str = Depends(verify_token)):
     """Update a parcelle (admin only)"""
-    data = load_data()
-    parcelles = data.get("parcelles", [])
-    
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            update_dict = update.model_dump(exclude_unset=True)
-            parcelles[i].update(update_dict)
-            data["parcelles"] = parcelles
-            save_data(data)
-            return parcelles[i]
+    if not store.find("parcelles", parcelle_id):
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    update_dict = update.model_dump(exclude_unset=True)
+    return await run_io(store.update, "parcelles", parcelle_id, update_dict)
 
 @api_router.patch("/admin/parcelles/{parcelle_id}/status")
 async def update_parcelle_status(parcelle_id: str, status_update: StatusUpdate, username: str = Depends(verify_token)):
@@ -989,17 +1315,11 @@ async def update_parcelle_status(parcelle_id: str, status_update: StatusUpdate,
     if status_update.statut not in ["disponible", "option", "vendu"]:
         raise HTTPException(status_code=400, detail="Statut invalide")
     
-    data = load_data()
-    parcelles = data.get("parcelles", [])
-    
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            parcelles[i]["statut"] = status_update.statut
-            data["parcelles"] = parcelles
-            save_data(data)
-            return {"id": parcelle_id, "statut": status_update.statut}
+    if not store.find("parcelles", parcelle_id):
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    await run_io(store.update, "parcelles", parcelle_id, {"statut": status_update.statut})
+    return {"id": parcelle_id, "statut": status_update.statut}
 
 @api_router.post("/admin/upload/image/{parcelle_id}")
 async def upload_image(
@@ -1020,26 +1340,19 @@ async def upload_image(
     filename = f"{parcelle_id}_{image_type}_{uuid.uuid4().hex[:8]}.{ext}"
     filepath = UPLOADS_DIR / filename
     
-    with open(filepath, 'wb') as f:
-        content = await file.read()
-        f.write(content)
-    
-    data = load_data()
-    parcelles = data.get("parcelles", [])
+    content = await file.read()
+    async with aiofiles.open(filepath, 'wb') as f:
+        await f.write(content)
     
     image_url = f"/uploads/{filename}"
     
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            if image_type == "photo":
-                parcelles[i].setdefault("photos", []).append(image_url)
-            else:
-                parcelles[i].setdefault("vues_drone", []).append(image_url)
-            data["parcelles"] = parcelles
-            save_data(data)
-            return {"url": image_url, "type": image_type}
+    if not store.find("parcelles", parcelle_id):
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    field = "photos" if image_type == "photo" else "vues_drone"
+    await run_io(store.update, "parcelles", parcelle_id,
+                 lambda current: {field: current.get(field, []) + [image_url]})
+    return {"url": image_url, "type": image_type}
 
 @api_router.delete("/admin/parcelles/{parcelle_id}/image")
 async def delete_image(
@@ -1049,30 +1362,19 @@ async def delete_image(
     username: str = Depends(verify_token)
 ):
     """Delete an image from a parcelle"""
-    data = load_data()
-    parcelles = data.get("parcelles", [])
+    parcelle = store.find("parcelles", parcelle_id)
+    if not parcelle:
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            if image_type == "photo" and image_url in p.get("photos", []):
-                parcelles[i]["photos"].remove(image_url)
-            elif image_type == "drone" and image_url in p.get("vues_drone", []):
-                parcelles[i]["vues_drone"].remove(image_url)
-            
-            data["parcelles"] = parcelles
-            save_data(data)
-            
-            try:
-                filename = image_url.split('/')[-1]
-                filepath = UPLOADS_DIR / filename
-                if filepath.exists():
-                    filepath.unlink()
-            except Exception as e:
-                logger.warning(f"Could not delete file: {e}")
-            
-            return {"deleted": image_url}
+    field = {"photo": "photos", "drone": "vues_drone"}.get(image_type)
+    if field and image_url in parcelle.get(field, []):
+        await run_io(store.update, "parcelles", parcelle_id,
+                     lambda current: {field: [u for u in current.get(field, []) if u != image_url]})
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    filename = image_url.split('/')[-1]
+    await run_io(remove_file, UPLOADS_DIR / filename)
+    
+    return {"deleted": image_url}
 
 @api_router.post("/admin/upload/document/{parcelle_id}")
 async def upload_official_document(
@@ -1098,60 +1400,55 @@ async def upload_official_document(
     filename = f"{document_type}_{doc_id}.pdf"
     filepath = parcelle_docs_dir / filename
     
-    with open(filepath, 'wb') as f:
-        content = await file.read()
-        f.write(content)
+    # Hashed as it is written, a chunk at a time, for the originals' ETag
+    sha256 = hashlib.sha256()
+    async with aiofiles.open(filepath, 'wb') as f:
+        while chunk := await file.read(FILE_CHUNK_BYTES):
+            sha256.update(chunk)
+            await f.write(chunk)
     
     # Update parcelle data
-    data = load_data()
-    parcelles = data.get("parcelles", [])
-    
     document_info = {
         "id": doc_id,
         "type": document_type,
         "filename": filename,
         "original_name": file.filename,
         "path": str(filepath),
+        "sha256": sha256.hexdigest(),
         "uploaded_at": datetime.now(timezone.utc).isoformat(),
         "uploaded_by": username
     }
     
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            # Initialize official_documents if not exists
-            if "official_documents" not in parcelles[i]:
-                parcelles[i]["official_documents"] = {}
-            
-            # Support multiple documents per type - store as list
-            if document_type not in parcelles[i]["official_documents"]:
-                parcelles[i]["official_documents"][document_type] = []
-            
-            # Handle migration from single doc to list
-            existing = parcelles[i]["official_documents"][document_type]
-            if isinstance(existing, dict):
-                parcelles[i]["official_documents"][document_type] = [existing]
-            
-            # Add new document to list
-            parcelles[i]["official_documents"][document_type].append(document_info)
-            
-            data["parcelles"] = parcelles
-            save_data(data)
-            
-            doc_count = len(parcelles[i]["official_documents"][document_type])
-            logger.info(f"Official document uploaded: {document_type} for parcelle {parcelle_id} (total: {doc_count})")
-            return {
-                "success": True,
-                "document_type": document_type,
-                "document_id": doc_id,
-                "filename": filename,
-                "total_docs": doc_count,
-                "message": f"Document {document_type.upper()} uploadé avec succès ({doc_count} fichier(s))"
-            }
+    def add_document(current):
+        # Copy so the stored parcelle is only changed through the store
+        official_docs = dict(current.get("official_documents", {}))
+        
+        # Support multiple documents per type - store as list
+        # (handles migration from single doc to list)
+        existing = official_docs.get(document_type, [])
+        if isinstance(existing, dict):
+            existing = [existing]
+        
+        # Add new document to list
+        official_docs[document_type] = existing + [document_info]
+        return {"official_documents": official_docs}
+    
+    updated = await run_io(store.update, "parcelles", parcelle_id, add_document)
+    if updated is None:
+        # Cleanup file if parcelle not found
+        await run_io(filepath.unlink, missing_ok=True)
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    # Cleanup file if parcelle not found
-    if filepath.exists():
-        filepath.unlink()
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    doc_count = len(updated["official_documents"][document_type])
+    logger.info(f"Official document uploaded: {document_type} for parcelle {parcelle_id} (total: {doc_count})")
+    return {
+        "success": True,
+        "document_type": document_type,
+        "document_id": doc_id,
+        "filename": filename,
+        "total_docs": doc_count,
+        "message": f"Document {document_type.upper()} uploadé avec succès ({doc_count} fichier(s))"
+    }
 
 @api_router.delete("/admin/document/{parcelle_id}/{document_type}")
 async def delete_official_document(
@@ -1161,78 +1458,62 @@ async def delete_official_document(
     username: str = Depends(verify_token)
 ):
     """Delete an official document from a parcelle. If document_id is provided, delete only that file."""
-    data = load_data()
-    parcelles = data.get("parcelles", [])
+    def drop_documents(current):
+        official_docs = dict(current.get("official_documents", {}))
+        docs = official_docs.get(document_type, [])
+        if isinstance(docs, dict):
+            docs = [docs]
+        # Remove one file by ID, or all documents of this type
+        docs = [d for d in docs if document_id and d.get("id") != document_id]
+        if docs:
+            official_docs[document_type] = docs
+        else:
+            official_docs.pop(document_type, None)
+        return {"official_documents": official_docs}
     
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            official_docs = p.get("official_documents", {})
-            if document_type in official_docs:
-                docs = official_docs[document_type]
-                
-                # Handle both single doc (dict) and multiple docs (list)
-                if isinstance(docs, dict):
-                    docs = [docs]
-                
-                if document_id:
-                    # Delete specific document by ID
-                    doc_to_delete = None
-                    for doc in docs:
-                        if doc.get("id") == document_id:
-                            doc_to_delete = doc
-                            break
-                    
-                    if not doc_to_delete:
-                        raise HTTPException(status_code=404, detail="Document non trouvé")
-                    
-                    # Delete file
-                    try:
-                        filepath = Path(doc_to_delete.get("path", ""))
-                        if filepath.exists():
-                            filepath.unlink()
-                    except Exception as e:
-                        logger.warning(f"Could not delete document file: {e}")
-                    
-                    # Remove from list
-                    docs = [d for d in docs if d.get("id") != document_id]
-                    
-                    if len(docs) == 0:
-                        del parcelles[i]["official_documents"][document_type]
-                    else:
-                        parcelles[i]["official_documents"][document_type] = docs
-                else:
-                    # Delete all documents of this type
-                    for doc in docs:
-                        try:
-                            filepath = Path(doc.get("path", ""))
-                            if filepath.exists():
-                                filepath.unlink()
-                        except Exception as e:
-                            logger.warning(f"Could not delete document file: {e}")
-                    
-                    del parcelles[i]["official_documents"][document_type]
-                
-                data["parcelles"] = parcelles
-                save_data(data)
-                
-                return {"success": True, "deleted": document_type, "document_id": document_id}
-            else:
-                raise HTTPException(status_code=404, detail="Document non trouvé")
+    parcelle = store.find("parcelles", parcelle_id)
+    if not parcelle:
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    official_docs = parcelle.get("official_documents", {})
+    if document_type in official_docs:
+        docs = official_docs[document_type]
+        
+        # Handle both single doc (dict) and multiple docs (list)
+        if isinstance(docs, dict):
+            docs = [docs]
+        
+        if document_id:
+            # Delete specific document by ID
+            docs_to_delete = [doc for doc in docs if doc.get("id") == document_id]
+            if not docs_to_delete:
+                raise HTTPException(status_code=404, detail="Document non trouvé")
+        else:
+            # Delete all documents of this type
+            docs_to_delete = docs
+        
+        await run_io(store.update, "parcelles", parcelle_id, drop_documents)
+        
+        # Delete files
+        for doc in docs_to_delete:
+            await run_io(remove_file, Path(doc.get("path", "")))
+        
+        return {"success": True, "deleted": document_type, "document_id": document_id}
+    else:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
 
 @api_router.get("/admin/documents/{parcelle_id}")
 async def get_parcelle_documents(parcelle_id: str, username: str = Depends(verify_token)):
     """Get all official documents for a parcelle"""
-    data = load_data()
-    for p in data.get("parcelles", []):
-        if p["id"] == parcelle_id:
-            return {
-                "parcelle_id": parcelle_id,
-                "parcelle_nom": p.get("nom", ""),
-                "official_documents": p.get("official_documents", {})
-            }
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    parcelle = store.find("parcelles", parcelle_id)
+    if not parcelle:
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    
+    return {
+        "parcelle_id": parcelle_id,
+        "parcelle_nom": parcelle.get("nom", ""),
+        "official_documents": parcelle.get("official_documents", {})
+    }
 
 @api_router.post("/admin/upload/kmz")
 async def upload_kmz(file: UploadFile = File(...), username: str = Depends(verify_token)):
@@ -1263,8 +1544,8 @@ async def upload_kmz(file: UploadFile = File(...), username: str = Depends(verif
             raise HTTPException(status_code=400, detail="Aucune parcelle trouvée dans le fichier")
         
         kmz_path = ROOT_DIR / 'data' / f"uploaded_{datetime.now().strftime('%Y%m%d_%H%M%S')}.kmz"
-        with open(kmz_path, 'wb') as f:
-            f.write(content)
+        async with aiofiles.open(kmz_path, 'wb') as f:
+            await f.write(content)
         
         return {
             "message": f"{len(new_parcelles)} parcelle(s) détectée(s)",
@@ -1279,49 +1560,37 @@ async def upload_kmz(file: UploadFile = File(...), username: str = Depends(verif
 async def import_parcelles(parcelles: List[dict], username: str = Depends(verify_token)):
     """Import parcelles from KMZ parsing"""
     data = load_data()
-    existing_parcelles = data.get("parcelles", [])
+    known_ids = {ep["id"] for ep in data.get("parcelles", [])}
     
+    new_parcelles = []
     for p in parcelles:
-        if not any(ep["id"] == p["id"] for ep in existing_parcelles):
-            existing_parcelles.append(p)
+        if p["id"] not in known_ids:
+            known_ids.add(p["id"])
+            new_parcelles.append(p)
     
-    data["parcelles"] = existing_parcelles
-    save_data(data)
+    if new_parcelles:
+        await run_io(store.extend, "parcelles", new_parcelles)
     
-    return {"imported": len(parcelles), "total": len(existing_parcelles)}
+    return {"imported": len(parcelles), "total": len(known_ids)}
 
 @api_router.delete("/admin/parcelles/{parcelle_id}")
 async def delete_parcelle(parcelle_id: str, username: str = Depends(verify_token)):
     """Delete a parcelle"""
-    data = load_data()
-    parcelles = data.get("parcelles", [])
-    
-    for i, p in enumerate(parcelles):
-        if p["id"] == parcelle_id:
-            deleted = parcelles.pop(i)
-            data["parcelles"] = parcelles
-            save_data(data)
-            return {"deleted": parcelle_id}
+    if not store.find("parcelles", parcelle_id):
+        raise HTTPException(status_code=404, detail="Parcelle non trouvée")
     
-    raise HTTPException(status_code=404, detail="Parcelle non trouvée")
+    await run_io(store.remove, "parcelles", parcelle_id)
+    return {"deleted": parcelle_id}
 
 @api_router.put("/admin/config")
 async def update_config(config: dict, username: str = Depends(verify_token)):
     """Update map configuration"""
-    data = load_data()
-    data["config"].update(config)
-    save_data(data)
-    return data["config"]
+    return await run_io(store.set, "config", lambda current: {**(current or {}), **config})
 
 # ==================== ACCESS CODE MANAGEMENT ====================
 
-@api_router.post("/admin/access-codes")
-async def create_access_code(request: AccessCodeCreate, username: str = Depends(verify_token)):
-    """Generate a new access code for a client (PROSPECT or PROPRIETAIRE)"""
-    data = load_data()
-    
-    code = generate_access_code()
-    
+def build_access_code(request: AccessCodeCreate, code: str, username: str) -> dict:
+    """New access code record for a client (PROSPECT or PROPRIETAIRE)"""
     # PROPRIETAIRE has permanent access (100 years), PROSPECT has limited time
     if request.profile_type == "PROPRIETAIRE":
         expires_at = datetime.now(timezone.utc) + timedelta(days=36500)  # ~100 years
@@ -1348,7 +1617,7 @@ async def create_access_code(request: AccessCodeCreate, username: str = Depends(
                     "camera_enabled": request.camera_enabled
                 }
     
-    code_entry = {
+    return {
         "id": str(uuid.uuid4()),
         "code": code,
         "client_name": request.client_name,
@@ -1365,9 +1634,17 @@ async def create_access_code(request: AccessCodeCreate, username: str = Depends(
         "video_url": request.video_url if request.profile_type == "PROPRIETAIRE" else None,
         "camera_enabled": request.camera_enabled if request.profile_type == "PROPRIETAIRE" else False
     }
+
+@api_router.post("/admin/access-codes")
+async def create_access_code(request: AccessCodeCreate, username: str = Depends(verify_token)):
+    """Generate a new access code for a client (PROSPECT or PROPRIETAIRE)"""
+    code = generate_access_code()
+    while store.lookup("access_codes", "code", code):
+        code = generate_access_code()
     
-    data.setdefault("access_codes", []).append(code_entry)
-    save_data(data)
+    code_entry = build_access_code(request, code, username)
+    await run_io(store.append, "access_codes", code_entry)
+    refused_codes.discard(code)
     
     logger.info(f"Access code generated for {request.client_name} ({request.profile_type}) with {len(request.parcelle_ids)} parcelle(s): {code}")
     
@@ -1375,24 +1652,141 @@ async def create_access_code(request: AccessCodeCreate, username: str = Depends(
         "code": code,
         "client_name": request.client_name,
         "profile_type": request.profile_type,
-        "expires_at": expires_at.isoformat(),
+        "expires_at": code_entry["expires_at"],
         "parcelle_access": request.parcelle_ids or "all",
         "parcelle_count": len(request.parcelle_ids),
-        "parcelle_configs": parcelle_configs
+        "parcelle_configs": code_entry["parcelle_configs"]
     }
 
+def parse_bulk_clients_csv(content: bytes) -> List[BulkClient]:
+    """Clients from a CSV file with client_name and client_email columns (, or ; separated).
+
+    An optional parcelle_ids column lists parcelle ids separated by spaces or |.
+    """
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Le fichier CSV doit être encodé en UTF-8")
+    
+    first_line = text.split('\n', 1)[0]
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    reader = csv.DictReader(text.splitlines(), delimiter=delimiter)
+    columns = {name.strip() for name in reader.fieldnames or []}
+    if not {"client_name", "client_email"} <= columns:
+        raise HTTPException(status_code=400, detail="Colonnes requises : client_name, client_email")
+    
+    clients = []
+    for line, row in enumerate(reader, start=2):
+        row = {(key or "").strip(): (value or "").strip() for key, value in row.items()}
+        if not any(row.values()):
+            continue
+        if not row.get("client_name") or not row.get("client_email"):
+            raise HTTPException(status_code=400, detail=f"Ligne {line} : nom ou email manquant")
+        parcelle_ids = row.get("parcelle_ids", "").replace('|', ' ').split()
+        clients.append(BulkClient(
+            client_name=row["client_name"],
+            client_email=row["client_email"],
+            parcelle_ids=parcelle_ids or None
+        ))
+    return clients
+
+async def create_access_codes_bulk(batch: AccessCodeBulkCreate, username: str, output: str):
+    """Create the batch's codes in one write, return them as JSON or as a CSV file"""
+    if not batch.clients:
+        raise HTTPException(status_code=400, detail="Aucun client fourni")
+    if len(batch.clients) > BULK_ACCESS_CODES_MAX:
+        raise HTTPException(status_code=400, detail=f"Maximum {BULK_ACCESS_CODES_MAX} codes par lot")
+    
+    def mint(data):
+        # Runs under the store lock: codes are unique against the stored ones and each other
+        taken = {ac["code"] for ac in data.get("access_codes", [])}
+        entries = []
+        for client in batch.clients:
+            code = generate_access_code()
+            while code in taken:
+                code = generate_access_code()
+            taken.add(code)
+            parcelle_ids = client.parcelle_ids if client.parcelle_ids is not None else batch.parcelle_ids
+            entries.append(build_access_code(AccessCodeCreate(
+                client_name=client.client_name,
+                client_email=client.client_email,
+                parcelle_ids=parcelle_ids,
+                expires_hours=batch.expires_hours,
+                profile_type=batch.profile_type
+            ), code, username))
+        return entries
+    
+    entries = await run_io(store.extend, "access_codes", mint)
+    for entry in entries:
+        refused_codes.discard(entry["code"])
+    
+    logger.info(f"{len(entries)} access codes generated in bulk ({batch.profile_type}) by {username}")
+    
+    rows = [{
+        "client_name": e["client_name"],
+        "client_email": e["client_email"],
+        "code": e["code"],
+        "profile_type": e["profile_type"],
+        "expires_at": e["expires_at"],
+        "parcelle_ids": " ".join(e["parcelle_ids"])
+    } for e in entries]
+    
+    if output != "csv":
+        return {"created": len(rows), "codes": rows}
+    
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    filename = f"codes_acces_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        BytesIO(buffer.getvalue().encode('utf-8-sig')),  # BOM: accents display correctly in Excel
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.post("/admin/access-codes/bulk")
+async def create_access_codes_from_list(
+    batch: AccessCodeBulkCreate,
+    output: str = Query("json", description="json, or csv for a downloadable file"),
+    username: str = Depends(verify_token)
+):
+    """Generate access codes for a list of clients, persisted in a single write"""
+    return await create_access_codes_bulk(batch, username, output)
+
+@api_router.post("/admin/access-codes/bulk/csv")
+async def create_access_codes_from_csv(
+    file: UploadFile = File(...),
+    parcelle_ids: str = Form(""),
+    expires_hours: int = Form(72),
+    profile_type: str = Form("PROSPECT"),
+    output: str = Query("csv", description="csv (downloadable file) or json"),
+    username: str = Depends(verify_token)
+):
+    """Generate access codes for the clients listed in an uploaded CSV file"""
+    batch = AccessCodeBulkCreate(
+        clients=parse_bulk_clients_csv(await file.read()),
+        parcelle_ids=parcelle_ids.replace(',', ' ').split(),
+        expires_hours=expires_hours,
+        profile_type=profile_type
+    )
+    return await create_access_codes_bulk(batch, username, output)
+
 @api_router.get("/admin/access-codes")
 async def list_access_codes(username: str = Depends(verify_token)):
     """List all access codes"""
     data = load_data()
-    codes = data.get("access_codes", [])
+    # Copy entries so display fields never leak into the stored document
+    codes = [dict(code) for code in data.get("access_codes", [])]
     parcelles = {p["id"]: p["nom"] for p in data.get("parcelles", [])}
     
     # Add status info and parcelle names
-    now = datetime.now(timezone.utc)
+    now = time.time()
     for code in codes:
-        expires_at = datetime.fromisoformat(code["expires_at"])
-        code["is_expired"] = expires_at < now
+        expires_at = store.expiry("access_codes", code["id"])
+        code["is_expired"] = expires_at is None or expires_at < now
+        # Live usage: stored counters plus the counts not flushed yet
+        code.update(usage_counters.live(code))
         # Add profile_type if missing (backward compatibility)
         if "profile_type" not in code:
             code["profile_type"] = "PROSPECT"
@@ -1407,75 +1801,62 @@ async def list_access_codes(username: str = Depends(verify_token)):
 @api_router.delete("/admin/access-codes/{code_id}")
 async def revoke_access_code(code_id: str, username: str = Depends(verify_token)):
     """Revoke an access code"""
-    data = load_data()
-    codes = data.get("access_codes", [])
-    
-    for i, code in enumerate(codes):
-        if code["id"] == code_id:
-            codes[i]["active"] = False
-            data["access_codes"] = codes
-            save_data(data)
-            return {"revoked": code_id}
+    if not store.find("access_codes", code_id):
+        raise HTTPException(status_code=404, detail="Code non trouvé")
     
-    raise HTTPException(status_code=404, detail="Code non trouvé")
+    # Deactivate first so a viewer re-verifying in between cannot get a fresh session
+    await run_io(store.update, "access_codes", code_id, {"active": False})
+    await run_io(revoke_viewer_sessions, code_id)
+    await run_io(render_cache.drop_code, code_id)
+    return {"revoked": code_id}
 
 @api_router.put("/admin/access-codes/{code_id}")
 async def update_access_code(code_id: str, updates: dict, username: str = Depends(verify_token)):
     """Update an access code (video_url, camera_enabled)"""
-    data = load_data()
-    codes = data.get("access_codes", [])
+    if not store.find("access_codes", code_id):
+        raise HTTPException(status_code=404, detail="Code non trouvé")
     
     allowed_fields = ["video_url", "camera_enabled", "client_name", "client_email"]
-    
-    for i, code in enumerate(codes):
-        if code["id"] == code_id:
-            for field in allowed_fields:
-                if field in updates:
-                    codes[i][field] = updates[field]
-            data["access_codes"] = codes
-            save_data(data)
-            return {"updated": code_id, "code": codes[i]}
-    
-    raise HTTPException(status_code=404, detail="Code non trouvé")
+    fields = {field: updates[field] for field in allowed_fields if field in updates}
+    # Store first: sessions and renders issued after the revocation must see the new values
+    updated = await run_io(store.update, "access_codes", code_id, fields)
+    # Open sessions carry the old entitlements: viewers re-verify with their code
+    await run_io(revoke_viewer_sessions, code_id)
+    # The client name is printed in the watermark
+    await run_io(render_cache.drop_code, code_id)
+    return {"updated": code_id, "code": updated}
 
 @api_router.get("/admin/download-logs")
-async def get_download_logs(username: str = Depends(verify_token)):
-    """Get document download logs"""
-    data = load_data()
-    logs = data.get("download_logs", [])
-    
-    # Sort by timestamp descending
-    logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+async def get_download_logs(
+    limit: int = Query(DOWNLOAD_LOGS_PAGE_SIZE, ge=1, le=DOWNLOAD_LOGS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, description="newest entries to skip (next pages)"),
+    code: Optional[str] = Query(None, description="only this access code's entries"),
+    username: str = Depends(verify_token)
+):
+    """Get document download logs, one page at a time"""
+    # Newest first, straight from the log segments; one more entry tells whether a next page exists
+    logs = await run_io(access_log.recent, limit + 1, offset=offset, code=code.upper() if code else None)
     
-    return {"logs": logs}
+    return {"logs": logs[:limit], "offset": offset, "has_more": len(logs) > limit}
 
 @api_router.get("/admin/download-logs/stats")
 async def get_download_stats(username: str = Depends(verify_token)):
     """Get download statistics"""
-    data = load_data()
-    logs = data.get("download_logs", [])
+    # Pre-aggregated counters (segment counters + daily rollups), no log scan
+    stats = await run_io(access_log.stats)
     
-    # Group by code/client
-    by_client = {}
-    for log in logs:
-        client = log.get("client_name", "Unknown")
-        if client not in by_client:
-            by_client[client] = {"count": 0, "documents": []}
-        by_client[client]["count"] += 1
-        by_client[client]["documents"].append(log.get("document_name"))
-    
-    # Group by parcelle
-    by_parcelle = {}
-    for log in logs:
-        parcelle = log.get("parcelle_id", "Unknown")
-        if parcelle not in by_parcelle:
-            by_parcelle[parcelle] = 0
-        by_parcelle[parcelle] += 1
+    # Group by code/client, most active first
+    by_client = {
+        client: {"count": count}
+        for client, count in sorted(stats["by_client"].items(), key=lambda item: -item[1])
+    }
     
     return {
-        "total_downloads": len(logs),
+        "total_downloads": stats["count"],
         "by_client": by_client,
-        "by_parcelle": by_parcelle
+        "by_parcelle": stats["by_parcelle"],
+        "by_code": stats["by_code"],
+        "by_day": stats["by_day"]
     }
 
 @api_router.get("/admin/notifications")
@@ -1484,35 +1865,23 @@ async def get_notifications(
     username: str = Depends(verify_token)
 ):
     """Get recent document access notifications for admin dashboard"""
-    data = load_data()
-    logs = data.get("download_logs", [])
-    
-    # Sort by timestamp descending
-    logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    
     # Filter by timestamp if provided
+    since_dt = None
     if since:
         try:
             since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-            logs = [l for l in logs if datetime.fromisoformat(l.get("timestamp", "").replace('Z', '+00:00')) > since_dt]
-        except:
+            if since_dt.tzinfo is None:
+                since_dt = since_dt.replace(tzinfo=timezone.utc)
+        except ValueError:
             pass
     
     # Get recent notifications (last 50)
-    recent_logs = logs[:50]
+    recent_logs = await run_io(access_log.recent, 50, since_dt)
     
-    # Count new notifications (last 24 hours)
+    # Count new notifications (last 24 hours); only recent segments are read
     now = datetime.now(timezone.utc)
     last_24h = now - timedelta(hours=24)
-    new_count = 0
-    
-    for log in logs:
-        try:
-            log_time = datetime.fromisoformat(log.get("timestamp", "").replace('Z', '+00:00'))
-            if log_time > last_24h:
-                new_count += 1
-        except:
-            pass
+    new_count = len(await run_io(access_log.recent, None, max(since_dt, last_24h) if since_dt else last_24h))
     
     return {
         "notifications": recent_logs,
@@ -1528,15 +1897,14 @@ async def get_realtime_access_logs(
 ):
     """Get real-time access logs for the Journal d'accès"""
     data = load_data()
-    logs = data.get("download_logs", [])
     parcelles = {p["id"]: p for p in data.get("parcelles", [])}
     
-    # Sort by timestamp descending
-    logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+    # Latest entries first, reading only the newest segments
+    logs = await run_io(access_log.recent, limit)
     
     # Enrich logs with parcelle names
     enriched_logs = []
-    for log in logs[:limit]:
+    for log in logs:
         parcelle = parcelles.get(log.get("parcelle_id"), {})
         enriched_log = {
             **log,
@@ -1547,7 +1915,7 @@ async def get_realtime_access_logs(
     
     return {
         "logs": enriched_logs,
-        "total": len(logs)
+        "total": await run_io(access_log.count)
     }
 
 def get_relative_time(timestamp_str: str) -> str:
@@ -1576,8 +1944,6 @@ def get_relative_time(timestamp_str: str) -> str:
 @api_router.post("/code-requests")
 async def submit_code_request(request: CodeAccessRequest):
     """Submit a request for access code (public endpoint)"""
-    data = load_data()
-    
     # Create new request
     new_request = {
         "id": str(uuid.uuid4()),
@@ -1591,11 +1957,7 @@ async def submit_code_request(request: CodeAccessRequest):
         "notes": ""
     }
     
-    if "code_requests" not in data:
-        data["code_requests"] = []
-    
-    data["code_requests"].append(new_request)
-    save_data(data)
+    await run_io(store.append, "code_requests", new_request)
     
     logger.info(f"New code request from {request.prenom} {request.nom} for parcelle {request.parcelle_id}")
     
@@ -1612,26 +1974,22 @@ async def get_code_requests(
 ):
     """Get all code requests (admin only)"""
     data = load_data()
-    requests = data.get("code_requests", [])
     
-    # Filter by status if provided
-    if status:
-        requests = [r for r in requests if r.get("status") == status]
+    # Filter by status if provided, sort by date descending (newest first)
+    filters = {"status": status} if status else {}
+    requests = store.query("code_requests", order_by="created_at", descending=True, **filters)
     
-    # Sort by date descending (newest first)
-    requests.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+    # Add relative time (on copies, the stored entries stay untouched)
+    requests = [{**req, "relative_time": get_relative_time(req.get("created_at", ""))} for req in requests]
     
-    # Add relative time
-    for req in requests:
-        req["relative_time"] = get_relative_time(req.get("created_at", ""))
-    
-    # Count by status
+    # Count by status, including requests collapsed by the retention policy
     all_requests = data.get("code_requests", [])
+    rolled_up = code_request_totals(data)
     stats = {
-        "total": len(all_requests),
+        "total": len(all_requests) + rolled_up["total"],
         "pending": len([r for r in all_requests if r.get("status") == "pending"]),
-        "contacted": len([r for r in all_requests if r.get("status") == "contacted"]),
-        "completed": len([r for r in all_requests if r.get("status") == "completed"])
+        "contacted": len([r for r in all_requests if r.get("status") == "contacted"]) + rolled_up["by_status"].get("contacted", 0),
+        "completed": len([r for r in all_requests if r.get("status") == "completed"]) + rolled_up["by_status"].get("completed", 0)
     }
     
     return {
@@ -1652,11 +2010,12 @@ async def update_code_request(
     
     for req in requests:
         if req["id"] == request_id:
-            req["status"] = status
-            req["notes"] = notes
-            req["updated_at"] = datetime.now(timezone.utc).isoformat()
-            req["updated_by"] = username
-            save_data(data)
+            await run_io(store.update, "code_requests", request_id, {
+                "status": status,
+                "notes": notes,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "updated_by": username
+            })
             
             return {"success": True, "message": "Demande mise à jour"}
     
@@ -1668,11 +2027,7 @@ async def delete_code_request(
     username: str = Depends(verify_token)
 ):
     """Delete a code request"""
-    data = load_data()
-    requests = data.get("code_requests", [])
-    
-    data["code_requests"] = [r for r in requests if r["id"] != request_id]
-    save_data(data)
+    await run_io(store.remove, "code_requests", request_id)
     
     return {"success": True, "message": "Demande supprimée"}
 
@@ -1688,15 +2043,49 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Page-Count", "X-Preview-Pages"],
 )
 
+async def retention_loop():
+    """Collapse old download logs and code requests into rollups, periodically"""
+    while True:
+        try:
+            await run_io(apply_retention, store, access_log)
+            # Rendered documents of codes no longer live (also those dropped while down or by another worker)
+            live_codes = [ac["id"] for ac in load_data().get("access_codes", []) if code_is_live(store, ac)]
+            await run_io(render_cache.retain, live_codes)
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+async def expiry_loop():
+    """Deactivate access codes as they lapse, waking up when the next one is due"""
+    while True:
+        try:
+            for code_id in await run_io(sweep_expired_codes, store):
+                await run_io(render_cache.drop_code, code_id)
+        except Exception as e:
+            logger.error(f"Expiry sweep failed: {e}")
+        await asyncio.sleep(seconds_until_next_sweep(store))
+
 @app.on_event("startup")
 async def startup():
     logger.info("Songon Extension API v1.1.0 started")
     (ROOT_DIR / 'data').mkdir(exist_ok=True)
     UPLOADS_DIR.mkdir(exist_ok=True)
     DOCUMENTS_DIR.mkdir(exist_ok=True)
+    await run_io(store.load)
+    await run_io(import_document_logs, store, access_log)
+    log_batcher.start()
+    usage_counters.start()
+    app.state.retention_task = asyncio.create_task(retention_loop())
+    app.state.expiry_task = asyncio.create_task(expiry_loop())
 
 @app.on_event("shutdown")
 async def shutdown():
+    app.state.retention_task.cancel()
+    app.state.expiry_task.cancel()
+    await log_batcher.stop()
+    await usage_counters.stop()
+    shutdown_executors()
     logger.info("Songon Extension API shutdown")
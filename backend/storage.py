@@ -0,0 +1,686 @@
+# Storage backends for the data store (JSON snapshot + journal, SQLite)
+import argparse
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from data_store import RELOAD, default_data, normalize_data, apply_op
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON snapshot parsing/encoding
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: binary snapshot codec when orjson is missing
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Compact the journal into a fresh snapshot after this many records
+JOURNAL_COMPACT_EVERY = int(os.environ.get('JOURNAL_COMPACT_EVERY', '500'))
+# fsync every journal record (disable only for throwaway environments)
+JOURNAL_FSYNC = os.environ.get('JOURNAL_FSYNC', '1') != '0'
+# Mutation records kept in the SQLite changes table for other workers to catch up from
+# (a worker further behind reloads the whole database)
+SQLITE_CHANGES_KEEP = int(os.environ.get('SQLITE_CHANGES_KEEP', '1000'))
+
+# Snapshot key recording the last journal record folded into the snapshot
+SEQ_KEY = "journal_seq"
+
+# Snapshot format: "json" (pretty parcelles.json) or "binary" (parcelles.snap)
+SNAPSHOT_FORMAT = os.environ.get('SNAPSHOT_FORMAT', 'json').lower()
+
+# Binary snapshot layout: magic, format version, codec, encoded document
+SNAPSHOT_MAGIC = b"SONGSNAP"
+SNAPSHOT_VERSION = 1
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+
+
+def encode_snapshot(data: dict) -> bytes:
+    """Encode a document as a binary snapshot.
+
+    Compact JSON through orjson is the fastest codec (see
+    benchmarks/snapshot_benchmark.py), then msgpack, then stdlib JSON.
+    """
+    if orjson is not None:
+        codec, payload = CODEC_JSON, orjson.dumps(data)
+    elif msgpack is not None:
+        codec, payload = CODEC_MSGPACK, msgpack.packb(data, use_bin_type=True)
+    else:
+        codec, payload = CODEC_JSON, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION, codec]) + payload
+
+
+def decode_snapshot(raw: bytes) -> dict:
+    """Decode a binary snapshot, or a plain JSON document"""
+    json_loads = orjson.loads if orjson is not None else json.loads
+    if not raw.startswith(SNAPSHOT_MAGIC):
+        return json_loads(raw)
+    header = len(SNAPSHOT_MAGIC)
+    version, codec = raw[header], raw[header + 1]
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot format version {version} is newer than supported ({SNAPSHOT_VERSION})")
+    payload = raw[header + 2:]
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("This snapshot was written with msgpack: install it to read it")
+        return msgpack.unpackb(payload, raw=False)
+    if codec == CODEC_JSON:
+        return json_loads(payload)
+    raise ValueError(f"Unknown snapshot codec {codec}")
+
+
+def write_json_atomic(path: Path, data: dict):
+    """Write a JSON file so readers only ever see the old or the new content"""
+    if orjson is not None:
+        content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    write_bytes_atomic(path, content)
+
+
+def write_bytes_atomic(path: Path, content: bytes):
+    """Replace a file so readers only ever see the old or the new content"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Persist the rename itself
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class FileLock:
+    """Reentrant advisory lock (flock) on a sidecar file.
+
+    Serializes threads through `lock` and processes through the flock; nested
+    use by the owning thread only takes the flock once.
+    """
+
+    def __init__(self, path: Path, lock=None):
+        self.path = Path(path)
+        self.lock = lock or threading.RLock()
+        self._fd = None
+        self._depth = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            if self._depth == 0:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+        return False
+
+
+class StorageBackend:
+    """Persistence contract behind DataStore.
+
+    `load` returns the whole document; `commit` durably records one mutation
+    (see data_store.apply_op for the record format) before it is applied in
+    memory; `save` replaces the whole document. `write_lock` serializes
+    writers across processes and `poll_changes` reports what other processes
+    wrote since we last looked; `reload` reads the document again after a
+    RELOAD, without waiting for the writers.
+    """
+
+    name = "base"
+
+    def load(self) -> dict:
+        raise NotImplementedError
+
+    def reload(self) -> dict:
+        """The whole document, read again after poll_changes returned RELOAD"""
+        return self.load()
+
+    def commit(self, op: dict):
+        raise NotImplementedError
+
+    def save(self, data: dict):
+        raise NotImplementedError
+
+    def checkpoint(self, data: dict):
+        """Called after a mutation was applied in memory"""
+
+    def write_lock(self):
+        """Context manager held around a read-modify-write of the document"""
+        return contextlib.nullcontext()
+
+    def poll_changes(self):
+        """Changes made by other processes since the last load/poll.
+
+        Returns None when nothing changed, a list of mutation records to
+        apply, or RELOAD when the document must be read again whole.
+        """
+        return None
+
+    def query(self, collection: str, order_by: Optional[str], descending: bool,
+              limit: Optional[int], filters: dict) -> Optional[List[dict]]:
+        """Answer a query natively, or return None to let the caller scan memory"""
+        return None
+
+    def close(self):
+        """Release resources"""
+
+
+class JsonJournalStorage(StorageBackend):
+    """parcelles.json snapshot plus an append-only journal.
+
+    Each mutation appends one small record to `<data file>.journal`; after
+    `compact_every` records the journal is folded into a new snapshot
+    written atomically (temp file, fsync, rename). The snapshot is the
+    pretty-printed data file, or with `snapshot_format="binary"` a compact
+    `<data file>.snap` (see encode_snapshot). Only one of them exists: a
+    snapshot in one format replaces the other, so changing the format
+    takes effect at the next snapshot. The snapshot remembers the
+    last folded sequence number so a crash before the journal truncate never
+    applies a record twice, and a torn trailing record is dropped on replay.
+
+    Worker processes coordinate through an advisory lock (flock) on a
+    `<data file>.lock` sidecar - the data file itself is replaced on every
+    snapshot, so it cannot carry the lock. Readers never lock: they compare
+    the snapshot's inode/mtime/size and the journal length with what they
+    last read, and tail only the new journal records. A snapshot replaced
+    by another process is reloaded without the lock either (see `reload`).
+    """
+
+    name = "json"
+
+    def __init__(self, path: Path, compact_every: int = JOURNAL_COMPACT_EVERY,
+                 snapshot_format: str = SNAPSHOT_FORMAT):
+        if snapshot_format not in ("json", "binary"):
+            raise ValueError(f"Unknown SNAPSHOT_FORMAT: {snapshot_format}")
+        self.path = Path(path)
+        self.binary_path = self.path.with_suffix('.snap')
+        self.snapshot_format = snapshot_format
+        self.journal_path = self.path.with_suffix('.journal')
+        self.lock_path = self.path.with_suffix('.lock')
+        self.compact_every = compact_every
+        self._seq = 0
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._snapshot_stat = None
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.lock_path, self._lock)
+
+    # ---------- inter-process lock ----------
+
+    def write_lock(self):
+        return self._file_lock
+
+    def _stat_snapshot(self):
+        stats = []
+        for path in (self.path, self.binary_path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stats.append(None)
+                continue
+            stats.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(stats)
+
+    def _snapshot_source(self, stat) -> Optional[Path]:
+        """The snapshot file to load, if any"""
+        json_stat, binary_stat = stat
+        if json_stat is not None and binary_stat is not None:
+            # Crash between writing a snapshot and removing the other format:
+            # the one in the configured format is the new one
+            return self.binary_path if self.snapshot_format == "binary" else self.path
+        if binary_stat is not None:
+            return self.binary_path
+        return self.path if json_stat is not None else None
+
+    # ---------- reading ----------
+
+    def load(self) -> dict:
+        # Exclusive lock: a concurrent writer must not be mid-append while we
+        # decide whether the journal tail is torn
+        with self.write_lock():
+            return self._read_document(self._stat_snapshot(), truncate_torn=True)
+
+    def reload(self) -> dict:
+        """Read the document again without the inter-process lock.
+
+        os.replace swaps snapshots atomically, and a compaction only truncates
+        the journal after replacing the snapshot: if the snapshot is unchanged
+        once the journal is read, both belong together, otherwise read again.
+        A record being appended is left for the next poll.
+        """
+        with self._lock:
+            while True:
+                stat = self._stat_snapshot()
+                data = self._read_document(stat)
+                if self._stat_snapshot() == stat:
+                    return data
+
+    def _read_document(self, stat, truncate_torn: bool = False) -> dict:
+        """The snapshot seen as `stat`, with the journal records after it replayed"""
+        self._snapshot_stat = stat
+        source = self._snapshot_source(stat)
+        if source is None:
+            data = default_data()
+        else:
+            with open(source, 'rb') as f:
+                data = normalize_data(decode_snapshot(f.read()))
+        self._seq = data.get(SEQ_KEY, 0)
+        self._journal_offset = 0
+        ops = self._read_journal(truncate_torn=truncate_torn)
+        for op in ops:
+            apply_op(data, op)
+        self._journal_records = len(ops)
+        logger.info(f"Loaded {source or self.path} ({self._journal_records} journal record(s) replayed)")
+        return data
+
+    def _read_journal(self, truncate_torn: bool = False) -> List[dict]:
+        """Read records after our journal offset that are newer than our seq"""
+        ops = []
+        torn_at = None
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                good_offset = self._journal_offset
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        op = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash, or a writer mid-append when
+                        # we are not holding the lock (picked up next time)
+                        torn_at = good_offset
+                        break
+                    good_offset += len(line)
+                    if op["seq"] <= self._seq:
+                        continue
+                    ops.append(op)
+                    self._seq = op["seq"]
+                self._journal_offset = good_offset
+        except FileNotFoundError:
+            return ops
+        if torn_at is not None and truncate_torn:
+            logger.warning(f"Discarding incomplete journal record at offset {torn_at}")
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(torn_at)
+        return ops
+
+    def poll_changes(self):
+        with self._lock:
+            if self._stat_snapshot() != self._snapshot_stat:
+                # Another process wrote a new snapshot
+                return RELOAD
+            try:
+                journal_size = os.stat(self.journal_path).st_size
+            except FileNotFoundError:
+                journal_size = 0
+            if journal_size == self._journal_offset:
+                return None
+            if journal_size < self._journal_offset:
+                # Truncated by another process's compaction
+                return RELOAD
+            ops = self._read_journal()
+            self._journal_records += len(ops)
+            return ops
+
+    # ---------- writing ----------
+
+    def commit(self, op: dict):
+        # Called under write_lock after poll_changes, so our seq is current
+        with self._lock:
+            op["seq"] = self._seq + 1
+            line = json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n"
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                if JOURNAL_FSYNC:
+                    os.fsync(f.fileno())
+                self._journal_offset = f.tell()
+            self._seq = op["seq"]
+            self._journal_records += 1
+
+    def checkpoint(self, data: dict):
+        if self._journal_records >= self.compact_every:
+            self.save(data)
+
+    def save(self, data: dict):
+        """Write a new snapshot and truncate the journal"""
+        with self.write_lock():
+            data[SEQ_KEY] = self._seq
+            if self.snapshot_format == "binary":
+                write_bytes_atomic(self.binary_path, encode_snapshot(data))
+                self.path.unlink(missing_ok=True)
+            else:
+                write_json_atomic(self.path, data)
+                self.binary_path.unlink(missing_ok=True)
+            # A crash before this truncate is harmless: replay skips records <= journal_seq
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+            self._snapshot_stat = self._stat_snapshot()
+            self._journal_offset = 0
+            self._journal_records = 0
+            logger.info(f"Data snapshot written at journal seq {self._seq}")
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite database in WAL mode.
+
+    parcelles, access_codes and code_requests get their own
+    table (full record as JSON plus indexed columns used by queries); every
+    other top-level entry (config, admin, access_requests, ...) is kept as a
+    JSON value in the `entries` table. Several processes can share the file:
+    writers serialize on `BEGIN IMMEDIATE` and also append each mutation
+    record to the `changes` table; when `PRAGMA data_version` shows another
+    connection committed, readers apply the records after the last one they
+    saw (the last SQLITE_CHANGES_KEEP are kept), like a journal tail.
+    """
+
+    name = "sqlite"
+
+    # collection -> indexed columns extracted from each record
+    TABLES = {
+        "parcelles": ["statut"],
+        "access_codes": ["code", "active", "expires_at"],
+        "code_requests": ["status", "created_at"],
+    }
+
+    def __init__(self, path: Path, changes_keep: int = SQLITE_CHANGES_KEEP):
+        self.path = Path(path)
+        self.changes_keep = changes_keep
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self._data_version = None
+        self._seq = 0
+
+    def _create_schema(self):
+        with self._lock:
+            for table, columns in self.TABLES.items():
+                extra = "".join(f", {col}" for col in columns)
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY{extra}, data TEXT NOT NULL)")
+                for col in columns:
+                    self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table}({col})")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL)")
+            self._drop_download_logs_table()
+
+    def _drop_download_logs_table(self):
+        """Download logs live in the access log (access_log.py) now: rows left in
+        their former table become a document entry, which import_document_logs
+        moves there at startup"""
+        with self._transaction():
+            if not self.conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'download_logs'").fetchone():
+                return
+            rows = [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM download_logs ORDER BY rowid")]
+            if rows:
+                self._set_entry("download_logs", (self._get_entry("download_logs") or []) + rows)
+            self.conn.execute("DROP TABLE download_logs")
+
+    # ---------- helpers ----------
+
+    def _row_values(self, table: str, record: dict) -> tuple:
+        columns = self.TABLES[table]
+        return (record["id"], *(record.get(col) for col in columns), json.dumps(record, ensure_ascii=False))
+
+    def _insert(self, table: str, records: List[dict]):
+        columns = ["id", *self.TABLES[table], "data"]
+        placeholders = ", ".join("?" for _ in columns)
+        # Upsert keeps the rowid (and so the collection order) of existing records
+        assignments = ", ".join(f"{col} = excluded.{col}" for col in columns[1:])
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {assignments}",
+            [self._row_values(table, r) for r in records]
+        )
+
+    def _get_entry(self, key: str):
+        row = self.conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_entry(self, key: str, value):
+        self.conn.execute("INSERT OR REPLACE INTO entries (key, data) VALUES (?, ?)",
+                          (key, json.dumps(value, ensure_ascii=False)))
+
+    def _transaction(self, immediate: bool = True):
+        return _Transaction(self.conn, self._lock, immediate)
+
+    def write_lock(self):
+        return self._transaction()
+
+    def _remember_version(self):
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # ---------- StorageBackend ----------
+
+    def _record_change(self, op: dict):
+        """Append a mutation record for the other connections, drop the oldest ones"""
+        cursor = self.conn.execute("INSERT INTO changes (op) VALUES (?)",
+                                   (json.dumps(op, ensure_ascii=False),))
+        self._seq = cursor.lastrowid
+        self.conn.execute("DELETE FROM changes WHERE seq <= ?", (self._seq - self.changes_keep,))
+
+    def load(self) -> dict:
+        # One read transaction: the tables and the last change seen belong together
+        with self._transaction(immediate=False):
+            data = {}
+            for key, value in self.conn.execute("SELECT key, data FROM entries"):
+                data[key] = json.loads(value)
+            for table in self.TABLES:
+                data[table] = [json.loads(row[0]) for row in
+                               self.conn.execute(f"SELECT data FROM {table} ORDER BY rowid")]
+            if "config" not in data:
+                data["config"] = default_data()["config"]
+            self._seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            self._remember_version()
+            return data
+
+    def commit(self, op: dict):
+        # Called under write_lock after poll_changes, so our seq is current
+        with self._transaction():
+            self._write(op)
+            self._record_change(op)
+            # Read before COMMIT: our own commit leaves it unchanged, a later one by another connection does not
+            self._remember_version()
+
+    def _write(self, op: dict):
+        """Apply a mutation record to the tables (inside the caller's transaction)"""
+        kind, key = op["op"], op["c"]
+        if kind == "batch":
+            for sub in op["ops"]:
+                self._write(sub)
+        elif key not in self.TABLES:
+            # Non-table entries are small: read, modify and write back the value
+            value = self._get_entry(key)
+            doc = {key: value} if value is not None else {}
+            apply_op(doc, op)
+            self._set_entry(key, doc[key])
+        elif kind == "append":
+            self._insert(key, [op["v"]])
+        elif kind == "extend":
+            self._insert(key, op["v"])
+        elif kind == "update":
+            row = self.conn.execute(f"SELECT data FROM {key} WHERE id = ?", (op["id"],)).fetchone()
+            if row:
+                self._insert(key, [{**json.loads(row[0]), **op["v"]}])
+        elif kind == "remove":
+            self.conn.execute(f"DELETE FROM {key} WHERE id = ?", (op["id"],))
+        elif kind == "set":
+            self.conn.execute(f"DELETE FROM {key}")
+            self._insert(key, op["v"])
+
+    def save(self, data: dict):
+        with self._transaction():
+            self.conn.execute("DELETE FROM entries")
+            for key, value in data.items():
+                if key in self.TABLES:
+                    self.conn.execute(f"DELETE FROM {key}")
+                    self._insert(key, value)
+                elif key != SEQ_KEY:
+                    self._set_entry(key, value)
+            # Not replayable: the other connections reload
+            self._record_change({"op": RELOAD, "c": None})
+            self._remember_version()
+
+    def poll_changes(self):
+        with self._lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return None
+            with self._transaction(immediate=False):
+                oldest = self.conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+                if oldest is not None and oldest > self._seq + 1:
+                    return RELOAD  # the records we missed were dropped
+                rows = self.conn.execute("SELECT seq, op FROM changes WHERE seq > ? ORDER BY seq",
+                                         (self._seq,)).fetchall()
+            ops = [json.loads(op) for _, op in rows]
+            if any(op["op"] == RELOAD for op in ops):
+                return RELOAD
+            if rows:
+                self._seq = rows[-1][0]
+            self._data_version = version
+            return ops or None
+
+    def query(self, collection, order_by, descending, limit, filters):
+        columns = self.TABLES.get(collection)
+        if columns is None:
+            return None
+        if order_by and order_by not in columns or any(k not in columns for k in filters):
+            return None
+        sql = f"SELECT data FROM {collection}"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{k} = ?" for k in filters)
+        sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}" if order_by else " ORDER BY rowid"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [json.loads(row[0]) for row in self.conn.execute(sql, tuple(filters.values()))]
+
+    def close(self):
+        self.conn.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE (or a deferred read transaction) ... COMMIT/ROLLBACK under the backend lock.
+
+    Nested use joins the outer transaction.
+    """
+
+    def __init__(self, conn, lock, immediate: bool = True):
+        self.conn = conn
+        self.lock = lock
+        self.immediate = immediate
+        self.outermost = False
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.outermost = not self.conn.in_transaction
+        if self.outermost:
+            self.conn.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.outermost:
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+def create_storage(data_file: Path) -> StorageBackend:
+    """Build the backend selected by STORAGE_BACKEND (json or sqlite)"""
+    backend = os.environ.get('STORAGE_BACKEND', 'json').lower()
+    if backend == "sqlite":
+        db_path = os.environ.get('SQLITE_PATH') or str(Path(data_file).with_suffix('.db'))
+        return SqliteStorage(Path(db_path))
+    if backend == "json":
+        return JsonJournalStorage(data_file, snapshot_format=SNAPSHOT_FORMAT)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def migrate_json_to_sqlite(json_path: Path, db_path: Path, force: bool = False) -> dict:
+    """Copy parcelles.json (and its journal) into a SQLite database"""
+    data = JsonJournalStorage(json_path).load()
+    data.pop(SEQ_KEY, None)
+    target = SqliteStorage(db_path)
+    try:
+        existing = target.conn.execute("SELECT COUNT(*) FROM parcelles").fetchone()[0]
+        if existing and not force:
+            raise RuntimeError(f"{db_path} already contains data (use --force to overwrite)")
+        target.save(data)
+    finally:
+        target.close()
+    counts = {table: len(data.get(table, [])) for table in SqliteStorage.TABLES}
+    logger.info(f"Migrated {json_path} to {db_path}: {counts}")
+    return counts
+
+
+def convert_snapshot(json_path: Path, to_format: str) -> Path:
+    """Rewrite the current data (snapshot + journal) as a `to_format` snapshot"""
+    storage = JsonJournalStorage(json_path, snapshot_format=to_format)
+    storage.save(storage.load())
+    target = storage.binary_path if to_format == "binary" else storage.path
+    logger.info(f"Converted {json_path} data to {target}")
+    return target
+
+
+def export_json(json_path: Path, out_path: Path) -> Path:
+    """Write the current data as a human-readable JSON file, whatever the snapshot format"""
+    data = JsonJournalStorage(json_path).load()
+    data.pop(SEQ_KEY, None)
+    write_json_atomic(Path(out_path), data)
+    logger.info(f"Exported {json_path} data to {out_path}")
+    return Path(out_path)
+
+
+if __name__ == "__main__":
+    ROOT_DIR = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Songon Extension data store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Copy the JSON data file into a SQLite database")
+    migrate.add_argument("--json", default=str(ROOT_DIR / 'data' / 'parcelles.json'))
+    migrate.add_argument("--db", default=str(ROOT_DIR / 'data' / 'parcelles.db'))
+    migrate.add_argument("--force", action="store_true", help="Overwrite a non-empty database")
+    convert = sub.add_parser("convert", help="Switch the data snapshot to parcelles.json or parcelles.snap")
+    convert.add_argument("--to", choices=["json", "binary"], required=True)
+    convert.add_argument("--json", default=str(ROOT_DIR / 'data' / 'parcelles.json'))
+    export = sub.add_parser("export", help="Write the current data as readable JSON")
+    export.add_argument("--out", required=True)
+    export.add_argument("--json", default=str(ROOT_DIR / 'data' / 'parcelles.json'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == "migrate":
+        print(migrate_json_to_sqlite(Path(args.json), Path(args.db), force=args.force))
+    elif args.command == "convert":
+        print(convert_snapshot(Path(args.json), args.to))
+    elif args.command == "export":
+        print(export_json(Path(args.json), Path(args.out)))
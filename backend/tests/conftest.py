@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+import requests
+
+# Make backend modules (data_store, watermark, ...) importable from the tests
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Running server for the live suites (test_multi_parcelle, test_bulk_codes)
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin"
+
+
+@pytest.fixture
+def admin_headers():
+    """Get admin authorization headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": ADMIN_USERNAME,
+        "password": ADMIN_PASSWORD
+    })
+    if response.status_code == 200:
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+    pytest.skip("Admin authentication failed")
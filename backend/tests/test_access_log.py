@@ -0,0 +1,310 @@
+"""
+Test suite for the download/access log
+Tests the rotating JSONL segments behind the Journal d'accès:
+- Append and newest-first reads
+- Rotation by day and by size, time index
+- Reads that stop at recent segments
+- Torn entries and several workers
+- Import of logs still stored in the data document
+- Retention: daily rollups for logs and code requests
+- Batched background writes
+"""
+import asyncio
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from access_log import AccessLog, LogBatcher, import_document_logs
+from data_store import DataStore
+from retention import rollup_code_requests, code_request_totals
+from storage import JsonJournalStorage, SqliteStorage
+
+
+def entry(n, day="2026-03-01", hour=10):
+    return {
+        "id": f"l{n}",
+        "code": "ABCD2345",
+        "client_name": "Awa",
+        "parcelle_id": "p1",
+        "document_name": f"acd_{n}",
+        "timestamp": f"{day}T{hour:02d}:00:{n % 60:02d}+00:00"
+    }
+
+
+class TestAccessLog:
+    """Segmented access log tests"""
+
+    def test_append_and_recent(self, tmp_path):
+        """Test entries come back newest first, limited"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1), entry(2)])
+        log.append([entry(3)])
+
+        assert [e["id"] for e in log.recent()] == ["l3", "l2", "l1"]
+        assert [e["id"] for e in log.recent(limit=2)] == ["l3", "l2"]
+        assert [e["id"] for e in log] == ["l1", "l2", "l3"]
+        assert log.count() == 3
+        print("✓ Append and recent")
+
+    def test_rotation_by_day_and_size(self, tmp_path):
+        """Test a new segment starts each day and past the size limit"""
+        log = AccessLog(tmp_path / "logs", max_segment_bytes=400)
+        log.append([entry(1, day="2026-03-01")])
+        log.append([entry(2, day="2026-03-02")])
+        for n in range(3, 9):
+            log.append([entry(n, day="2026-03-02")])
+
+        with open(tmp_path / "logs" / "index.json", encoding='utf-8') as f:
+            segments = json.load(f)["segments"]
+        assert segments[0]["name"] == "download-20260301-0001.jsonl"
+        assert segments[0]["count"] == 1
+        assert [s["day"] for s in segments[1:]] == ["2026-03-02"] * (len(segments) - 1)
+        assert len(segments) > 2
+        assert log.count() == 8
+        print(f"✓ Rotated into {len(segments)} segments")
+
+    def test_recent_only_reads_newest_segments(self, tmp_path):
+        """Test limited and since-filtered reads never open old segments"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1, day="2026-03-01")])
+        log.append([entry(2, day="2026-03-02")])
+        log.append([entry(3, day="2026-03-03"), entry(4, day="2026-03-03")])
+
+        # The oldest segment is unreadable: recent reads must not need it
+        (tmp_path / "logs" / "download-20260301-0001.jsonl").write_text("not json\n")
+        assert [e["id"] for e in log.recent(limit=3)] == ["l4", "l3", "l2"]
+        since = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        assert [e["id"] for e in log.recent(since=since)] == ["l4", "l3", "l2"]
+        print("✓ Recent reads stop at new segments")
+
+    def test_pages_and_code_filter(self, tmp_path):
+        """Test paging with offset, and code filtering that skips segments without the code"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1, day="2026-03-01")])
+        log.append([{**entry(2, day="2026-03-02"), "code": "WXYZ6789"}])
+        log.append([entry(3, day="2026-03-03"), entry(4, day="2026-03-03")])
+
+        assert [e["id"] for e in log.recent(limit=2, offset=1)] == ["l3", "l2"]
+        assert log.recent(limit=2, offset=4) == []
+        # The only WXYZ6789 entry is in the second segment: the others are not read
+        (tmp_path / "logs" / "download-20260301-0001.jsonl").write_text("not json\n")
+        (tmp_path / "logs" / "download-20260303-0001.jsonl").write_text("not json\n")
+        assert [e["id"] for e in log.recent(limit=10, code="WXYZ6789")] == ["l2"]
+        assert log.stats()["by_code"] == {"ABCD2345": 3, "WXYZ6789": 1}
+        print("✓ Paged and filtered by code")
+
+    def test_code_counters_added_to_old_index(self, tmp_path):
+        """Test closed segments indexed without per-code counters are counted on load"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1, day="2026-03-01"), entry(2, day="2026-03-01")])
+        log.append([entry(3, day="2026-03-02")])
+        index_path = tmp_path / "logs" / "index.json"
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        for segment in index["segments"]:
+            del segment["by_code"]
+        index["rollups"] = {"2026-02-01": {"count": 5, "by_parcelle": {"p1": 5}, "by_client": {"Awa": 5}}}
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+
+        reopened = AccessLog(tmp_path / "logs")
+        stats = reopened.stats()
+        assert stats["count"] == 8
+        assert stats["by_code"] == {"ABCD2345": 3}
+        reopened.expire(datetime(2026, 3, 2, tzinfo=timezone.utc))
+        assert reopened.stats()["by_code"] == {"ABCD2345": 3}
+        print("✓ Per-code counters added to an old index")
+
+    def test_torn_entry_dropped(self, tmp_path):
+        """Test a partial line from a crash is skipped and then overwritten"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1)])
+        segment = tmp_path / "logs" / "download-20260301-0001.jsonl"
+        with open(segment, 'ab') as f:
+            f.write(b'{"id": "torn"')
+
+        reopened = AccessLog(tmp_path / "logs")
+        assert [e["id"] for e in reopened.recent()] == ["l1"]
+        reopened.append([entry(2)])
+        assert [e["id"] for e in AccessLog(tmp_path / "logs")] == ["l1", "l2"]
+        print("✓ Torn entry dropped")
+
+    def test_workers_share_segments(self, tmp_path):
+        """Test two workers appending to the same directory see every entry"""
+        worker_a = AccessLog(tmp_path / "logs", max_segment_bytes=400)
+        worker_b = AccessLog(tmp_path / "logs", max_segment_bytes=400)
+        for n in range(1, 11):
+            (worker_a if n % 2 else worker_b).append([entry(n)])
+
+        assert worker_a.count() == worker_b.count() == 10
+        assert [e["id"] for e in worker_b] == [f"l{n}" for n in range(1, 11)]
+        print("✓ Workers share segments")
+
+    def test_import_document_logs(self, tmp_path):
+        """Test logs stored in parcelles.json move to the access log once"""
+        path = tmp_path / "parcelles.json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"parcelles": [], "config": {}, "download_logs": [entry(2), entry(1)]}, f)
+        store = DataStore(JsonJournalStorage(path))
+        log = AccessLog(tmp_path / "logs")
+
+        assert import_document_logs(store, log) == 2
+        assert import_document_logs(store, log) == 0
+        assert store.get()["download_logs"] == []
+        assert [e["id"] for e in log] == ["l1", "l2"]
+        print("✓ Document logs imported")
+
+    def test_import_from_former_sqlite_table(self, tmp_path):
+        """Test rows of the former download_logs table are imported and the table dropped"""
+        db = tmp_path / "parcelles.db"
+        conn = sqlite3.connect(str(db))
+        conn.execute("CREATE TABLE download_logs (id TEXT PRIMARY KEY, timestamp, parcelle_id, code, client_name, data TEXT NOT NULL)")
+        conn.executemany("INSERT INTO download_logs (id, data) VALUES (?, ?)",
+                         [(e["id"], json.dumps(e)) for e in (entry(2), entry(1))])
+        conn.commit()
+        conn.close()
+        store = DataStore(SqliteStorage(db))
+        log = AccessLog(tmp_path / "logs")
+
+        assert import_document_logs(store, log) == 2
+        assert [e["id"] for e in log] == ["l1", "l2"]
+        tables = {row[0] for row in store.backend.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "download_logs" not in tables
+        assert DataStore(SqliteStorage(db)).get()["download_logs"] == []
+        print("✓ Former SQLite log table imported")
+
+
+class TestRetention:
+    """Retention policy and rollup counters"""
+
+    def test_stats_without_reading_entries(self, tmp_path):
+        """Test stats come from segment counters, not from the entries"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1, day="2026-03-01"), {**entry(2, day="2026-03-01"), "client_name": "Koffi"}])
+        log.append([{**entry(3, day="2026-03-02"), "parcelle_id": "p2"}])
+
+        (tmp_path / "logs" / "download-20260301-0001.jsonl").write_text("not json\n")
+        stats = AccessLog(tmp_path / "logs").stats()
+        assert stats["count"] == 3
+        assert stats["by_client"] == {"Awa": 2, "Koffi": 1}
+        assert stats["by_parcelle"] == {"p1": 2, "p2": 1}
+        assert stats["by_day"] == {"2026-03-01": 2, "2026-03-02": 1}
+        print("✓ Stats from counters")
+
+    def test_expire_folds_old_segments(self, tmp_path):
+        """Test old segments become daily rollups and stats are unchanged"""
+        log = AccessLog(tmp_path / "logs")
+        log.append([entry(1, day="2026-03-01"), entry(2, day="2026-03-01")])
+        log.append([entry(3, day="2026-03-02")])
+        log.append([entry(4, day="2026-03-20")])
+        before = log.stats()
+
+        assert log.expire(datetime(2026, 3, 10, tzinfo=timezone.utc)) == 3
+        assert not (tmp_path / "logs" / "download-20260301-0001.jsonl").exists()
+        assert [e["id"] for e in log] == ["l4"]
+
+        reopened = AccessLog(tmp_path / "logs")
+        assert reopened.stats() == before
+        assert reopened.count() == 4
+        assert reopened.expire(datetime(2026, 3, 10, tzinfo=timezone.utc)) == 0
+        print("✓ Old segments folded into rollups")
+
+    def test_code_request_rollups(self, tmp_path):
+        """Test handled old requests are collapsed, pending ones kept"""
+        path = tmp_path / "parcelles.json"
+        requests = [
+            {"id": "r1", "status": "completed", "parcelle_id": "p1", "created_at": "2026-01-05T10:00:00+00:00"},
+            {"id": "r2", "status": "pending", "parcelle_id": "p1", "created_at": "2026-01-05T11:00:00+00:00"},
+            {"id": "r3", "status": "contacted", "parcelle_id": "p2", "created_at": "2026-01-06T09:00:00+00:00"},
+            {"id": "r4", "status": "completed", "parcelle_id": "p2", "created_at": "2026-03-01T09:00:00+00:00"},
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"parcelles": [], "config": {}, "code_requests": requests}, f)
+        store = DataStore(JsonJournalStorage(path))
+
+        assert rollup_code_requests(store, datetime(2026, 2, 1, tzinfo=timezone.utc)) == 2
+        assert [r["id"] for r in store.get()["code_requests"]] == ["r2", "r4"]
+        assert code_request_totals(store.get()) == {"total": 2, "by_status": {"completed": 1, "contacted": 1}}
+
+        # Requests and rollups were replaced in one journal record
+        replayed = DataStore(JsonJournalStorage(path)).get()
+        assert [r["id"] for r in replayed["code_requests"]] == ["r2", "r4"]
+        assert replayed["code_request_rollups"]["2026-01-05"]["by_status"] == {"completed": 1}
+        print("✓ Code requests rolled up")
+
+    def test_code_request_rollups_sqlite(self, tmp_path):
+        """Test the atomic multi-entry update on the SQLite backend"""
+        db = tmp_path / "parcelles.db"
+        store = DataStore(SqliteStorage(db))
+        store.append("code_requests", {"id": "r1", "status": "completed", "created_at": "2026-01-05T10:00:00+00:00"})
+
+        assert rollup_code_requests(store, datetime(2026, 2, 1, tzinfo=timezone.utc)) == 1
+        reloaded = DataStore(SqliteStorage(db)).get()
+        assert reloaded["code_requests"] == []
+        assert code_request_totals(reloaded)["total"] == 1
+        print("✓ Code requests rolled up (SQLite)")
+
+
+class TestLogBatcher:
+    """Queued, batched log writes"""
+
+    def test_flush_after_interval(self, tmp_path):
+        """Test queued entries are written in one batch after the interval"""
+        log = AccessLog(tmp_path / "logs")
+        writes = []
+        original_append = log.append
+        log.append = lambda entries: (writes.append(len(entries)), original_append(entries))
+
+        async def scenario():
+            batcher = LogBatcher(log, interval_ms=50, batch_size=100)
+            batcher.start()
+            for n in range(1, 6):
+                batcher.submit(entry(n))
+            assert log.count() == 0
+            await asyncio.sleep(0.2)
+            assert log.count() == 5
+            await batcher.stop()
+
+        asyncio.run(scenario())
+        assert writes == [5]
+        print("✓ Flushed after interval")
+
+    def test_flush_when_batch_full(self, tmp_path):
+        """Test a full batch is written without waiting for the interval"""
+        log = AccessLog(tmp_path / "logs")
+
+        async def scenario():
+            batcher = LogBatcher(log, interval_ms=10_000, batch_size=3)
+            batcher.start()
+            for n in range(1, 4):
+                batcher.submit(entry(n))
+            await asyncio.sleep(0.2)
+            assert log.count() == 3
+            await batcher.stop()
+
+        asyncio.run(scenario())
+        print("✓ Flushed on full batch")
+
+    def test_stop_flushes_and_failures_retry(self, tmp_path):
+        """Test shutdown writes queued entries, and a failed write is retried"""
+        log = AccessLog(tmp_path / "logs")
+        original_append = log.append
+        failures = [RuntimeError("disk full")]
+
+        def flaky_append(entries):
+            if failures:
+                raise failures.pop()
+            original_append(entries)
+        log.append = flaky_append
+
+        async def scenario():
+            batcher = LogBatcher(log, interval_ms=10, batch_size=100)
+            batcher.start()
+            batcher.submit(entry(1))
+            await asyncio.sleep(0.1)
+            batcher.submit(entry(2))
+            await batcher.stop()
+
+        asyncio.run(scenario())
+        assert [e["id"] for e in log] == ["l1", "l2"]
+        print("✓ Stop flushes, failures retried")
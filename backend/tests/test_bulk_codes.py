@@ -0,0 +1,97 @@
+"""
+Test suite for bulk access code generation
+Tests the campaign endpoints against a running server:
+- JSON list of clients, JSON result
+- CSV upload, downloadable CSV result
+- Input validation
+"""
+import requests
+import os
+import csv
+import io
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestBulkAccessCodes:
+    """Bulk generation tests"""
+    
+    def test_bulk_from_json(self, admin_headers):
+        """Test one call creates a unique PROSPECT code per client"""
+        clients = [{"client_name": f"TEST_Bulk {n}", "client_email": f"bulk{n}@example.com"} for n in range(50)]
+        clients[0]["parcelle_ids"] = ["tf-223738"]
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk",
+            headers=admin_headers,
+            json={"clients": clients, "parcelle_ids": ["tf-223737"], "expires_hours": 48}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert data["created"] == 50
+        codes = [c["code"] for c in data["codes"]]
+        assert len(set(codes)) == 50
+        assert data["codes"][0]["parcelle_ids"] == "tf-223738"
+        assert data["codes"][1]["parcelle_ids"] == "tf-223737"
+        assert all(c["profile_type"] == "PROSPECT" for c in data["codes"])
+        
+        # Every code is live straight away
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-code",
+            json={"code": codes[1], "parcelle_id": "tf-223737"}
+        )
+        assert response.status_code == 200
+        assert response.json()["client_name"] == "TEST_Bulk 1"
+        print(f"✓ {data['created']} codes created in one call")
+    
+    def test_bulk_from_csv(self, admin_headers):
+        """Test a CSV upload (Excel style: ; and BOM) returns a CSV of codes"""
+        upload = "\ufeffclient_name;client_email\nTEST_Awa Koné;awa@example.com\n\nTEST_Koffi;koffi@example.com\n"
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk/csv",
+            headers=admin_headers,
+            files={"file": ("clients.csv", upload.encode("utf-8"), "text/csv")},
+            data={"parcelle_ids": "tf-223737", "expires_hours": "24"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        
+        rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+        assert [r["client_name"] for r in rows] == ["TEST_Awa Koné", "TEST_Koffi"]
+        assert all(len(r["code"]) == 8 for r in rows)
+        print("✓ CSV upload returns a CSV of codes")
+    
+    def test_bulk_validation(self, admin_headers):
+        """Test missing columns, empty rows and empty batches are refused"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk/csv",
+            headers=admin_headers,
+            files={"file": ("clients.csv", b"nom,email\nA,a@example.com\n", "text/csv")}
+        )
+        assert response.status_code == 400
+        
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk/csv",
+            headers=admin_headers,
+            files={"file": ("clients.csv", b"client_name,client_email\nA,\n", "text/csv")}
+        )
+        assert response.status_code == 400
+        assert "Ligne 2" in response.json()["detail"]
+        
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk",
+            headers=admin_headers,
+            json={"clients": []}
+        )
+        assert response.status_code == 400
+        print("✓ Invalid batches refused")
+    
+    def test_bulk_requires_admin(self):
+        """Test bulk generation needs an admin token"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes/bulk",
+            json={"clients": [{"client_name": "X", "client_email": "x@example.com"}]}
+        )
+        assert response.status_code in (401, 403)
+        print("✓ Admin token required")
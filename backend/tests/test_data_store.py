@@ -0,0 +1,535 @@
+"""
+Test suite for the in-memory data store
+Tests the process-resident document behind load_data:
+- Single load from disk
+- Write-through persistence
+- Hash indexes and the access code expiry sweeper
+- Default document when the data file is missing
+- Journal append, replay and compaction
+- Binary snapshot format and conversion
+- SQLite backend and JSON migration
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from data_store import DataStore
+from expiry import code_is_live, sweep_expired_codes, seconds_until_next_sweep
+import pytest
+
+import storage
+from storage import JsonJournalStorage, SqliteStorage, migrate_json_to_sqlite, convert_snapshot, export_json
+
+
+def write_doc(path, doc):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f)
+
+
+def json_store(path, **kwargs):
+    return DataStore(JsonJournalStorage(path, **kwargs))
+
+
+class TestDataStore:
+    """In-memory store tests"""
+    
+    def test_missing_file_returns_default(self, tmp_path):
+        """Test an absent data file yields the default document"""
+        store = json_store(tmp_path / "parcelles.json")
+        data = store.get()
+        assert data["parcelles"] == []
+        assert data["access_codes"] == []
+        assert data["download_logs"] == []
+        assert data["code_requests"] == []
+        print("✓ Default document returned")
+    
+    def test_reads_served_from_memory(self, tmp_path):
+        """Test the file is parsed once and later reads hit memory"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1"}], "config": {}})
+        store = json_store(path)
+        first = store.get()
+        
+        # Unchanged files are not re-parsed
+        assert store.get() is first
+        assert store.get()["parcelles"] == [{"id": "p1"}]
+        
+        # A snapshot replaced by another process is picked up
+        write_doc(path, {"parcelles": [], "config": {}})
+        assert store.get()["parcelles"] == []
+        print("✓ Reads served from memory")
+    
+    def test_save_writes_through(self, tmp_path):
+        """Test save updates memory and disk"""
+        path = tmp_path / "parcelles.json"
+        store = json_store(path)
+        data = store.get()
+        data["code_requests"].append({"id": "r1"})
+        store.save(data)
+        
+        with open(path, encoding='utf-8') as f:
+            on_disk = json.load(f)
+        assert on_disk["code_requests"] == [{"id": "r1"}]
+        assert json_store(path).get()["code_requests"] == [{"id": "r1"}]
+        print("✓ Save persisted to disk")
+    
+    def test_save_keeps_other_workers_records(self, tmp_path):
+        """Test a save catches up first, so the journal it truncates is already in the snapshot"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        worker_b = json_store(path)
+        data = worker_b.get()
+        worker_a.append("access_codes", {"id": "c1"})
+        worker_b.save(data)
+        
+        worker_a.append("access_codes", {"id": "c2"})
+        assert [c["id"] for c in json_store(path).get()["access_codes"]] == ["c1", "c2"]
+        print("✓ Save kept the other worker's records")
+    
+    def test_concurrent_read_modify_write(self, tmp_path):
+        """Test callable updates from many threads never lose a change"""
+        store = json_store(tmp_path / "parcelles.json")
+        store.append("parcelles", {"id": "p1", "photos": []})
+        
+        def add_photo(i):
+            store.update("parcelles", "p1", lambda current: {"photos": current["photos"] + [f"/uploads/{i}.jpg"]})
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(add_photo, range(50)))
+        
+        assert len(store.find("parcelles", "p1")["photos"]) == 50
+        assert len(json_store(tmp_path / "parcelles.json").find("parcelles", "p1")["photos"]) == 50
+        print("✓ Concurrent updates preserved")
+    
+    def test_extend_from_current_document(self, tmp_path):
+        """Test records built from the current document are appended in one write"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        worker_b = json_store(path)
+        worker_b.get()
+        worker_a.append("access_codes", {"id": "c1", "code": "AAAA2222"})
+        
+        # worker_b catches up before building the batch, so it sees c1's code
+        def batch(data):
+            taken = {ac["code"] for ac in data["access_codes"]}
+            return [{"id": f"c{n}", "code": f"TAKEN{len(taken)}-{n}"} for n in (2, 3)]
+        created = worker_b.extend("access_codes", batch)
+        
+        assert [r["code"] for r in created] == ["TAKEN1-2", "TAKEN1-3"]
+        assert [r["id"] for r in json_store(path).get()["access_codes"]] == ["c1", "c2", "c3"]
+        assert worker_b.extend("access_codes", lambda data: []) == []
+        print("✓ Extend built under the lock")
+    
+    def test_readers_keep_their_lists(self, tmp_path):
+        """Test mutations replace collections instead of editing the lists readers hold"""
+        store = json_store(tmp_path / "parcelles.json")
+        store.append("parcelles", {"id": "p1", "nom": "Lot 1"})
+        held = store.get()["parcelles"]
+        
+        store.append("parcelles", {"id": "p2", "nom": "Lot 2"})
+        store.update("parcelles", "p1", {"nom": "Lot 1 bis"})
+        
+        assert held == [{"id": "p1", "nom": "Lot 1"}]
+        assert [p["nom"] for p in store.get()["parcelles"]] == ["Lot 1 bis", "Lot 2"]
+        print("✓ Collections replaced copy-on-write")
+
+
+class TestIndexes:
+    """Hash indexes maintained on every mutation"""
+    
+    def test_lookup_follows_mutations(self, tmp_path):
+        """Test id/code indexes track append, update and remove"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1", "nom": "A"}], "config": {}})
+        store = json_store(path)
+        assert store.find("parcelles", "p1")["nom"] == "A"
+        
+        store.append("access_codes", {"id": "c1", "code": "ABCD2345", "active": True})
+        assert store.lookup("access_codes", "code", "abcd2345")["id"] == "c1"
+        
+        store.update("access_codes", "c1", {"code": "WXYZ6789"})
+        assert store.lookup("access_codes", "code", "ABCD2345") is None
+        assert store.lookup("access_codes", "code", "wxyz6789")["code"] == "WXYZ6789"
+        assert store.find("access_codes", "c1")["code"] == "WXYZ6789"
+        
+        store.remove("access_codes", "c1")
+        assert store.lookup("access_codes", "code", "WXYZ6789") is None
+        assert store.find("access_codes", "c1") is None
+        print("✓ Unique indexes follow mutations")
+    
+    def test_indexes_rebuilt_on_reload(self, tmp_path):
+        """Test indexes reflect another worker's writes and whole-document saves"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        worker_b = json_store(path)
+        worker_b.get()
+        
+        worker_a.append("parcelles", {"id": "p1"})
+        assert worker_b.find("parcelles", "p1") == {"id": "p1"}
+        
+        worker_a.save({"parcelles": [{"id": "p2"}], "config": {}})
+        assert worker_b.find("parcelles", "p1") is None
+        assert worker_b.find("parcelles", "p2") == {"id": "p2"}
+        print("✓ Indexes rebuilt on reload")
+
+
+def access_code(code_id, expires_at, active=True):
+    return {"id": code_id, "code": f"CODE{code_id.upper()}", "active": active,
+            "expires_at": expires_at}
+
+
+class TestExpiry:
+    """Parsed expiry times and the min-heap sweeper"""
+    
+    def test_expiry_parsed_once_and_followed(self, tmp_path):
+        """Test expiry times are kept parsed and follow updates"""
+        store = json_store(tmp_path / "parcelles.json")
+        store.append("access_codes", access_code("c1", "2026-03-01T10:00:00+00:00"))
+        assert store.expiry("access_codes", "c1") == 1772359200.0
+        
+        # Unrelated updates do not push new heap entries
+        heap = store._indexes["access_codes"]["expiry"].heap
+        for n in range(5):
+            store.update("access_codes", "c1", {"usage_count": n})
+        assert len(heap) == 1
+        
+        store.update("access_codes", "c1", {"expires_at": "2026-03-02T10:00:00"})
+        assert store.expiry("access_codes", "c1") == 1772445600.0
+        assert store.next_expiry("access_codes") == 1772445600.0
+        store.remove("access_codes", "c1")
+        assert store.expiry("access_codes", "c1") is None
+        print("✓ Expiry parsed once and followed")
+    
+    def test_sweep_deactivates_lapsed_codes(self, tmp_path):
+        """Test lapsed codes are deactivated once, in one journal record"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        worker_b = json_store(path)
+        worker_a.extend("access_codes", [
+            access_code("c1", "2026-03-01T10:00:00+00:00"),
+            access_code("c2", "2026-03-01T11:00:00+00:00"),
+            access_code("c3", "2026-03-01T09:00:00+00:00", active=False),
+            access_code("c4", "2026-03-05T10:00:00+00:00"),
+        ])
+        now = 1772362800.0  # 2026-03-01T11:00:00Z
+        worker_b.get()
+        
+        # Lapsed codes are refused before the sweeper reaches them
+        assert not code_is_live(worker_a, worker_a.find("access_codes", "c1"), now)
+        assert code_is_live(worker_a, worker_a.find("access_codes", "c4"), now)
+        
+        assert sorted(sweep_expired_codes(worker_a, now)) == ["c1", "c2"]
+        assert sweep_expired_codes(worker_b, now) == []
+        assert sweep_expired_codes(worker_a, now) == []
+        
+        replayed = DataStore(JsonJournalStorage(path))
+        for code_id in ("c1", "c2"):
+            record = replayed.find("access_codes", code_id)
+            assert record["active"] is False
+            assert record["deactivated_reason"] == "expired"
+        assert "deactivated_reason" not in replayed.find("access_codes", "c3")
+        assert replayed.find("access_codes", "c4")["active"] is True
+        print("✓ Lapsed codes deactivated once")
+    
+    def test_sleep_until_next_expiry(self, tmp_path, monkeypatch):
+        """Test the sweeper wakes up when the next code lapses, within a cap"""
+        monkeypatch.setattr("expiry.EXPIRY_SWEEP_MAX_SECONDS", 60.0)
+        store = json_store(tmp_path / "parcelles.json")
+        assert seconds_until_next_sweep(store) == 60.0
+        
+        store.append("access_codes", access_code("c1", "2026-03-01T10:00:00+00:00"))
+        assert seconds_until_next_sweep(store, now=1772359200.0 - 15) == 15.0
+        assert seconds_until_next_sweep(store, now=1772359200.0 - 3600) == 60.0
+        assert seconds_until_next_sweep(store, now=1772359200.0 + 5) == 0.0
+        print("✓ Sweeper sleeps until the next expiry")
+
+
+class TestJournal:
+    """Write-ahead journal tests"""
+    
+    def test_mutation_appends_one_record(self, tmp_path):
+        """Test a mutation appends to the journal instead of rewriting the snapshot"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1", "statut": "disponible"}], "config": {}})
+        snapshot_before = path.read_bytes()
+        
+        store = json_store(path)
+        store.append("download_logs", {"id": "l1"})
+        store.update("parcelles", "p1", {"statut": "vendu"})
+        
+        assert path.read_bytes() == snapshot_before
+        assert len(store.backend.journal_path.read_text().splitlines()) == 2
+        assert store.get()["parcelles"][0]["statut"] == "vendu"
+        print("✓ Mutations journaled")
+    
+    def test_replay_on_startup(self, tmp_path):
+        """Test a fresh store replays the journal on top of the snapshot"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1"}, {"id": "p2"}], "config": {"map_zoom": 15}})
+        store = json_store(path)
+        store.append("code_requests", {"id": "r1", "status": "pending"})
+        store.update("code_requests", "r1", {"status": "contacted"})
+        store.remove("parcelles", "p2")
+        store.set("config", {"map_zoom": 12})
+        store.extend("access_codes", [{"id": "c1"}, {"id": "c2"}])
+        
+        replayed = json_store(path).get()
+        assert replayed["code_requests"] == [{"id": "r1", "status": "contacted"}]
+        assert replayed["parcelles"] == [{"id": "p1"}]
+        assert replayed["config"] == {"map_zoom": 12}
+        assert [c["id"] for c in replayed["access_codes"]] == ["c1", "c2"]
+        print("✓ Journal replayed")
+    
+    def test_torn_record_is_discarded(self, tmp_path):
+        """Test a half-written trailing record from a crash is ignored and trimmed"""
+        path = tmp_path / "parcelles.json"
+        store = json_store(path)
+        store.append("download_logs", {"id": "l1"})
+        with open(store.backend.journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"op":"append","c":"download_logs","v":{"id":"l2"')
+        
+        recovered = json_store(path)
+        assert recovered.get()["download_logs"] == [{"id": "l1"}]
+        recovered.append("download_logs", {"id": "l3"})
+        assert [l["id"] for l in json_store(path).get()["download_logs"]] == ["l1", "l3"]
+        print("✓ Torn journal record discarded")
+    
+    def test_compaction(self, tmp_path):
+        """Test the journal is folded into the snapshot after the threshold"""
+        path = tmp_path / "parcelles.json"
+        store = json_store(path, compact_every=3)
+        for i in range(4):
+            store.append("download_logs", {"id": f"l{i}"})
+        
+        assert len(store.backend.journal_path.read_text().splitlines()) == 1
+        with open(path, encoding='utf-8') as f:
+            assert len(json.load(f)["download_logs"]) == 3
+        assert len(json_store(path).get()["download_logs"]) == 4
+        print("✓ Journal compacted")
+    
+    def test_crash_between_snapshot_and_truncate(self, tmp_path):
+        """Test records already folded into the snapshot are not applied twice"""
+        path = tmp_path / "parcelles.json"
+        store = json_store(path)
+        store.append("download_logs", {"id": "l1"})
+        journal = store.backend.journal_path.read_bytes()
+        store.save(store.get())
+        # Simulate the truncate never happening
+        store.backend.journal_path.write_bytes(journal)
+        
+        assert json_store(path).get()["download_logs"] == [{"id": "l1"}]
+        print("✓ Compaction is idempotent")
+
+
+class TestMultiWorker:
+    """Several worker processes sharing one JSON data file"""
+    
+    def test_workers_see_each_other(self, tmp_path):
+        """Test appends by one worker are tailed from the journal by another"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        worker_b = json_store(path)
+        assert worker_b.get()["access_codes"] == []
+        
+        worker_a.append("access_codes", {"id": "c1", "active": True})
+        worker_b.update("access_codes", "c1", {"active": False})
+        assert worker_a.get()["access_codes"] == [{"id": "c1", "active": False}]
+        assert worker_b.get()["access_codes"] == [{"id": "c1", "active": False}]
+        print("✓ Workers see each other's writes")
+    
+    def test_no_lost_updates_across_workers(self, tmp_path):
+        """Test concurrent read-modify-write from two workers keeps every increment"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path, compact_every=7)
+        worker_b = json_store(path, compact_every=7)
+        worker_a.append("access_codes", {"id": "c1", "downloads": 0})
+        
+        def bump(store):
+            store.update("access_codes", "c1", lambda r: {"downloads": r["downloads"] + 1})
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for i in range(100):
+                pool.submit(bump, worker_a if i % 2 else worker_b)
+        
+        assert worker_a.get()["access_codes"][0]["downloads"] == 100
+        assert worker_b.get()["access_codes"][0]["downloads"] == 100
+        assert json_store(path).get()["access_codes"][0]["downloads"] == 100
+        print("✓ No lost updates across workers")
+    
+    def test_reload_after_other_worker_compacts(self, tmp_path):
+        """Test a worker reloads when another one rewrites the snapshot"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path, compact_every=2)
+        worker_b = json_store(path)
+        worker_b.get()
+        
+        for i in range(5):
+            worker_a.append("download_logs", {"id": f"l{i}"})
+        assert [r["id"] for r in worker_b.get()["download_logs"]] == ["l0", "l1", "l2", "l3", "l4"]
+        print("✓ Reload after compaction by another worker")
+    
+    def test_reload_off_the_reading_thread(self, tmp_path):
+        """Test a replaced snapshot is reloaded by the executor, without waiting for the writers' lock"""
+        path = tmp_path / "parcelles.json"
+        worker_a = json_store(path)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            worker_b = DataStore(JsonJournalStorage(path), executor=executor)
+            worker_b.append("download_logs", {"id": "l0"})
+            
+            worker_a.append("download_logs", {"id": "l1"})
+            with worker_a.backend.write_lock():
+                worker_a.save(worker_a.get())
+                # The read returns the current document and schedules the reload
+                assert [r["id"] for r in worker_b.get()["download_logs"]] == ["l0"]
+                executor.submit(lambda: None).result(timeout=5)
+                assert [r["id"] for r in worker_b.get()["download_logs"]] == ["l0", "l1"]
+        print("✓ Reload in the executor, without the lock")
+
+
+class TestSnapshotFormat:
+    """Binary snapshots and conversion to/from parcelles.json"""
+    
+    @pytest.mark.parametrize("codec", ["orjson", "msgpack", "json"])
+    def test_binary_round_trip(self, tmp_path, monkeypatch, codec):
+        """Test a binary snapshot reloads identically with each codec"""
+        if codec != "json" and getattr(storage, codec) is None:
+            pytest.skip(f"{codec} not installed")
+        for module in ("orjson", "msgpack"):
+            if module != codec:
+                monkeypatch.setattr(storage, module, None)
+        path = tmp_path / "parcelles.json"
+        store = json_store(path, snapshot_format="binary")
+        store.append("parcelles", {"id": "p1", "nom": "Lot Éburnie", "superficie": 1.5, "coordinates": [[-4.28, 5.34]]})
+        store.save(store.get())
+        
+        raw = (tmp_path / "parcelles.snap").read_bytes()
+        assert raw.startswith(storage.SNAPSHOT_MAGIC)
+        assert not path.exists()
+        reloaded = json_store(path, snapshot_format="binary").get()
+        assert reloaded["parcelles"] == [{"id": "p1", "nom": "Lot Éburnie", "superficie": 1.5, "coordinates": [[-4.28, 5.34]]}]
+        print(f"✓ Binary snapshot round trip ({codec})")
+    
+    def test_newer_version_refused(self):
+        """Test a snapshot from a newer format version is not misread"""
+        raw = storage.SNAPSHOT_MAGIC + bytes([storage.SNAPSHOT_VERSION + 1, storage.CODEC_JSON]) + b"{}"
+        with pytest.raises(ValueError):
+            storage.decode_snapshot(raw)
+        print("✓ Newer snapshot version refused")
+    
+    def test_convert_and_export(self, tmp_path):
+        """Test switching formats keeps the data and export gives readable JSON"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1"}], "config": {"map_zoom": 15}})
+        json_store(path).append("access_codes", {"id": "c1", "code": "ABCD2345"})
+        
+        convert_snapshot(path, "binary")
+        assert not path.exists() and (tmp_path / "parcelles.snap").exists()
+        binary_store = json_store(path, snapshot_format="binary")
+        binary_store.append("access_codes", {"id": "c2", "code": "WXYZ6789"})
+        
+        export_json(path, tmp_path / "export.json")
+        with open(tmp_path / "export.json", encoding='utf-8') as f:
+            exported = json.load(f)
+        assert [c["id"] for c in exported["access_codes"]] == ["c1", "c2"]
+        assert exported["parcelles"] == [{"id": "p1"}]
+        
+        # A JSON-configured store reads the binary snapshot and writes JSON back
+        store = json_store(path)
+        assert [c["id"] for c in store.get()["access_codes"]] == ["c1", "c2"]
+        store.save(store.get())
+        assert path.exists() and not (tmp_path / "parcelles.snap").exists()
+        print("✓ Converted and exported")
+
+
+class TestSqliteStorage:
+    """SQLite backend tests"""
+    
+    def test_mutations_round_trip(self, tmp_path):
+        """Test every mutation kind is persisted and order is preserved"""
+        db = tmp_path / "parcelles.db"
+        store = DataStore(SqliteStorage(db))
+        store.extend("parcelles", [{"id": "p1", "statut": "disponible"}, {"id": "p2", "statut": "vendu"}])
+        store.update("parcelles", "p1", {"statut": "option"})
+        store.append("access_requests", {"id": "a1"})
+        store.set("config", {"map_zoom": 14})
+        store.append("code_requests", {"id": "r1", "status": "pending"})
+        store.remove("code_requests", "r1")
+        
+        reloaded = DataStore(SqliteStorage(db)).get()
+        assert reloaded["parcelles"] == [{"id": "p1", "statut": "option"}, {"id": "p2", "statut": "vendu"}]
+        assert reloaded["access_requests"] == [{"id": "a1"}]
+        assert reloaded["config"] == {"map_zoom": 14}
+        assert reloaded["code_requests"] == []
+        print("✓ SQLite round trip")
+    
+    def test_indexed_query(self, tmp_path):
+        """Test filtered, ordered and limited queries"""
+        store = DataStore(SqliteStorage(tmp_path / "parcelles.db"))
+        for i, status in enumerate(["pending", "contacted", "pending"]):
+            store.append("code_requests", {"id": f"r{i}", "status": status, "created_at": f"2026-01-0{i + 1}"})
+        
+        rows = store.query("code_requests", order_by="created_at", descending=True, limit=1, status="pending")
+        assert [r["id"] for r in rows] == ["r2"]
+        # Same answer when the JSON backend scans memory
+        memory = json_store(tmp_path / "parcelles.json")
+        memory.extend("code_requests", store.get()["code_requests"])
+        assert memory.query("code_requests", order_by="created_at", descending=True, limit=1, status="pending") == rows
+        print("✓ Indexed query")
+    
+    def test_sees_other_process_writes(self, tmp_path):
+        """Test a store reloads after another connection commits"""
+        db = tmp_path / "parcelles.db"
+        worker_a = DataStore(SqliteStorage(db))
+        worker_b = DataStore(SqliteStorage(db))
+        assert worker_b.get()["code_requests"] == []
+        
+        worker_a.append("code_requests", {"id": "r1", "created_at": "2026-01-01"})
+        assert worker_b.get()["code_requests"] == [{"id": "r1", "created_at": "2026-01-01"}]
+        print("✓ Cross-connection change detected")
+    
+    def test_other_process_writes_applied_incrementally(self, tmp_path, monkeypatch):
+        """Test another connection's mutations are replayed from the changes table, not reloaded"""
+        db = tmp_path / "parcelles.db"
+        worker_a = DataStore(SqliteStorage(db, changes_keep=5))
+        worker_b = DataStore(SqliteStorage(db, changes_keep=5))
+        worker_a.append("access_codes", {"id": "c1", "code": "ABCD2345", "usage_count": 0})
+        worker_b.get()
+        reloads = []
+        original_load = worker_b.backend.load
+        monkeypatch.setattr(worker_b.backend, "load", lambda: reloads.append(1) or original_load())
+        
+        worker_a.update_many("access_codes", {"c1": {"usage_count": 3}})
+        worker_a.set("config", {"map_zoom": 12})
+        assert worker_b.lookup("access_codes", "code", "ABCD2345")["usage_count"] == 3
+        assert worker_b.get()["config"] == {"map_zoom": 12}
+        worker_b.update("access_codes", "c1", {"usage_count": 4})
+        assert worker_a.find("access_codes", "c1")["usage_count"] == 4
+        assert reloads == []
+        
+        # Whole-document saves, and records dropped before they were seen, mean a reload
+        worker_a.save({"parcelles": [{"id": "p1"}], "config": {}})
+        assert worker_b.find("parcelles", "p1") == {"id": "p1"}
+        for i in range(6):
+            worker_a.append("code_requests", {"id": f"r{i}"})
+        assert len(worker_b.get()["code_requests"]) == 6
+        assert reloads == [1, 1]
+        print("✓ Other connection's writes applied incrementally")
+    
+    def test_migrate_from_json(self, tmp_path):
+        """Test the JSON file (with pending journal) is migrated once"""
+        path = tmp_path / "parcelles.json"
+        write_doc(path, {"parcelles": [{"id": "p1"}], "config": {"map_zoom": 15}, "admin": {}})
+        json_store(path).append("access_codes", {"id": "c1", "code": "ABCD2345", "active": True})
+        db = tmp_path / "parcelles.db"
+        
+        counts = migrate_json_to_sqlite(path, db)
+        assert counts["parcelles"] == 1 and counts["access_codes"] == 1
+        migrated = DataStore(SqliteStorage(db)).get()
+        assert migrated["access_codes"][0]["code"] == "ABCD2345"
+        assert "journal_seq" not in migrated
+        
+        try:
+            migrate_json_to_sqlite(path, db)
+            assert False, "Expected second migration to be refused"
+        except RuntimeError:
+            pass
+        print("✓ JSON migrated to SQLite")
@@ -0,0 +1,53 @@
+"""
+Test suite for the executors
+Tests the process pool used for PDF rendering:
+- Jobs run outside the server process
+- A full queue refuses new jobs instead of queueing them
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+import executors
+from executors import run_cpu, PoolBusy
+
+
+class TestCpuPool:
+    """Process pool tests"""
+    
+    def test_runs_in_worker_process(self):
+        """Test CPU jobs run in another process"""
+        assert asyncio.run(run_cpu(os.getpid)) != os.getpid()
+        assert executors.cpu_jobs == 0
+        print("✓ CPU job run in a worker process")
+    
+    def test_saturated_pool_refuses(self, monkeypatch):
+        """Test jobs beyond CPU_QUEUE_LIMIT get PoolBusy, and slots free up"""
+        monkeypatch.setattr(executors, "CPU_QUEUE_LIMIT", 1)
+        
+        async def scenario():
+            running = asyncio.ensure_future(run_cpu(time.sleep, 0.5))
+            await asyncio.sleep(0)
+            with pytest.raises(PoolBusy) as refused:
+                await run_cpu(os.getpid)
+            assert refused.value.retry_after > 0
+            await running
+            return await run_cpu(os.getpid)
+        
+        assert asyncio.run(scenario()) != os.getpid()
+        assert executors.cpu_jobs == 0
+        print("✓ Saturated pool refuses jobs")
+    
+    def test_broken_pool_replaced(self):
+        """Test a pool whose worker died is replaced on the next job"""
+        async def scenario():
+            await run_cpu(os.getpid)
+            with pytest.raises(Exception):
+                await run_cpu(os._exit, 1)
+            return await run_cpu(os.getpid)
+        
+        assert asyncio.run(scenario()) != os.getpid()
+        assert executors.cpu_jobs == 0
+        print("✓ Broken pool replaced")
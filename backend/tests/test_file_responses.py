@@ -0,0 +1,56 @@
+"""
+Test suite for file responses
+Tests the helpers behind owner document downloads:
+- Byte range parsing
+- If-None-Match comparison
+- File hashes remembered per file version
+"""
+import os
+
+import pytest
+
+from file_responses import etag_matches, file_sha256, parse_range, strong_etag
+
+
+class TestFileResponses:
+    """Conditional GET and Range tests"""
+    
+    def test_parse_range(self):
+        """Test single byte ranges, suffixes and open ends"""
+        assert parse_range(None, 1000) is None
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=500-5000", 1000) == (500, 999)
+        assert parse_range("bytes=-5000", 1000) == (0, 999)
+        # Several ranges or other units: the whole file
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        assert parse_range("pages=1-2", 1000) is None
+        for unsatisfiable in ("bytes=1000-", "bytes=20-10", "bytes=-0"):
+            with pytest.raises(ValueError):
+                parse_range(unsatisfiable, 1000)
+        print("✓ Byte ranges parsed")
+    
+    def test_etag_matches(self):
+        """Test If-None-Match lists, weak tags and *"""
+        etag = strong_etag("0475198e", "ab" * 32)
+        assert etag == f'"0475198e-{"ab" * 16}"'
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+        print("✓ ETags compared")
+    
+    def test_file_sha256(self, tmp_path):
+        """Test a file's hash follows its content"""
+        path = tmp_path / "titre.pdf"
+        path.write_bytes(b"%PDF-1")
+        first = file_sha256(path)
+        assert file_sha256(path) == first
+        
+        path.write_bytes(b"%PDF-22")
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert file_sha256(path) != first
+        print("✓ File hash per version")
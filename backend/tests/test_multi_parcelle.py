@@ -5,10 +5,18 @@ Tests the PROPRIETAIRE multi-parcelle access feature including:
 - get-owner-parcelles endpoint
 - Profile verification
 - Surveillance access per-parcelle
+- Viewer sessions issued on verification
+- Entitlements endpoint
+- Download logging of ranged document requests
+- Truncated previews only when asked for
 """
 import pytest
 import requests
+import io
 import os
+import time
+
+from PyPDF2 import PdfReader, PdfWriter
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -106,6 +114,35 @@ class TestMultiParcelleAccessCode:
         print(f"  - Profile: {data.get('profile_type')}")
         print(f"  - Parcelles: {parcelle_ids}")
     
+    def test_entitlements_multi(self):
+        """Test one entitlements call describes every parcelle of the code"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/entitlements",
+            data={"code": TEST_PROPRIETAIRE_CODE}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert data.get("profile_type") == "PROPRIETAIRE"
+        assert data.get("is_multi_parcelle") == True
+        assert "session_token" in data
+        parcelles = {p["id"]: p for p in data["parcelles"]}
+        assert set(parcelles) == {"tf-223737", "tf-223738", "tf-223740"}
+        for p in parcelles.values():
+            assert p["show_watermark"] == False
+            assert p["document_count"] == sum(d["file_count"] for d in p["documents"])
+        assert parcelles["tf-223737"]["can_access_surveillance"] == True
+        
+        # The session returned describes the same entitlements
+        again = requests.post(
+            f"{BASE_URL}/api/documents/entitlements",
+            data={"session": data["session_token"]}
+        )
+        assert again.status_code == 200
+        assert again.json()["parcelles"] == data["parcelles"]
+        
+        print(f"✓ Entitlements for {data['parcelle_count']} parcelles in one call")
+    
     def test_get_owner_parcelles_invalid_code(self):
         """Test get-owner-parcelles with invalid code"""
         response = requests.post(
@@ -342,5 +379,232 @@ class TestProspectVsProprietaire:
         print("✓ Surveillance correctly denied for PROSPECT")
 
 
+class TestViewerSession:
+    """Signed viewer sessions issued after a code verification"""
+    
+    def test_session_authorizes_without_code(self):
+        """Test the session from verify-profile replaces the code on later calls"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-profile",
+            data={"code": TEST_PROPRIETAIRE_CODE, "parcelle_id": "tf-223737"}
+        )
+        assert response.status_code == 200
+        session = response.json()["session_token"]
+        
+        response = requests.post(
+            f"{BASE_URL}/api/surveillance/access",
+            data={"session": session, "parcelle_id": "tf-223737"}
+        )
+        assert response.status_code == 200
+        assert response.json().get("client_name") == "Jean Dupont"
+        
+        response = requests.get(
+            f"{BASE_URL}/api/documents/tf-223737/acd",
+            params={"session": session, "action": "info"}
+        )
+        assert response.status_code == 200
+        assert "session=" in response.json()["preview_url"]
+        print("✓ Viewer session accepted in place of the code")
+    
+    def test_session_is_not_an_admin_token(self):
+        """Test admin routes refuse viewer sessions"""
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-code",
+            json={"code": TEST_PROPRIETAIRE_CODE, "parcelle_id": "tf-223737"}
+        )
+        assert response.status_code == 200
+        session = response.json()["session_token"]
+        
+        response = requests.get(
+            f"{BASE_URL}/api/auth/verify",
+            headers={"Authorization": f"Bearer {session}"}
+        )
+        assert response.status_code == 401
+        print("✓ Viewer session refused by admin routes")
+    
+    def test_revocation_ends_sessions(self, admin_headers):
+        """Test revoking a code invalidates its open sessions immediately"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes",
+            headers=admin_headers,
+            json={
+                "client_name": "TEST_SessionRevoke",
+                "client_email": "test_session@example.com",
+                "parcelle_ids": ["tf-223737"]
+            }
+        )
+        assert response.status_code == 200
+        code = response.json()["code"]
+        
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-profile",
+            data={"code": code, "parcelle_id": "tf-223737"}
+        )
+        session = response.json()["session_token"]
+        
+        codes = requests.get(f"{BASE_URL}/api/admin/access-codes", headers=admin_headers).json()["access_codes"]
+        code_id = next(c["id"] for c in codes if c["code"] == code)
+        assert requests.delete(f"{BASE_URL}/api/admin/access-codes/{code_id}", headers=admin_headers).status_code == 200
+        
+        response = requests.get(
+            f"{BASE_URL}/api/documents/tf-223737/acd",
+            params={"session": session, "action": "info"}
+        )
+        assert response.status_code == 401
+        print("✓ Revoked code's session refused")
+    
+    def test_session_after_edit_accepted(self, admin_headers):
+        """Test a session issued right after an edit, within the same second, is accepted"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes",
+            headers=admin_headers,
+            json={
+                "client_name": "TEST_SessionEdit",
+                "client_email": "test_session@example.com",
+                "parcelle_ids": ["tf-223737"]
+            }
+        )
+        assert response.status_code == 200
+        code = response.json()["code"]
+        codes = requests.get(f"{BASE_URL}/api/admin/access-codes", headers=admin_headers).json()["access_codes"]
+        code_id = next(c["id"] for c in codes if c["code"] == code)
+        
+        for name in ("TEST_SessionEdit 1", "TEST_SessionEdit 2"):
+            old = requests.post(
+                f"{BASE_URL}/api/documents/verify-profile",
+                data={"code": code, "parcelle_id": "tf-223737"}
+            ).json()["session_token"]
+            response = requests.put(f"{BASE_URL}/api/admin/access-codes/{code_id}", headers=admin_headers, json={"client_name": name})
+            assert response.status_code == 200
+            new = requests.post(
+                f"{BASE_URL}/api/documents/verify-profile",
+                data={"code": code, "parcelle_id": "tf-223737"}
+            ).json()["session_token"]
+            
+            params = {"action": "info"}
+            assert requests.get(f"{BASE_URL}/api/documents/tf-223737/acd", params={**params, "session": old}).status_code == 401
+            response = requests.get(f"{BASE_URL}/api/documents/tf-223737/acd", params={**params, "session": new})
+            assert response.status_code == 200 and response.json()["accessed_by"] == name
+        print("✓ Session issued after an edit accepted, older one refused")
+
+
+class TestDownloadLogging:
+    """Document accesses recorded in the download logs"""
+    
+    def open_session(self, admin_headers, client_name, profile_type):
+        """A new code and the viewer session verifying it opens"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes",
+            headers=admin_headers,
+            json={
+                "client_name": client_name,
+                "client_email": "test_logging@example.com",
+                "parcelle_ids": ["tf-223737"],
+                "profile_type": profile_type
+            }
+        )
+        assert response.status_code == 200
+        code = response.json()["code"]
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-profile",
+            data={"code": code, "parcelle_id": "tf-223737"}
+        )
+        assert response.status_code == 200
+        return code, response.json()["session_token"]
+    
+    def logged(self, admin_headers, code):
+        time.sleep(1)  # Entries are written in the background
+        logs = requests.get(f"{BASE_URL}/api/admin/download-logs", headers=admin_headers).json()["logs"]
+        return [log for log in logs if log["code"] == code]
+    
+    def test_ranged_watermarked_document_logged(self, admin_headers):
+        """Test a watermarked document requested with a Range not at 0 is still logged"""
+        code, session = self.open_session(admin_headers, "TEST_LogProspect", "PROSPECT")
+        response = requests.get(
+            f"{BASE_URL}/api/documents/tf-223737/acd",
+            params={"session": session},
+            headers={"Range": "bytes=1-"}
+        )
+        assert response.status_code == 200
+        assert len(self.logged(admin_headers, code)) == 1
+        print("✓ Ranged request for a watermarked document logged")
+    
+    def test_original_logged_once_per_opening(self, admin_headers):
+        """Test only the 206 continuations of an original go unlogged"""
+        code, session = self.open_session(admin_headers, "TEST_LogOwner", "PROPRIETAIRE")
+        url = f"{BASE_URL}/api/documents/tf-223737/acd"
+        assert requests.get(url, params={"session": session}).status_code == 200
+        response = requests.get(url, params={"session": session}, headers={"Range": "bytes=1-"})
+        assert response.status_code == 206
+        response = requests.get(url, params={"session": session}, headers={"Range": "bytes=1-", "If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert len(self.logged(admin_headers, code)) == 2
+        print("✓ Original logged when opened, not for its further ranges")
+
+
+class TestPreviewPages:
+    """Watermarked previews cut to their first pages"""
+    
+    @pytest.fixture
+    def document(self, admin_headers):
+        """A three-page document uploaded to tf-223745 for the test"""
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(width=595, height=842)
+        pdf = io.BytesIO()
+        writer.write(pdf)
+        response = requests.post(
+            f"{BASE_URL}/api/admin/upload/document/tf-223745",
+            headers=admin_headers,
+            data={"document_type": "autre"},
+            files={"file": ("TEST_preview.pdf", pdf.getvalue(), "application/pdf")}
+        )
+        assert response.status_code == 200
+        if response.json()["total_docs"] != 1:
+            pytest.skip("tf-223745 already has an 'autre' document")
+        yield f"{BASE_URL}/api/documents/tf-223745/autre"
+        requests.delete(
+            f"{BASE_URL}/api/admin/document/tf-223745/autre",
+            headers=admin_headers,
+            params={"document_id": response.json()["document_id"]}
+        )
+    
+    @pytest.fixture
+    def session(self, admin_headers):
+        """A PROSPECT viewer session for tf-223745"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/access-codes",
+            headers=admin_headers,
+            json={
+                "client_name": "TEST_Preview",
+                "client_email": "test_preview@example.com",
+                "parcelle_ids": ["tf-223745"]
+            }
+        )
+        assert response.status_code == 200
+        response = requests.post(
+            f"{BASE_URL}/api/documents/verify-profile",
+            data={"code": response.json()["code"], "parcelle_id": "tf-223745"}
+        )
+        assert response.status_code == 200
+        return response.json()["session_token"]
+    
+    def test_without_action_whole_document(self, document, session):
+        """Test a request without action gets every page, only action=preview is cut"""
+        response = requests.get(document, params={"session": session})
+        assert response.status_code == 200
+        assert len(PdfReader(io.BytesIO(response.content)).pages) == 3
+        assert "X-Preview-Pages" not in response.headers
+        
+        response = requests.get(document, params={"session": session, "action": "download"})
+        assert len(PdfReader(io.BytesIO(response.content)).pages) == 3
+        
+        response = requests.get(document, params={"session": session, "action": "preview"})
+        preview_pages = int(response.headers["X-Preview-Pages"])
+        assert response.headers["X-Page-Count"] == "3"
+        assert len(PdfReader(io.BytesIO(response.content)).pages) == preview_pages
+        print(f"✓ Whole document without action, {preview_pages} page(s) on preview")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,96 @@
+"""
+Test suite for code verification throttling
+Tests the in-memory guards in front of the access code lookups:
+- Token buckets per key, refill and retry delay
+- Bounded number of tracked keys
+- Negative cache of refused codes
+- Client addresses behind trusted proxies
+"""
+from rate_limit import RateLimiter, NegativeCache, code_prefix, forwarded_client, parse_networks
+
+
+class TestRateLimiter:
+    """Token bucket tests (explicit clock)"""
+    
+    def test_burst_then_refill(self):
+        """Test a key gets `burst` attempts, then one per refill interval"""
+        limiter = RateLimiter(per_minute=60, burst=3)
+        assert [limiter.allow("1.2.3.4", now=0) for _ in range(4)] == [True, True, True, False]
+        assert limiter.retry_after("1.2.3.4", now=0) == 1.0
+        
+        assert limiter.allow("1.2.3.4", now=1.0)
+        assert not limiter.allow("1.2.3.4", now=1.5)
+        # Other keys have their own bucket
+        assert limiter.allow("5.6.7.8", now=1.5)
+        print("✓ Burst then refill")
+    
+    def test_refill_capped_at_burst(self):
+        """Test a long idle period does not bank more than `burst` tokens"""
+        limiter = RateLimiter(per_minute=60, burst=2)
+        limiter.allow("k", now=0)
+        assert [limiter.allow("k", now=3600) for _ in range(3)] == [True, True, False]
+        print("✓ Refill capped")
+    
+    def test_tracked_keys_bounded(self):
+        """Test distinct keys cannot grow the table past its bound"""
+        limiter = RateLimiter(per_minute=60, burst=5, max_keys=100)
+        for n in range(1000):
+            limiter.allow(f"client-{n}", now=n * 0.001)
+        assert len(limiter.buckets) <= 100
+        print(f"✓ {len(limiter.buckets)} keys tracked")
+
+
+class TestNegativeCache:
+    """Refused code cache tests"""
+    
+    def test_entries_expire(self):
+        """Test refused codes are forgotten after the TTL, or on discard"""
+        cache = NegativeCache(ttl=30)
+        cache.add("BADCODE1", now=0)
+        cache.add("BADCODE2", now=0)
+        assert cache.contains("BADCODE1", now=29)
+        assert not cache.contains("BADCODE1", now=30)
+        
+        cache.discard("BADCODE2")
+        assert not cache.contains("BADCODE2", now=1)
+        print("✓ Refused codes expire")
+    
+    def test_size_bounded(self):
+        """Test the oldest entries go first when the cache is full"""
+        cache = NegativeCache(ttl=30, max_entries=10)
+        for n in range(25):
+            cache.add(f"CODE{n}", now=0)
+        assert len(cache.entries) == 10
+        assert not cache.contains("CODE0", now=1)
+        assert cache.contains("CODE24", now=1)
+        print("✓ Cache size bounded")
+    
+    def test_code_prefix(self):
+        """Test prefix buckets ignore case"""
+        assert code_prefix("abcd2345") == code_prefix("ABCX9999") == "ABC"
+        print("✓ Code prefix")
+
+
+class TestForwardedClient:
+    """Client address tests (proxy networks given explicitly)"""
+    
+    def test_forwarded_clients_get_own_buckets(self):
+        """Test two visitors behind the same ingress are throttled separately"""
+        proxies = parse_networks("10.0.0.0/8, 127.0.0.1")
+        limiter = RateLimiter(per_minute=60, burst=2)
+        first = forwarded_client("10.1.2.3", "41.202.1.1", proxies)
+        second = forwarded_client("10.1.2.3", "41.202.9.9, 10.0.0.7", proxies)
+        assert (first, second) == ("41.202.1.1", "41.202.9.9")
+        
+        assert [limiter.allow(first, now=0) for _ in range(3)] == [True, True, False]
+        assert limiter.allow(second, now=0)
+        print("✓ Forwarded clients throttled separately")
+    
+    def test_untrusted_header_ignored(self):
+        """Test X-Forwarded-For is only believed from a trusted proxy"""
+        proxies = parse_networks("10.0.0.0/8")
+        assert forwarded_client("41.202.1.1", "1.2.3.4", proxies) == "41.202.1.1"
+        # A client-supplied hop before the real one is not taken
+        assert forwarded_client("10.1.2.3", "1.2.3.4, 41.202.1.1", proxies) == "41.202.1.1"
+        assert forwarded_client("10.1.2.3", "1.2.3.4", []) == "10.1.2.3"
+        print("✓ Untrusted forwarding headers ignored")
@@ -0,0 +1,72 @@
+"""
+Test suite for the render cache
+Tests watermarked outputs kept on disk per access code:
+- Outputs served back until the original changes
+- Dropped per code (revoked, edited, lapsed)
+- Total size bounded, least recently served evicted first
+"""
+import os
+
+from render_cache import RenderCache
+
+
+class TestRenderCache:
+    """Render cache tests"""
+    
+    def test_put_get(self, tmp_path):
+        """Test an output is served back for the same code, document and version"""
+        cache = RenderCache(tmp_path)
+        assert cache.get("code-1", "doc-1", "1-100") is None
+        
+        cache.put("code-1", "doc-1", "1-100", b"%PDF-watermarked")
+        assert cache.get("code-1", "doc-1", "1-100") == b"%PDF-watermarked"
+        assert cache.get("code-1", "doc-1", "2-120") is None
+        assert cache.get("code-2", "doc-1", "1-100") is None
+        assert not [p for p in (tmp_path / "code-1").iterdir() if p.name.startswith(".")]
+        print("✓ Output cached per code, document and version")
+    
+    def test_drop_and_retain(self, tmp_path):
+        """Test outputs are removed with their code"""
+        cache = RenderCache(tmp_path)
+        for code_id in ("code-1", "code-2", "code-3"):
+            cache.put(code_id, "doc-1", "1-100", b"%PDF")
+        
+        cache.drop_code("code-1")
+        assert cache.get("code-1", "doc-1", "1-100") is None
+        
+        assert cache.retain(["code-3"]) == 1
+        assert cache.get("code-2", "doc-1", "1-100") is None
+        assert cache.get("code-3", "doc-1", "1-100") == b"%PDF"
+        print("✓ Outputs dropped with their code")
+    
+    def test_size_bound(self, tmp_path):
+        """Test the least recently served outputs are evicted over the size cap"""
+        cache = RenderCache(tmp_path, max_mb=2500 / (1024 * 1024))
+        cache.put("code-1", "doc-1", "v", b"a" * 1000)
+        cache.put("code-2", "doc-1", "v", b"b" * 1000)
+        # Served long ago
+        os.utime(cache.path("code-1", "doc-1", "v"), (1, 1))
+        cache.put("code-3", "doc-1", "v", b"c" * 1000)
+        
+        assert cache.get("code-1", "doc-1", "v") is None
+        assert cache.get("code-2", "doc-1", "v") is not None
+        assert cache.get("code-3", "doc-1", "v") is not None
+        assert cache.size <= cache.max_bytes
+        print("✓ Render cache bounded by size")
+    
+    def test_commit_and_open(self, tmp_path):
+        """Test an output written by another process is moved into place and stays readable"""
+        cache = RenderCache(tmp_path)
+        tmp = cache.temp_path("code-1", "doc-1", "v")
+        tmp.write_bytes(b"%PDF-rendered")
+        
+        with cache.commit(tmp, "code-1", "doc-1", "v") as handle:
+            assert handle.read() == b"%PDF-rendered"
+        assert not tmp.exists()
+        
+        handle = cache.open("code-1", "doc-1", "v")
+        cache.drop_code("code-1")
+        assert handle.read() == b"%PDF-rendered"
+        handle.close()
+        assert cache.open("code-1", "doc-1", "v") is None
+        print("✓ Output committed and opened")
@@ -0,0 +1,95 @@
+"""
+Test suite for access code usage counters
+Tests the in-memory counters behind the "accès" column:
+- Live counts before and after a flush
+- Counts from several workers adding up
+- Failed flushes and shutdown
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from data_store import DataStore
+from storage import JsonJournalStorage
+from usage import UsageCounters
+
+
+def code_store(path):
+    store = DataStore(JsonJournalStorage(path))
+    if not store.get()["access_codes"]:
+        store.extend("access_codes", [{"id": "c1", "code": "ABCD2345", "active": True, "usage_count": 0},
+                                      {"id": "c2", "code": "WXYZ6789", "active": True}])
+    return store
+
+
+def at(hour):
+    return datetime(2026, 3, 1, hour, tzinfo=timezone.utc)
+
+
+class TestUsageCounters:
+    """Batched usage counter tests"""
+    
+    def test_live_counts_then_flush(self, tmp_path):
+        """Test counts are visible at once and written in one batch"""
+        store = code_store(tmp_path / "parcelles.json")
+        usage = UsageCounters(store)
+        usage.record("c1", when=at(9))
+        usage.record("c1", "acd", when=at(11))
+        usage.record("c1", "acd", when=at(10))
+        usage.record("c2", "plan", when=at(8))
+        
+        live = usage.live(store.find("access_codes", "c1"))
+        assert live == {"usage_count": 3, "last_used_at": at(11).isoformat(),
+                        "usage_by_type": {"verification": 1, "acd": 2}}
+        assert store.find("access_codes", "c1")["usage_count"] == 0
+        
+        assert usage.flush_now() == 2
+        assert usage.flush_now() == 0
+        stored = DataStore(JsonJournalStorage(tmp_path / "parcelles.json")).find("access_codes", "c1")
+        assert stored["usage_count"] == 3
+        assert stored["usage_by_type"] == {"verification": 1, "acd": 2}
+        assert usage.live(stored) == live
+        print("✓ Live counts, one flush")
+    
+    def test_workers_add_up(self, tmp_path):
+        """Test two workers' counts for the same code are summed, not overwritten"""
+        path = tmp_path / "parcelles.json"
+        worker_a, worker_b = code_store(path), code_store(path)
+        usage_a, usage_b = UsageCounters(worker_a), UsageCounters(worker_b)
+        for _ in range(3):
+            usage_a.record("c1", "acd", when=at(9))
+        usage_b.record("c1", "plan", when=at(12))
+        
+        usage_a.flush_now()
+        usage_b.flush_now()
+        stored = code_store(path).find("access_codes", "c1")
+        assert stored["usage_count"] == 4
+        assert stored["usage_by_type"] == {"acd": 3, "plan": 1}
+        assert stored["last_used_at"] == at(12).isoformat()
+        print("✓ Workers add up")
+    
+    def test_failed_flush_keeps_counts(self, tmp_path):
+        """Test counts survive a failed write and are written by stop()"""
+        store = code_store(tmp_path / "parcelles.json")
+        usage = UsageCounters(store, interval=3600)
+        original = store.update_many
+        
+        def failing_update(*args):
+            raise RuntimeError("disk full")
+        store.update_many = failing_update
+        usage.record("c1", when=at(9))
+        
+        with pytest.raises(RuntimeError):
+            usage.flush_now()
+        usage.record("c1", "acd", when=at(10))
+        assert usage.live(store.find("access_codes", "c1"))["usage_count"] == 2
+        
+        store.update_many = original
+        
+        async def scenario():
+            usage.start()
+            await usage.stop()
+        asyncio.run(scenario())
+        assert store.find("access_codes", "c1")["usage_count"] == 2
+        print("✓ Failed flush retried, stop flushes")
@@ -0,0 +1,270 @@
+"""
+Test suite for PDF watermarking
+Tests the caches behind add_watermark_to_pdf:
+- Overlay rendered once per client/code/page size
+- Overlays sized to each page
+- Bounded LRU eviction
+- Original documents read once, until the file changes
+- Watermark embedded once as a Form XObject: smaller and faster than merging it into each page
+- Previews of the first pages only
+- Placeholder bodies rendered once per parcelle, stamped per client
+"""
+import io
+import os
+import time
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import NameObject, RectangleObject
+from reportlab.lib.pagesizes import A4, A3
+from reportlab.pdfgen import canvas
+
+from watermark import (OverlayCache, overlay_cache, DocumentCache, placeholder_templates, create_watermark_pdf,
+                       add_watermark_to_pdf, add_watermark_to_document, add_watermark_to_file,
+                       create_placeholder_acd_pdf, create_placeholder_plan_pdf)
+
+
+def make_pdf(*page_sizes):
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet)
+    for size in page_sizes:
+        c.setPageSize(size)
+        c.drawString(50, 50, "Original")
+        c.showPage()
+    c.save()
+    return packet.getvalue()
+
+
+def page_text(pdf_bytes, index=0):
+    return PdfReader(io.BytesIO(pdf_bytes)).pages[index].extract_text()
+
+
+def merged_into_each_page(pdf_bytes, client_name, access_code):
+    """The former approach: the overlay page merged into the content of every page"""
+    overlay = PdfReader(create_watermark_pdf(client_name, access_code, A4)).pages[0]
+    writer = PdfWriter()
+    for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+        writer.add_page(page).merge_page(overlay)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def best_time(func, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class TestWatermark:
+    """Watermark overlay tests"""
+    
+    def test_overlay_rendered_once(self):
+        """Test repeated previews reuse the parsed overlay"""
+        overlay_cache.clear()
+        pdf = make_pdf(A4)
+        misses = overlay_cache.misses
+        
+        first = add_watermark_to_pdf(pdf, "Awa Koné", "ABCD2345")
+        second = add_watermark_to_pdf(pdf, "Awa Koné", "ABCD2345")
+        assert overlay_cache.misses == misses + 1
+        assert "ABCD2345" in page_text(first) and "ABCD2345" in page_text(second)
+        assert "Original" in page_text(second)
+        
+        add_watermark_to_pdf(pdf, "Koffi", "WXYZ6789")
+        assert overlay_cache.misses == misses + 2
+        print("✓ Overlay rendered once per client/code")
+    
+    def test_overlay_per_page_size(self):
+        """Test each page gets an overlay of its own size"""
+        overlay_cache.clear()
+        result = add_watermark_to_pdf(make_pdf(A4, A3, A4), "Awa", "ABCD2345")
+        
+        assert len(PdfReader(io.BytesIO(result)).pages) == 3
+        widths = sorted(round(key[2][0]) for key in overlay_cache.entries)
+        assert widths == [round(A4[0]), round(A3[0])]
+        print("✓ One overlay per page size")
+    
+    def test_lru_eviction(self):
+        """Test the cache keeps at most its size, dropping the least recently used"""
+        cache = OverlayCache(max_entries=2)
+        cache.get("A", "CODE1", A4)
+        cache.get("B", "CODE2", A4)
+        cache.get("A", "CODE1", A4)
+        cache.get("C", "CODE3", A4)
+        
+        assert len(cache.entries) == 2
+        assert [key[1] for key in cache.entries] == ["CODE1", "CODE3"]
+        print("✓ LRU eviction")
+    
+    def test_document_read_once(self, tmp_path):
+        """Test an original is read and parsed once, and reused unchanged"""
+        path = tmp_path / "acd.pdf"
+        path.write_bytes(make_pdf(A4, A4))
+        cache = DocumentCache()
+        
+        document = cache.get(path)
+        first = add_watermark_to_document(document, "Awa", "ABCD2345")
+        assert cache.get(path) is document and cache.hits == 1
+        
+        second = add_watermark_to_document(cache.get(path), "Koffi", "WXYZ6789")
+        assert "WXYZ6789" in page_text(second, 1)
+        assert "ABCD2345" not in page_text(second, 1)
+        assert "ABCD2345" in page_text(first, 1)
+        print("✓ Original document reused without carrying earlier watermarks")
+    
+    def test_document_changed(self, tmp_path):
+        """Test a changed file is read again"""
+        path = tmp_path / "plan.pdf"
+        path.write_bytes(make_pdf(A4))
+        cache = DocumentCache()
+        document = cache.get(path)
+        
+        path.write_bytes(make_pdf(A4, A3))
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        changed = cache.get(path)
+        assert changed is not document and len(changed.pages) == 2
+        assert cache.get(path) is changed and cache.misses == 2
+        print("✓ Changed documents read again")
+    
+    def test_document_cache_size(self, tmp_path):
+        """Test the cache stays under its size, dropping the least recently used"""
+        paths = []
+        for name in ("a", "b", "c"):
+            path = tmp_path / f"{name}.pdf"
+            path.write_bytes(make_pdf(A4))
+            paths.append(path)
+        size = paths[0].stat().st_size
+        cache = DocumentCache(max_mb=2.5 * size / (1024 * 1024))
+        
+        for path in paths:
+            cache.get(path)
+        assert list(cache.entries) == [str(paths[1]), str(paths[2])]
+        assert cache.size <= cache.max_bytes
+        
+        cache.max_bytes = size - 1
+        cache.get(tmp_path / "a.pdf")
+        assert str(paths[0]) not in cache.entries
+        print("✓ Document cache bounded by size")
+    
+    def test_watermark_written_to_file(self, tmp_path):
+        """Test a watermarked document can be written straight to a file"""
+        original = tmp_path / "titre.pdf"
+        original.write_bytes(make_pdf(A4, A4, A4))
+        output = tmp_path / "out.pdf"
+        
+        assert add_watermark_to_file(str(original), "Awa", "ABCD2345", str(output)) is None
+        written = output.read_bytes()
+        assert len(PdfReader(io.BytesIO(written)).pages) == 3
+        assert "ABCD2345" in page_text(written, 2)
+        print("✓ Watermarked document written to file")
+
+    
+    def test_watermark_embedded_once(self):
+        """Test every page draws the same watermark XObject"""
+        result = add_watermark_to_pdf(make_pdf(*[A4] * 10, A3), "Awa", "ABCD2345")
+        
+        pages = PdfReader(io.BytesIO(result)).pages
+        forms = [page["/Resources"]["/XObject"].raw_get("/OgdWatermark").idnum for page in pages]
+        assert len(set(forms[:10])) == 1 and forms[10] != forms[0]
+        assert all("Original" in page.extract_text() and "ABCD2345" in page.extract_text() for page in pages)
+        print("✓ Watermark embedded once per page size")
+    
+    def test_smaller_and_faster_than_merge(self):
+        """Test a multi-page output against merging the overlay into each page"""
+        pdf = make_pdf(*[A4] * 30)
+        add_watermark_to_pdf(pdf, "Awa", "ABCD2345")  # overlay cached
+        
+        shared = add_watermark_to_pdf(pdf, "Awa", "ABCD2345")
+        merged = merged_into_each_page(pdf, "Awa", "ABCD2345")
+        assert len(shared) * 3 < len(merged)
+        
+        shared_time = best_time(lambda: add_watermark_to_pdf(pdf, "Awa", "ABCD2345"))
+        merged_time = best_time(lambda: merged_into_each_page(pdf, "Awa", "ABCD2345"))
+        assert shared_time < merged_time
+        print(f"✓ 30 pages: {len(shared) // 1024} KiB in {shared_time * 1000:.1f} ms, "
+              f"merged per page {len(merged) // 1024} KiB in {merged_time * 1000:.1f} ms")
+    
+    def test_blank_page(self):
+        """Test pages without content or resources are watermarked"""
+        writer = PdfWriter()
+        writer.add_blank_page(*A4)
+        packet = io.BytesIO()
+        writer.write(packet)
+        
+        result = add_watermark_to_pdf(packet.getvalue(), "Awa", "ABCD2345")
+        assert "ABCD2345" in page_text(result)
+        print("✓ Blank page watermarked")
+
+    
+    def test_preview_first_pages(self, tmp_path):
+        """Test a preview parses and watermarks only the first pages"""
+        original = tmp_path / "titre.pdf"
+        original.write_bytes(make_pdf(*[A4] * 6))
+        cache = DocumentCache()
+        document = cache.get(original)
+        
+        preview = add_watermark_to_document(document, "Awa", "ABCD2345", max_pages=2)
+        assert len(PdfReader(io.BytesIO(preview)).pages) == 2
+        assert "ABCD2345" in page_text(preview, 1)
+        assert len(document._writer.pages) == 2 and document.page_count == 6
+        
+        full = add_watermark_to_document(document, "Awa", "ABCD2345")
+        assert len(PdfReader(io.BytesIO(full)).pages) == 6
+        assert len(add_watermark_to_document(document, "Awa", "ABCD2345", max_pages=10)) == len(full)
+        print("✓ Preview of the first pages")
+
+    
+    def test_preview_inherited_page_size(self, tmp_path):
+        """Test preview pages take the attributes they inherit from the page tree"""
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(*A3)
+        for page in writer.pages:
+            del page["/MediaBox"]
+        writer._root_object["/Pages"][NameObject("/MediaBox")] = RectangleObject([0, 0, *A3])
+        original = tmp_path / "plan.pdf"
+        with open(original, 'wb') as f:
+            writer.write(f)
+        
+        preview = add_watermark_to_document(DocumentCache().get(original), "Awa", "ABCD2345", max_pages=1)
+        page = PdfReader(io.BytesIO(preview)).pages[0]
+        assert round(page.mediabox.width) == round(A3[0]) and "ABCD2345" in page.extract_text()
+        print("✓ Preview pages inherit their size")
+
+
+class TestPlaceholders:
+    """Placeholder template tests"""
+    
+    def test_template_rendered_once(self):
+        """Test the body is rendered once per parcelle and stamped for each client"""
+        placeholder_templates.clear()
+        misses = placeholder_templates.misses
+        
+        first = create_placeholder_acd_pdf("Lot 12", "CI-2024-012", "Awa Koné", "ABCD2345")
+        second = create_placeholder_acd_pdf("Lot 12", "CI-2024-012", "Koffi", "WXYZ6789")
+        assert placeholder_templates.misses == misses + 1
+        
+        text = page_text(second)
+        assert "ARRÊTÉ DE CONCESSION DÉFINITIVE" in text and "CI-2024-012" in text
+        assert "Préparé pour Koffi" in text and "WXYZ6789" in text
+        assert "Awa" not in text and "Awa Koné" in page_text(first)
+        
+        create_placeholder_acd_pdf("Lot 13", "CI-2024-013", "Koffi", "WXYZ6789")
+        assert placeholder_templates.misses == misses + 2
+        print("✓ Placeholder body rendered once per parcelle")
+    
+    def test_plan_stamped(self):
+        """Test the plan is a valid one-page PDF with the parcelle and client text"""
+        pdf = create_placeholder_plan_pdf("Lot 12", "CI-2024-012", 1.5, "Awa (Koné)", "ABCD2345")
+        
+        reader = PdfReader(io.BytesIO(pdf), strict=True)
+        assert len(reader.pages) == 1
+        text = reader.pages[0].extract_text()
+        assert "Surface: 1.5 ha" in text and "Ref: CI-2024-012" in text
+        assert "Préparé pour Awa (Koné)" in text and "Code: ABCD2345" in text
+        print("✓ Placeholder plan stamped")
@@ -0,0 +1,135 @@
+# Access code usage counters: counted in memory, flushed to the code records in batches
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from executors import run_io
+
+logger = logging.getLogger(__name__)
+
+# How often pending counts are written to the store
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('USAGE_FLUSH_INTERVAL_SECONDS', '5'))
+
+# usage_by_type key for successful code verifications (the others are document types)
+VERIFICATION = "verification"
+
+
+def add_deltas(a: Optional[dict], b: Optional[dict]) -> Optional[dict]:
+    """Sum of two pending usage deltas (either may be None)"""
+    if a is None or b is None:
+        return a or b
+    return {
+        "uses": a["uses"] + b["uses"],
+        "last_used_at": max(a["last_used_at"], b["last_used_at"]),
+        "by_type": {kind: a["by_type"].get(kind, 0) + b["by_type"].get(kind, 0)
+                    for kind in {*a["by_type"], *b["by_type"]}}
+    }
+
+
+def merge_usage(record: dict, delta: dict) -> dict:
+    """Usage fields of `record` with a pending delta added"""
+    by_type = dict(record.get("usage_by_type") or {})
+    for kind, count in delta["by_type"].items():
+        by_type[kind] = by_type.get(kind, 0) + count
+    last_used_at = record.get("last_used_at")
+    return {
+        "usage_count": (record.get("usage_count") or 0) + delta["uses"],
+        "last_used_at": max(last_used_at, delta["last_used_at"]) if last_used_at else delta["last_used_at"],
+        "usage_by_type": by_type
+    }
+
+
+class UsageCounters:
+    """Per-code usage: uses, last use and counts per document type.
+
+    Handlers `record` uses in memory; a background task adds the pending
+    counts to the access code records every USAGE_FLUSH_INTERVAL_SECONDS in
+    one atomic mutation. The increments are computed under the store lock,
+    so counts from several workers add up instead of overwriting each other.
+    A failed flush keeps its counts pending; `stop` flushes what is left.
+    """
+
+    def __init__(self, store, interval: float = USAGE_FLUSH_INTERVAL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._pending = {}  # code id -> {"uses", "last_used_at", "by_type"}
+        self._inflight = {}  # counts being written by a flush
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task = None
+
+    def record(self, code_id: str, kind: str = VERIFICATION, when: Optional[datetime] = None):
+        """Count one use of a code (a verification, or access to a document type)"""
+        used_at = (when or datetime.now(timezone.utc)).isoformat()
+        with self._lock:
+            delta = self._pending.setdefault(code_id, {"uses": 0, "last_used_at": used_at, "by_type": {}})
+            delta["uses"] += 1
+            delta["last_used_at"] = max(delta["last_used_at"], used_at)
+            delta["by_type"][kind] = delta["by_type"].get(kind, 0) + 1
+
+    def live(self, record: dict) -> dict:
+        """Usage fields of a code record including the counts not flushed yet"""
+        with self._lock:
+            delta = add_deltas(self._inflight.get(record.get("id")), self._pending.get(record.get("id")))
+        if delta is None:
+            return {
+                "usage_count": record.get("usage_count") or 0,
+                "last_used_at": record.get("last_used_at"),
+                "usage_by_type": record.get("usage_by_type") or {}
+            }
+        return merge_usage(record, delta)
+
+    def flush_now(self) -> int:
+        """Write the pending counts (blocking), return the number of codes updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+            if not pending:
+                return 0
+
+            def increments(data):
+                records = {r["id"]: r for r in data.get("access_codes", []) if r.get("id") in pending}
+                return {code_id: merge_usage(records[code_id], delta)
+                        for code_id, delta in pending.items() if code_id in records}
+            try:
+                self.store.update_many("access_codes", increments)
+            except Exception:
+                # Keep the counts for the next flush
+                with self._lock:
+                    for code_id, delta in pending.items():
+                        self._pending[code_id] = add_deltas(delta, self._pending.get(code_id))
+                    self._inflight = {}
+                raise
+            with self._lock:
+                self._inflight = {}
+            return len(pending)
+
+    def start(self):
+        """Start the flush task (on the running event loop)"""
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_io(self.flush_now)
+            except Exception as e:
+                logger.error(f"Could not write access code usage, will retry: {e}")
+
+    async def stop(self):
+        """Stop the flush task and write what is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await run_io(self.flush_now)
+        except Exception as e:
+            logger.error(f"Access code usage lost at shutdown: {e}")
@@ -1,20 +1,41 @@
 # PDF Watermarking utilities
 import io
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
+from typing import BinaryIO, Optional
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import Color
 from reportlab.lib.utils import ImageReader
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+                            IndirectObject, NameObject, StreamObject)
+from pdf_overlay import PageTemplate, TextOverlay
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Parsed watermark overlays kept in memory (least recently used dropped first)
+WATERMARK_CACHE_SIZE = int(os.environ.get('WATERMARK_CACHE_SIZE', '256'))
+# The overlay's timestamp only changes once a minute, so repeated previews reuse it
+WATERMARK_TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M"
+# Original documents kept in memory, in MB of PDF (least recently used dropped first)
+DOCUMENT_CACHE_MB = float(os.environ.get('DOCUMENT_CACHE_MB', '64'))
+# Placeholder document bodies pre-rendered per parcelle (least recently used dropped first)
+PLACEHOLDER_TEMPLATE_CACHE_SIZE = int(os.environ.get('PLACEHOLDER_TEMPLATE_CACHE_SIZE', '128'))
+
+# Resource name of the watermark XObject on each page
+WATERMARK_XOBJECT_NAME = NameObject("/OgdWatermark")
+
+
 def create_watermark_pdf(
     client_name: str,
     access_code: str,
-    page_size: tuple = A4
+    page_size: tuple = A4,
+    timestamp: Optional[str] = None
 ) -> io.BytesIO:
     """Create a watermark PDF page with diagonal branding"""
     packet = io.BytesIO()
@@ -39,7 +60,7 @@ def create_watermark_pdf(
     
     # Code and timestamp - smaller
     c.setFont("Helvetica", 12)
-    timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
+    timestamp = timestamp or datetime.now().strftime(WATERMARK_TIMESTAMP_FORMAT)
     c.drawCentredString(0, -30, f"Code: {access_code} • {timestamp}")
     
     c.restoreState()
@@ -79,6 +100,266 @@ def create_watermark_pdf(
     return packet
 
 
+def watermark_form(packet) -> StreamObject:
+    """The watermark page turned into a Form XObject, owned by an in-memory writer.
+
+    Outputs clone it once and draw it on each page with a `Do` operator,
+    instead of copying its content into every page.
+    """
+    page = PdfReader(packet).pages[0]
+    writer = PdfWriter()
+    content = DecodedStreamObject()
+    content.set_data(page.get_contents().get_data())
+    form = content.flate_encode()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject(FloatObject(v) for v in page.mediabox),
+        NameObject("/Resources"): page["/Resources"].clone(writer),
+    })
+    return writer._add_object(form).get_object()
+
+
+class OverlayCache:
+    """LRU cache of watermark Form XObjects keyed by (client, code, page size, timestamp)"""
+
+    def __init__(self, max_entries: int = WATERMARK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, client_name: str, access_code: str, page_size: tuple):
+        """Return the overlay for the current minute, rendering it on a miss"""
+        timestamp = datetime.now().strftime(WATERMARK_TIMESTAMP_FORMAT)
+        key = (client_name, access_code, page_size, timestamp)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        packet = create_watermark_pdf(client_name, access_code, page_size, timestamp)
+        entry = watermark_form(packet)
+        with self._lock:
+            entry = self.entries.setdefault(key, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+overlay_cache = OverlayCache()
+
+
+# Page attributes a page takes from its parents in the page tree when it has none
+INHERITED_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def first_page_objects(reader: PdfReader, count: int) -> list:
+    """The first `count` pages of a reader, reading the page tree only as far as needed.
+
+    `reader.pages` reads every page object of the document before returning
+    any; this stops after `count` pages, with inherited attributes resolved
+    the same way.
+    """
+    pages = []
+    seen = set()
+    stack = [(reader.trailer["/Root"].get_object().raw_get("/Pages"), {})]
+    while stack and len(pages) < count:
+        reference, inherited = stack.pop()
+        if isinstance(reference, IndirectObject):
+            if reference.idnum in seen:
+                continue  # malformed tree
+            seen.add(reference.idnum)
+        node = reference.get_object()
+        if node.get("/Type", "/Pages") == "/Pages":
+            inherited = {**inherited, **{key: node[key] for key in INHERITED_PAGE_KEYS if key in node}}
+            stack.extend((kid, inherited) for kid in reversed(node["/Kids"]))
+        else:
+            page = PageObject(reader, reference if isinstance(reference, IndirectObject) else None)
+            page.update(node)
+            for key, value in inherited.items():
+                if key not in page:
+                    page[NameObject(key)] = value
+            pages.append(page)
+    return pages
+
+
+class CachedDocument:
+    """An original document read once: its bytes, and its pages parsed as far as first needed.
+
+    A reader parses lazily from its stream, so its pages cannot be read by
+    two threads at once. Pages are copied into an in-memory writer under a
+    lock; the copies are fully loaded and can be shared.
+    """
+
+    def __init__(self, path: str, version: tuple, content: bytes):
+        self.path = path
+        self.version = version  # (mtime_ns, size) of the file read
+        self.content = content
+        self._reader = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._reader is None:
+            self._reader = PdfReader(io.BytesIO(self.content))
+            self._writer = PdfWriter()
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages, from the page tree's root (no page is read)"""
+        with self._lock:
+            self._open()
+            count = self._reader.trailer["/Root"]["/Pages"].get("/Count")
+            return int(count) if count is not None else len(self._reader.pages)
+
+    def first_pages(self, count: Optional[int] = None) -> list:
+        """The first `count` pages (all of them if None), only those are read and copied"""
+        with self._lock:
+            self._open()
+            copied = len(self._writer.pages)
+            if count is None or count > copied:
+                source = self._reader.pages if count is None else first_page_objects(self._reader, count)
+                for page in list(source)[copied:count]:
+                    self._writer.add_page(page)
+            return list(self._writer.pages)[:count]
+
+    @property
+    def pages(self) -> list:
+        return self.first_pages()
+
+
+class DocumentCache:
+    """LRU cache of original documents keyed by path, checked against the file's mtime and size.
+
+    Bounded by the total size of the cached PDFs; a file larger than the
+    whole cache is read for each request.
+    """
+
+    def __init__(self, max_mb: float = DOCUMENT_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()  # path -> CachedDocument
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> CachedDocument:
+        """Return the document at `path`, reading it again if the file changed (blocking)"""
+        stat = path.stat()
+        key, version = str(path), (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        entry = CachedDocument(key, version, path.read_bytes())
+        if len(entry.content) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._drop(key)
+            self.entries[key] = entry
+            self.size += len(entry.content)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.content)
+
+
+document_cache = DocumentCache()
+
+
+def content_stream(pdf: PdfWriter, data: bytes) -> IndirectObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return pdf._add_object(stream)
+
+
+def stamp_page(page, form: IndirectObject, pdf: PdfWriter, draw_streams: dict):
+    """Draw `form` over a page of `pdf`: its content is wrapped in q/Q and followed by `Do`.
+
+    The page's own content streams are kept as they are (still compressed).
+    Its resources are copied first, as pages may share them.
+    """
+    resources = page.get("/Resources")
+    resources = DictionaryObject(resources.get_object() if resources is not None else {})
+    xobjects = resources.get("/XObject")
+    xobjects = DictionaryObject(xobjects.get_object() if xobjects is not None else {})
+    name = WATERMARK_XOBJECT_NAME
+    while name in xobjects:
+        name = NameObject(name + "_")
+    xobjects[name] = form
+    resources[NameObject("/XObject")] = xobjects
+    page[NameObject("/Resources")] = resources
+
+    contents = page.get("/Contents")
+    if contents is None:
+        contents = []
+    elif isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+        contents = list(contents.get_object())
+    elif isinstance(contents, ArrayObject):
+        contents = list(contents)
+    elif isinstance(contents, IndirectObject):
+        contents = [contents]
+    else:
+        contents = [pdf._add_object(contents)]
+
+    # The q and "Q <name> Do" streams are shared by every page of the output
+    if "q" not in draw_streams:
+        draw_streams["q"] = content_stream(pdf, b"q")
+    if name not in draw_streams:
+        draw_streams[name] = content_stream(pdf, b"Q " + name.encode() + b" Do")
+    page[NameObject("/Contents")] = ArrayObject([draw_streams["q"], *contents, draw_streams[name]])
+
+
+def watermark_pages(pages: list, client_name: str, access_code: str, output: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Watermarked PDF of `pages` (left unchanged), returned or written to the `output` file"""
+    output_pdf = PdfWriter()
+    forms = {}  # page size -> watermark XObject in this output
+    draw_streams = {}
+    
+    # Apply the watermark sized for each page (overlays are cached, embedded once per size)
+    for page in pages:
+        page_size = (float(page.mediabox.width), float(page.mediabox.height))
+        if page_size not in forms:
+            form = overlay_cache.get(client_name, access_code, page_size)
+            forms[page_size] = form.clone(output_pdf).indirect_reference
+        # The page is copied into the output, the copy is stamped
+        stamp_page(output_pdf.add_page(page), forms[page_size], output_pdf, draw_streams)
+    
+    if output is not None:
+        output_pdf.write(output)
+        return None
+    
+    # Write output
+    output_buffer = io.BytesIO()
+    output_pdf.write(output_buffer)
+    output_buffer.seek(0)
+    
+    return output_buffer.read()
+
+
 def add_watermark_to_pdf(
     pdf_content: bytes,
     client_name: str,
@@ -86,41 +367,58 @@ def add_watermark_to_pdf(
 ) -> bytes:
     """Add watermark to all pages of a PDF"""
     try:
-        # Create watermark
-        watermark_packet = create_watermark_pdf(client_name, access_code)
-        watermark_pdf = PdfReader(watermark_packet)
-        watermark_page = watermark_pdf.pages[0]
-        
         # Read original PDF
         original_pdf = PdfReader(io.BytesIO(pdf_content))
-        output_pdf = PdfWriter()
-        
-        # Apply watermark to each page
-        for page in original_pdf.pages:
-            page.merge_page(watermark_page)
-            output_pdf.add_page(page)
-        
-        # Write output
-        output_buffer = io.BytesIO()
-        output_pdf.write(output_buffer)
-        output_buffer.seek(0)
-        
-        return output_buffer.read()
+        return watermark_pages(original_pdf.pages, client_name, access_code)
     
     except Exception as e:
         logger.error(f"Error adding watermark: {e}")
         raise
 
 
-def create_placeholder_acd_pdf(
-    parcelle_nom: str,
-    parcelle_ref: str,
+def add_watermark_to_document(
+    document: CachedDocument,
     client_name: str,
-    access_code: str
-) -> bytes:
-    """Create a placeholder ACD document with watermark"""
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=A4)
+    access_code: str,
+    output: Optional[BinaryIO] = None,
+    max_pages: Optional[int] = None
+) -> Optional[bytes]:
+    """Add watermark to the pages of a cached original document (the first `max_pages` only, if given)"""
+    try:
+        return watermark_pages(document.first_pages(max_pages), client_name, access_code, output)
+    
+    except Exception as e:
+        logger.error(f"Error adding watermark: {e}")
+        raise
+
+
+def add_watermark_to_file(
+    path: str,
+    client_name: str,
+    access_code: str,
+    output_path: Optional[str] = None,
+    max_pages: Optional[int] = None
+) -> Optional[bytes]:
+    """Add watermark to an original document on disk (cached by the calling process).
+
+    With `output_path` the result is written straight to that file instead
+    of being returned, so it is never held in memory whole. With `max_pages`
+    only the first pages are parsed, watermarked and kept.
+    """
+    document = document_cache.get(Path(path))
+    if output_path is None:
+        return add_watermark_to_document(document, client_name, access_code, max_pages=max_pages)
+    with open(output_path, 'wb') as output:
+        add_watermark_to_document(document, client_name, access_code, output, max_pages)
+
+
+def count_pages(path: str) -> int:
+    """Number of pages of an original document on disk (cached by the calling process)"""
+    return document_cache.get(Path(path)).page_count
+
+
+def draw_placeholder_acd_body(c: canvas.Canvas, parcelle_nom: str, parcelle_ref: str):
+    """Static part of the placeholder ACD: everything but the client watermark and footer"""
     width, height = A4
     
     # Header background
@@ -173,42 +471,10 @@ def create_placeholder_acd_pdf(
     for line in content_lines:
         c.drawString(50, y_pos, line)
         y_pos -= 18
-    
-    # Main diagonal watermark overlay
-    c.setFillColor(Color(0.4, 0.4, 0.4, alpha=0.08))
-    c.saveState()
-    c.translate(width / 2, height / 2)
-    c.rotate(45)
-    c.setFont("Helvetica-Bold", 28)
-    c.drawCentredString(0, 30, f"Préparé pour {client_name}")
-    c.setFont("Helvetica", 16)
-    c.drawCentredString(0, -5, "Document sécurisé par onegreendev")
-    c.setFont("Helvetica", 11)
-    c.drawCentredString(0, -30, f"Code: {access_code}")
-    c.restoreState()
-    
-    # Footer
-    c.setFillColor(Color(0.5, 0.5, 0.5))
-    c.setFont("Helvetica", 8)
-    timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
-    c.drawCentredString(width / 2, 30, f"Document généré le {timestamp} - Code d'accès: {access_code}")
-    c.drawCentredString(width / 2, 18, "Document sécurisé par onegreendev - Reproduction interdite")
-    
-    c.save()
-    packet.seek(0)
-    return packet.read()
 
 
-def create_placeholder_plan_pdf(
-    parcelle_nom: str,
-    parcelle_ref: str,
-    superficie: float,
-    client_name: str,
-    access_code: str
-) -> bytes:
-    """Create a placeholder cadastral plan with watermark"""
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=A4)
+def draw_placeholder_plan_body(c: canvas.Canvas, parcelle_nom: str, parcelle_ref: str, superficie: float):
+    """Static part of the placeholder plan: everything but the client watermark and footer"""
     width, height = A4
     
     # Header
@@ -264,27 +530,114 @@ def create_placeholder_plan_pdf(
     c.setFont("Helvetica", 9)
     c.drawString(60, 130, f"Coordonnées: N 5°20' W 4°17'")
     c.drawString(60, 118, f"Échelle: 1/2000")
+
+
+PLACEHOLDER_BODIES = {
+    "acd": draw_placeholder_acd_body,
+    "plan": draw_placeholder_plan_body,
+}
+
+
+def create_placeholder_template(kind: str, *details) -> PageTemplate:
+    """Render the static body of a placeholder document once"""
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    PLACEHOLDER_BODIES[kind](c, *details)
+    c.save()
+    return PageTemplate(packet.getvalue())
+
+
+class PlaceholderTemplateCache:
+    """LRU cache of placeholder bodies keyed by (kind, parcelle details)"""
+
+    def __init__(self, max_entries: int = PLACEHOLDER_TEMPLATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, *details) -> PageTemplate:
+        """Return the template for these parcelle details, rendering it on a miss"""
+        key = (kind, *details)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        entry = create_placeholder_template(kind, *details)
+        with self._lock:
+            entry = self.entries.setdefault(key, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+placeholder_templates = PlaceholderTemplateCache()
+
+
+def create_placeholder_acd_pdf(
+    parcelle_nom: str,
+    parcelle_ref: str,
+    client_name: str,
+    access_code: str
+) -> bytes:
+    """Create a placeholder ACD document with watermark"""
+    template = placeholder_templates.get("acd", parcelle_nom, parcelle_ref)
+    width, height = template.page_size
+    overlay = TextOverlay()
+    
+    # Main diagonal watermark overlay
+    overlay.fill(0.4, 0.4, 0.4, alpha=0.08)
+    overlay.save()
+    overlay.translate_rotate(width / 2, height / 2, 45)
+    overlay.text(0, 30, f"Préparé pour {client_name}", "Helvetica-Bold", 28, align="centre")
+    overlay.text(0, -5, "Document sécurisé par onegreendev", "Helvetica", 16, align="centre")
+    overlay.text(0, -30, f"Code: {access_code}", "Helvetica", 11, align="centre")
+    overlay.restore()
+    
+    # Footer
+    overlay.fill(0.5, 0.5, 0.5)
+    timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
+    overlay.text(width / 2, 30, f"Document généré le {timestamp} - Code d'accès: {access_code}", "Helvetica", 8, align="centre")
+    overlay.text(width / 2, 18, "Document sécurisé par onegreendev - Reproduction interdite", "Helvetica", 8, align="centre")
+    
+    return template.stamp(overlay)
+
+
+def create_placeholder_plan_pdf(
+    parcelle_nom: str,
+    parcelle_ref: str,
+    superficie: float,
+    client_name: str,
+    access_code: str
+) -> bytes:
+    """Create a placeholder cadastral plan with watermark"""
+    template = placeholder_templates.get("plan", parcelle_nom, parcelle_ref, superficie)
+    width, height = template.page_size
+    overlay = TextOverlay()
     
     # Main diagonal watermark
-    c.setFillColor(Color(0.4, 0.4, 0.4, alpha=0.08))
-    c.saveState()
-    c.translate(width / 2, height / 2 + 50)
-    c.rotate(45)
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(0, 25, f"Préparé pour {client_name}")
-    c.setFont("Helvetica", 14)
-    c.drawCentredString(0, -5, "Document sécurisé par onegreendev")
-    c.setFont("Helvetica", 10)
-    c.drawCentredString(0, -25, f"Code: {access_code}")
-    c.restoreState()
+    overlay.fill(0.4, 0.4, 0.4, alpha=0.08)
+    overlay.save()
+    overlay.translate_rotate(width / 2, height / 2 + 50, 45)
+    overlay.text(0, 25, f"Préparé pour {client_name}", "Helvetica-Bold", 24, align="centre")
+    overlay.text(0, -5, "Document sécurisé par onegreendev", "Helvetica", 14, align="centre")
+    overlay.text(0, -25, f"Code: {access_code}", "Helvetica", 10, align="centre")
+    overlay.restore()
     
     # Footer
-    c.setFillColor(Color(0.5, 0.5, 0.5))
-    c.setFont("Helvetica", 8)
+    overlay.fill(0.5, 0.5, 0.5)
     timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
-    c.drawCentredString(width / 2, 40, f"Document généré le {timestamp} - Code: {access_code}")
-    c.drawCentredString(width / 2, 28, "Document sécurisé par onegreendev - Reproduction interdite")
+    overlay.text(width / 2, 40, f"Document généré le {timestamp} - Code: {access_code}", "Helvetica", 8, align="centre")
+    overlay.text(width / 2, 28, "Document sécurisé par onegreendev - Reproduction interdite", "Helvetica", 8, align="centre")
     
-    c.save()
-    packet.seek(0)
-    return packet.read()
+    return template.stamp(overlay)
@@ -334,8 +334,9 @@ const DocumentAccessSection = ({ parcelle, t, onParcelleChange }) => {
         // For PROPRIETAIRE, check if they have multiple parcelles
         if (response.data.profile_type === 'PROPRIETAIRE') {
           try {
-            const ownerResponse = await axios.post(`${API}/documents/get-owner-parcelles`,
-              new URLSearchParams({ code: accessCode.toUpperCase() })
+            // One call returns every parcelle the code opens, with its permissions
+            const ownerResponse = await axios.post(`${API}/documents/entitlements`,
+              new URLSearchParams({ code: accessCode.toUpperCase(), session: response.data.session_token })
             );
             
             if (ownerResponse.data.is_multi_parcelle) {
@@ -363,14 +364,18 @@ const DocumentAccessSection = ({ parcelle, t, onParcelleChange }) => {
     }
   };
 
+  // Code + viewer session issued by verify-profile (the code is the fallback once the session lapses)
+  const viewerParams = (extra = {}) => new URLSearchParams({
+    code: accessCode.toUpperCase(),
+    ...(profileInfo?.session_token ? { session: profileInfo.session_token } : {}),
+    ...extra
+  });
+
   const handleSurveillanceAccess = async () => {
     setLoadingVideo(true);
     try {
       const response = await axios.post(`${API}/surveillance/access`,
-        new URLSearchParams({
-          code: accessCode.toUpperCase(),
-          parcelle_id: parcelle.id
-        })
+        viewerParams({ parcelle_id: parcelle.id })
       );
       
       if (response.data.access_granted) {
@@ -394,8 +399,10 @@ const DocumentAccessSection = ({ parcelle, t, onParcelleChange }) => {
     if (!selectedDocument) return;
     
     try {
-      const url = `${API}/documents/${parcelle.id}/${selectedDocument.type}?code=${accessCode}&action=preview`;
-      toast.success('Document en cours de chargement...');
+      const url = `${API}/documents/${parcelle.id}/${selectedDocument.type}?${viewerParams({ action: 'preview' })}`;
+      toast.success('Document en cours de chargement...', profileInfo?.show_watermark ? {
+        description: "L'aperçu affiche les premières pages, le téléchargement contient le document complet"
+      } : undefined);
       
       // Open in new tab for preview
       window.open(url, '_blank');
@@ -408,7 +415,7 @@ const DocumentAccessSection = ({ parcelle, t, onParcelleChange }) => {
     if (!selectedDocument) return;
     
     try {
-      const url = `${API}/documents/${parcelle.id}/${selectedDocument.type}?code=${accessCode}&action=download`;
+      const url = `${API}/documents/${parcelle.id}/${selectedDocument.type}?${viewerParams({ action: 'download' })}`;
       
       // Create a link and trigger download
       const link = document.createElement('a');
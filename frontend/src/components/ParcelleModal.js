@@ -254,6 +254,13 @@ export const ParcelleModal = ({ parcelle, isOpen, onClose, onParcelleChange, par
     fetchDocuments();
   }, [parcelle?.id]);
 
+  // Code + viewer session issued by verify-profile (the code is the fallback once the session lapses)
+  const viewerParams = (extra = {}) => new URLSearchParams({
+    code: accessCode.toUpperCase(),
+    ...(profileInfo?.session_token ? { session: profileInfo.session_token } : {}),
+    ...extra
+  });
+
   // Fetch video URL for proprietaire
   useEffect(() => {
     const fetchVideoUrl = async () => {
@@ -261,10 +268,7 @@ export const ParcelleModal = ({ parcelle, isOpen, onClose, onParcelleChange, par
       setLoadingVideo(true);
       try {
         const response = await axios.post(`${API}/surveillance/access`,
-          new URLSearchParams({
-            code: accessCode,
-            parcelle_id: parcelle.id
-          })
+          viewerParams({ parcelle_id: parcelle.id })
         );
         if (response.data.video_url) {
           setVideoUrl(response.data.video_url);
@@ -314,8 +318,9 @@ export const ParcelleModal = ({ parcelle, isOpen, onClose, onParcelleChange, par
         // Check for multi-parcelle
         if (response.data.profile_type === 'PROPRIETAIRE') {
           try {
-            const ownerResponse = await axios.post(`${API}/documents/get-owner-parcelles`,
-              new URLSearchParams({ code: accessCode.toUpperCase() })
+            // One call returns every parcelle the code opens, with its permissions
+            const ownerResponse = await axios.post(`${API}/documents/entitlements`,
+              new URLSearchParams({ code: accessCode.toUpperCase(), session: response.data.session_token })
             );
             if (ownerResponse.data.is_multi_parcelle) {
               setOwnerParcelles(ownerResponse.data.parcelles);
@@ -378,7 +383,7 @@ export const ParcelleModal = ({ parcelle, isOpen, onClose, onParcelleChange, par
   const handleDownload = async (docType) => {
     try {
       const response = await axios.get(
-        `${API}/documents/${parcelle.id}/${docType}?code=${accessCode}`,
+        `${API}/documents/${parcelle.id}/${docType}?${viewerParams({ action: 'download' })}`,
         { responseType: 'blob' }
       );
       const url = window.URL.createObjectURL(new Blob([response.data]));
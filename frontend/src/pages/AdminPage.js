@@ -41,6 +41,8 @@ import * as XLSX from 'xlsx';
 import { saveAs } from 'file-saver';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+// Download log entries fetched per page (the server caps a page at 1000)
+const LOGS_PAGE_SIZE = 100;
 
 // Modern Stat Card Component
 const ModernStatCard = ({ icon: Icon, label, value, trend, trendValue, color, delay = 0 }) => (
@@ -1032,7 +1034,7 @@ const ParcelleEditDialog = ({ parcelle, onClose, onSave, getAuthHeaders }) => {
 // Access Codes Tab with Profile Types
 const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
   const [codes, setCodes] = useState([]);
-  const [logs, setLogs] = useState([]);
+  const [logStats, setLogStats] = useState({ total_downloads: 0, by_code: {} });
   const [loading, setLoading] = useState(true);
   const [showCreateDialog, setShowCreateDialog] = useState(false);
   const [selectedCodeDetails, setSelectedCodeDetails] = useState(null);
@@ -1049,12 +1051,12 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
 
   const fetchData = async () => {
     try {
-      const [codesRes, logsRes] = await Promise.all([
+      const [codesRes, statsRes] = await Promise.all([
         axios.get(`${API}/admin/access-codes`, { headers: getAuthHeaders() }),
-        axios.get(`${API}/admin/download-logs`, { headers: getAuthHeaders() })
+        axios.get(`${API}/admin/download-logs/stats`, { headers: getAuthHeaders() })
       ]);
       setCodes(codesRes.data.access_codes || []);
-      setLogs(logsRes.data.logs || []);
+      setLogStats(statsRes.data);
     } catch (error) {
       console.error('Failed to fetch data:', error);
     }
@@ -1064,13 +1066,25 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
   useEffect(() => { fetchData(); }, []);
 
   // Get documents consulted by a specific code
-  const getCodeUsage = (code) => {
-    const codeLogs = logs.filter(l => l.code === code);
-    return {
-      count: codeLogs.length,
-      documents: [...new Set(codeLogs.map(l => l.document_type))],
-      lastAccess: codeLogs.length > 0 ? codeLogs[codeLogs.length - 1].timestamp : null
-    };
+  // Access counts come from the log counters maintained by the backend, not from the entries
+  const getCodeUsage = (code) => ({
+    count: logStats.by_code?.[code.code] || 0,
+    documents: Object.keys(code.usage_by_type || {}).filter(t => t !== 'verification'),
+    lastAccess: code.last_used_at || null
+  });
+
+  // Entries of one code, fetched when its details are opened
+  const showCodeDetails = async (code) => {
+    setSelectedCodeDetails({ code: code.code, client: code.client_name, logs: null });
+    try {
+      const response = await axios.get(`${API}/admin/download-logs`, {
+        headers: getAuthHeaders(),
+        params: { code: code.code, limit: LOGS_PAGE_SIZE }
+      });
+      setSelectedCodeDetails(details => details?.code === code.code ? { ...details, logs: response.data.logs || [] } : details);
+    } catch (error) {
+      toast.error('Erreur lors du chargement');
+    }
   };
 
   const handleCreateCode = async () => {
@@ -1156,7 +1170,7 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
         <ModernStatCard icon={Key} label="Total codes" value={codes.length} color="bg-gradient-to-br from-blue-500 to-blue-600" />
         <ModernStatCard icon={Users} label="Prospects" value={codes.filter(c => c.profile_type === 'PROSPECT' && c.active).length} color="bg-gradient-to-br from-amber-500 to-amber-600" />
         <ModernStatCard icon={CheckCircle} label="Propriétaires" value={codes.filter(c => c.profile_type === 'PROPRIETAIRE' && c.active).length} color="bg-gradient-to-br from-green-500 to-green-600" />
-        <ModernStatCard icon={Download} label="Documents consultés" value={logs.length} color="bg-gradient-to-br from-purple-500 to-purple-600" />
+        <ModernStatCard icon={Download} label="Documents consultés" value={logStats.total_downloads} color="bg-gradient-to-br from-purple-500 to-purple-600" />
         <ModernStatCard icon={AlertCircle} label="Expirés/Révoqués" value={codes.filter(c => !c.active || c.is_expired).length} color="bg-gradient-to-br from-red-500 to-red-600" />
       </div>
 
@@ -1183,7 +1197,7 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
                 <tr><td colSpan={8} className="text-center py-8 text-gray-500">Aucun code d'accès</td></tr>
               ) : (
                 codes.map((code) => {
-                  const usage = getCodeUsage(code.code);
+                  const usage = getCodeUsage(code);
                   const profileType = code.profile_type || 'PROSPECT';
                   return (
                     <tr key={code.id} className="hover:bg-white/5 transition-colors">
@@ -1224,7 +1238,7 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
                       <td className="p-4">
                         {usage.count > 0 ? (
                           <button 
-                            onClick={() => setSelectedCodeDetails({ code: code.code, client: code.client_name, logs: logs.filter(l => l.code === code.code) })}
+                            onClick={() => showCodeDetails(code)}
                             className="flex items-center gap-2 text-purple-400 hover:text-purple-300"
                           >
                             <Download className="w-4 h-4" />
@@ -1242,7 +1256,7 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
                         )}
                       </td>
                       <td className="p-4">
-                        {!code.active ? (
+                        {!code.active && code.deactivated_reason !== 'expired' ? (
                           <Badge className="bg-red-500/20 text-red-400 border border-red-500/30">Révoqué</Badge>
                         ) : code.is_expired ? (
                           <Badge className="bg-gray-500/20 text-gray-400 border border-gray-500/30">Expiré</Badge>
@@ -1282,6 +1296,9 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
           </DialogHeader>
           
           <div className="max-h-64 overflow-y-auto space-y-2 py-4">
+            {selectedCodeDetails && !selectedCodeDetails.logs && (
+              <div className="text-center py-4 text-gray-500">Chargement...</div>
+            )}
             {selectedCodeDetails?.logs?.map((log, index) => (
               <div key={index} className="flex items-center justify-between p-3 bg-white/5 rounded-lg">
                 <div className="flex items-center gap-3">
@@ -1492,6 +1509,8 @@ const AccessCodesTab = ({ getAuthHeaders, parcelles }) => {
 // Download Logs Tab - Enhanced with Real-time Journal
 const DownloadLogsTab = ({ getAuthHeaders, onNotificationRead }) => {
   const [logs, setLogs] = useState([]);
+  const [hasMoreLogs, setHasMoreLogs] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [realtimeLogs, setRealtimeLogs] = useState([]);
   const [stats, setStats] = useState({ total_downloads: 0, by_client: {}, by_parcelle: {} });
   const [loading, setLoading] = useState(true);
@@ -1499,11 +1518,12 @@ const DownloadLogsTab = ({ getAuthHeaders, onNotificationRead }) => {
   const fetchData = useCallback(async () => {
     try {
       const [logsRes, statsRes, realtimeRes] = await Promise.all([
-        axios.get(`${API}/admin/download-logs`, { headers: getAuthHeaders() }),
+        axios.get(`${API}/admin/download-logs`, { headers: getAuthHeaders(), params: { limit: LOGS_PAGE_SIZE } }),
         axios.get(`${API}/admin/download-logs/stats`, { headers: getAuthHeaders() }),
         axios.get(`${API}/admin/access-logs/realtime?limit=20`, { headers: getAuthHeaders() })
       ]);
       setLogs(logsRes.data.logs || []);
+      setHasMoreLogs(!!logsRes.data.has_more);
       setStats(statsRes.data);
       setRealtimeLogs(realtimeRes.data.logs || []);
       // Clear notification count when viewing logs
@@ -1521,6 +1541,26 @@ const DownloadLogsTab = ({ getAuthHeaders, onNotificationRead }) => {
     return () => clearInterval(interval);
   }, [fetchData]);
 
+  // Older entries, one page at a time
+  const loadMoreLogs = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${API}/admin/download-logs`, {
+        headers: getAuthHeaders(),
+        params: { limit: LOGS_PAGE_SIZE, offset: logs.length }
+      });
+      // Entries logged since the first page shift the offsets: skip those already listed
+      setLogs(prev => {
+        const listed = new Set(prev.map(log => log.id));
+        return [...prev, ...(response.data.logs || []).filter(log => !listed.has(log.id))];
+      });
+      setHasMoreLogs(!!response.data.has_more);
+    } catch (error) {
+      toast.error('Erreur lors du chargement');
+    }
+    setLoadingMore(false);
+  };
+
   return (
     <div className="space-y-6">
       <motion.div initial={{ opacity: 0, x: -20 }} animate={{ opacity: 1, x: 0 }}>
@@ -1658,6 +1698,13 @@ const DownloadLogsTab = ({ getAuthHeaders, onNotificationRead }) => {
             </tbody>
           </table>
         </div>
+        {hasMoreLogs && (
+          <div className="p-4 border-t border-white/10 text-center">
+            <Button variant="ghost" size="sm" onClick={loadMoreLogs} disabled={loadingMore} className="text-gray-400 hover:text-white">
+              {loadingMore ? 'Chargement...' : 'Charger plus'}
+            </Button>
+          </div>
+        )}
       </motion.div>
 
       {/* Top Clients */}